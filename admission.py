@@ -0,0 +1,174 @@
+# admission.py
+# 准入控制与背压 (Admission Control & Backpressure)
+#
+# 限制同时在途的上游 LLM 调用数量，超出部分进入有界等待队列；
+# 队列已满或排队超时时快速拒绝（429/503 + Retry-After），
+# 避免流量高峰时打满服务商限流、所有请求一起超时。
+# 截止时间到了被放弃的上游请求仍在执行，槽位要等它们真正结束才归还（见 AdmissionSlot.hold）。
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+# 优先级：数值越小越先获得执行槽位
+PRIORITY_HIGH = 0     # 确认/取消等轮次（用户正在等待一个待确认操作的结果）
+PRIORITY_NORMAL = 1   # 普通对话轮次
+
+
+class AdmissionRejected(Exception):
+    """准入被拒绝（系统饱和），携带建议的 HTTP 状态码和重试等待秒数"""
+
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionSlot:
+    """slot() 产出的槽位句柄"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.settled = None
+
+    def hold(self):
+        """
+        延迟归还槽位：返回一个回调（可在任意线程调用、可重复调用），
+        槽位在离开 async with 且回调被调用之后才归还
+        """
+        if self.settled is None:
+            self.settled = self._loop.create_future()
+        settled = self.settled
+
+        def settle():
+            self._loop.call_soon_threadsafe(_resolve, settled)
+
+        return settle
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """
+    全局并发限制器：最多 max_concurrency 个请求同时执行，
+    最多 max_queue 个请求排队等待，排队超过 queue_timeout 秒即放弃。
+
+    高优先级请求不受队列长度限制，并总是排在普通请求之前被唤醒。
+    只能在同一个事件循环中使用。
+    """
+
+    def __init__(self, max_concurrency=8, max_queue=32, queue_timeout=5.0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+
+        self._in_flight = 0
+        self._waiters = []  # 堆：(priority, seq, future)
+        self._seq = itertools.count()
+
+        # 平均服务时间（指数滑动平均），用于估算 Retry-After
+        self._avg_service_time = 1.0
+
+        # 统计信息
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    # ------------------------------------------------------------
+    # 槽位获取/释放
+    # ------------------------------------------------------------
+    def _queue_length(self):
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _retry_after(self):
+        """根据排队长度和平均服务时间估算客户端应等待的秒数（至少 1 秒）"""
+        backlog = self._queue_length() + self._in_flight
+        estimate = backlog * self._avg_service_time / self.max_concurrency
+        return max(1, int(math.ceil(estimate)))
+
+    async def acquire(self, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        获取一个执行槽位，饱和时抛出 AdmissionRejected
+
+        Args:
+            priority: PRIORITY_HIGH / PRIORITY_NORMAL
+            timeout: 本次最多排队的秒数（例如请求剩余的时间预算），不超过 queue_timeout
+        """
+        if self._in_flight < self.max_concurrency and not self._queue_length():
+            self._in_flight += 1
+            self.admitted += 1
+            return
+
+        if priority != PRIORITY_HIGH and self._queue_length() >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, self._retry_after(), "等待队列已满")
+
+        wait_timeout = self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout))
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            # shield：超时时不取消 future 本身，以便区分"已被分配槽位"的竞态
+            await asyncio.wait_for(asyncio.shield(future), timeout=wait_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时恰好被分配了槽位，直接使用
+                self.admitted += 1
+                return
+            future.cancel()
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, self._retry_after(), "排队等待超时")
+        except asyncio.CancelledError:
+            # 客户端断开等情况：若槽位已转交给本请求，需要归还
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        self.admitted += 1
+
+    def release(self, service_time=None):
+        """归还槽位；若有等待者，直接把槽位转交给优先级最高的等待者"""
+        if service_time is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)  # 槽位转交，_in_flight 保持不变
+                return
+        self._in_flight = max(0, self._in_flight - 1)
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_NORMAL, timeout=None):
+        """async with controller.slot(priority) as slot: ..."""
+        await self.acquire(priority, timeout)
+        start = time.monotonic()
+        slot = AdmissionSlot(asyncio.get_running_loop())
+        try:
+            yield slot
+        finally:
+            if slot.settled is None or slot.settled.done():
+                self.release(time.monotonic() - start)
+            else:
+                # 上游请求仍在执行，结束后再归还
+                slot.settled.add_done_callback(lambda _: self.release(time.monotonic() - start))
+
+    def stats(self):
+        """返回当前并发/排队/拒绝统计"""
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queue_length(),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_service_time": round(self._avg_service_time, 3),
+        }
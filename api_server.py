@@ -3,7 +3,15 @@
 # 将现有的Python逻辑封装为RESTful API
 
 import os
-from fastapi import FastAPI, HTTPException
+import sys
+import time
+import json
+import logging
+import base64
+import asyncio
+import tempfile
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
@@ -11,7 +19,33 @@ import uuid
 from datetime import datetime
 
 from smart_clip_llm import SmartClipLLM
-from document_manager import DocumentManager
+from document_manager import DocumentManager, preload_documents, list_document_titles
+from intent_handlers import dispatch, execute_pending_action, cancel_pending_action, handler_timing_stats
+from keyword_matcher import control_matcher
+from admission import AdmissionController, AdmissionRejected, PRIORITY_HIGH, PRIORITY_NORMAL
+from compression import CompressionMiddleware
+from llm_client import llm_client
+from intent_recognizer import llm_circuit_breaker
+from fast_json import FastJSONResponse
+from chat_recorder import ChatRecorder, build_entry
+from memory_accounting import MemorySampler, memory_report
+from doc_watcher import stop_watchers
+from duplicate_index import flush_duplicate_indexes
+from search_index import flush_search_indexes
+from state_snapshot import StateSnapshotter, capture_session, capture_documents, read_snapshot
+from doc_io import run_io, shutdown_io_executor
+from prefetch import SpeculativePrefetcher
+from doc_transfer import (import_documents, export_documents, IMPORT_FORMATS, EXPORT_FORMATS, IMPORT_MODES,
+                          EXPORT_MEDIA_TYPES, TRANSFER_ERRORS)
+from config import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT, CHAT_DEADLINE_SECONDS
+from config import LLM_PREWARM, report_config
+from config import CHAT_RECORD_ENABLED, CHAT_RECORD_PATH, CHAT_RECORD_MAX_BYTES, CHAT_RECORD_BACKUPS
+from config import MEMORY_SAMPLE_INTERVAL_SECONDS, MEMORY_TOP_SESSIONS
+from config import SNAPSHOT_ENABLED, SNAPSHOT_PATH, SNAPSHOT_INTERVAL_SECONDS
+from config import PREFETCH_ENABLED, PREFETCH_MAX_PER_MINUTE
+from config import (COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL,
+                    COMPRESSION_BROTLI_QUALITY, FAST_JSON_ENABLED)
+from config import TRANSFER_BLOCK_BYTES, IMPORT_MAX_BYTES
 
 # ============================================
 # FastAPI 应用初始化
@@ -33,6 +67,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============================================
+# 响应压缩（DISPLAY_DOC、文档分页等大响应）
+# ============================================
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=COMPRESSION_GZIP_LEVEL,
+        brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    )
+
 # ============================================
 # 会话管理器
 # ============================================
@@ -42,6 +87,12 @@ class SessionManager:
     """
     def __init__(self):
         self.sessions: Dict[str, SmartClipLLM] = {}
+        # 每个会话一把锁：LLM 调用移到线程池后，同一会话的并发请求需要串行处理
+        self.locks: Dict[str, asyncio.Lock] = {}
+        # 没有会话时读取文档使用的共享实例（按需创建）
+        self._default_doc_manager: Optional[DocumentManager] = None
+        # 处理请求的事件循环（启动时设置），后台线程写状态快照时要在这个循环里获取会话锁
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
     
     def get_or_create_session(self, session_id: Optional[str] = None) -> tuple[str, SmartClipLLM]:
         """
@@ -61,6 +112,29 @@ class SessionManager:
         self.sessions[new_session_id] = SmartClipLLM()
         return new_session_id, self.sessions[new_session_id]
     
+    def get_lock(self, session_id: str) -> asyncio.Lock:
+        """获取会话对应的锁"""
+        if session_id not in self.locks:
+            self.locks[session_id] = asyncio.Lock()
+        return self.locks[session_id]
+    
+    def get_doc_manager(self, session_id: Optional[str] = None) -> DocumentManager:
+        """
+        获取用于读取文档的 DocumentManager
+        
+        有会话时使用该会话的实例（能看到会话内尚未被其他实例加载的修改），
+        否则使用一个共享的只读实例。
+        """
+        if session_id and session_id in self.sessions:
+            return self.sessions[session_id].doc_manager
+        if self._default_doc_manager is None:
+            self._default_doc_manager = DocumentManager()
+        return self._default_doc_manager
+    
+    async def aget_doc_manager(self, session_id: Optional[str] = None) -> DocumentManager:
+        """get_doc_manager 的异步版本：第一次创建实例时要加载全部文档，放到文档 I/O 线程池中进行"""
+        return await run_io(self.get_doc_manager, session_id)
+    
     def get_documents(self, session_id: str) -> list[str]:
         """
         获取指定会话的文档列表
@@ -75,11 +149,95 @@ class SessionManager:
             return []
         
         app_instance = self.sessions[session_id]
-        return list(app_instance.doc_manager.documents.keys())
+        return app_instance.doc_manager.get_document_titles()
+    
+    def memory_report(self, top_n: int = MEMORY_TOP_SESSIONS) -> Dict[str, Any]:
+        """估算各会话的内存占用（按组件拆分）及进程 RSS"""
+        return memory_report(self.sessions, top_n, self._default_doc_manager)
+    
+    def doc_managers(self) -> list[DocumentManager]:
+        """已经创建的 DocumentManager（会话组件是延迟创建的，不会因此创建新的实例）"""
+        managers = [instance.__dict__["doc_manager"] for instance in list(self.sessions.values())
+                    if "doc_manager" in instance.__dict__]
+        if self._default_doc_manager is not None:
+            managers.append(self._default_doc_manager)
+        return managers
+    
+    def snapshot_state(self) -> Dict[str, Any]:
+        """
+        取出所有会话的状态和文档副本，供写状态快照（在后台线程中调用）
+        
+        每个会话的状态在持有该会话的锁时复制，不会取到请求处理到一半的对话历史或文档内容；
+        事件循环没有运行时（启动前、退出后）没有并发的请求，直接复制。
+        """
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            return self._capture_state()
+        return asyncio.run_coroutine_threadsafe(self._capture_state_locked(), loop).result()
+    
+    def _capture_state(self) -> Dict[str, Any]:
+        documents: Dict[str, Any] = {}
+        for doc_manager in self.doc_managers():
+            capture_documents(doc_manager, documents)
+        sessions = {session_id: capture_session(instance) for session_id, instance in list(self.sessions.items())}
+        return {"sessions": sessions, "documents": documents}
+    
+    async def _capture_state_locked(self) -> Dict[str, Any]:
+        documents: Dict[str, Any] = {}
+        sessions: Dict[str, Any] = {}
+        for session_id, instance in list(self.sessions.items()):
+            async with self.get_lock(session_id):
+                sessions[session_id] = capture_session(instance)
+                if "doc_manager" in instance.__dict__:
+                    # 检查文件指纹要访问磁盘，放到线程中进行（仍持有会话锁）
+                    await asyncio.to_thread(capture_documents, instance.__dict__["doc_manager"], documents)
+        if self._default_doc_manager is not None:
+            # 共享的只读实例不会原地修改文档，提交锁足以保证一致
+            await asyncio.to_thread(capture_documents, self._default_doc_manager, documents)
+        return {"sessions": sessions, "documents": documents}
+    
+    def restore_state(self, state: Dict[str, Any]) -> int:
+        """
+        从状态快照恢复会话，并登记文档预热副本
+        
+        Returns:
+            恢复的会话数
+        """
+        for directory, files in (state.get("documents") or {}).items():
+            preload_documents(directory, files)
+        restored = 0
+        for session_id, session_state in (state.get("sessions") or {}).items():
+            if session_id in self.sessions:
+                continue
+            instance = SmartClipLLM()
+            instance.pending_action = session_state.get("pending_action")
+            if session_state.get("conversation"):
+                # 第一次用到意图识别器时才装回对话历史（见 SmartClipLLM.intent_recognizer）
+                instance.restored_conversation = session_state["conversation"]
+            self.sessions[session_id] = instance
+            restored += 1
+        return restored
 
 # 全局会话管理器实例
 session_manager = SessionManager()
 
+# 会话内存占用的后台采样（启动时开始）
+memory_sampler = MemorySampler(session_manager.memory_report, MEMORY_SAMPLE_INTERVAL_SECONDS)
+
+# 会话状态快照（启动时恢复，之后周期性写入，退出时再写一次）
+state_snapshotter = (StateSnapshotter(SNAPSHOT_PATH, session_manager.snapshot_state, SNAPSHOT_INTERVAL_SECONDS)
+                     if SNAPSHOT_ENABLED else None)
+
+# 输入过程中的预取（PREFETCH_ENABLED=true 时启用）
+prefetcher = SpeculativePrefetcher(PREFETCH_MAX_PER_MINUTE) if PREFETCH_ENABLED else None
+
+# 全局 LLM 准入控制器（所有会话共享同一个上游配额）
+admission_controller = AdmissionController(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue=LLM_MAX_QUEUE,
+    queue_timeout=LLM_QUEUE_TIMEOUT
+)
+
 # ============================================
 # 请求/响应模型
 # ============================================
@@ -95,10 +253,41 @@ class ChatResponse(BaseModel):
     content: str
     new_session_id: Optional[str] = None
 
+class PrefetchResponse(BaseModel):
+    """预取响应模型"""
+    status: str  # "done" | "cached" | "cancelled" | "busy" | "throttled"
+    intent: Optional[str] = None
+    doc_title: Optional[str] = None
+    warmed: list[str] = []
+
 class DocumentsResponse(BaseModel):
     """文档列表响应模型"""
     documents: list[str]
 
+class SearchHit(BaseModel):
+    """检索命中的一行"""
+    title: str
+    line_number: int  # 从 1 开始
+    line: str
+    score: float
+
+class SearchResponse(BaseModel):
+    """全文检索响应模型"""
+    query: str
+    results: list[SearchHit]
+    elapsed_ms: float
+
+class DocumentPageResponse(BaseModel):
+    """文档分页内容响应模型"""
+    title: str
+    offset: int
+    total_lines: int
+    lines: list[str]
+    next_cursor: Optional[str] = None  # 为 None 表示已经读到末尾
+
+# 聊天录制器（CHAT_RECORD_ENABLED=true 时启用），录制文件可用 replay.py 回放
+chat_recorder = ChatRecorder(CHAT_RECORD_PATH, CHAT_RECORD_MAX_BYTES, CHAT_RECORD_BACKUPS) if CHAT_RECORD_ENABLED else None
+
 # ============================================
 # API 路由
 # ============================================
@@ -112,18 +301,42 @@ async def root():
         "status": "running",
         "endpoints": {
             "chat": "/api/chat",
-            "documents": "/api/documents"
+            "chat_prefetch": "/api/chat/prefetch",
+            "documents": "/api/documents",
+            "document_page": "/api/documents/{title}",
+            "document_text": "/api/documents/{title}/text",
+            "search": "/api/search",
+            "import": "/api/import",
+            "export": "/api/export",
+            "llm_stats": "/api/admin/llm",
+            "memory_stats": "/api/admin/memory",
+            "snapshot": "/api/admin/snapshot"
         }
     }
 
+def _json_response(model: BaseModel):
+    """启用快速 JSON 时直接序列化响应模型，否则交给 FastAPI 按 response_model 处理"""
+    return FastJSONResponse(model) if FAST_JSON_ENABLED else model
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, x_request_timeout: Optional[float] = Header(None)):
     """
     处理用户聊天消息
     
     这个接口接收用户的文本输入，通过SmartClipLLM处理，
     返回AI的回复或需要确认的操作。
+    
+    客户端可以通过 X-Request-Timeout 请求头（秒）缩短本次请求的时间预算，
+    预算耗尽时 LLM 调用会被放弃并走降级逻辑，而不是一直等待。
     """
+    # 本次请求的截止时间：排队和 LLM 调用共用同一个预算
+    budget = CHAT_DEADLINE_SECONDS
+    if x_request_timeout and x_request_timeout > 0:
+        budget = min(budget, x_request_timeout)
+    started = time.monotonic()
+    deadline = started + budget
+    session_id = request.session_id
+    app_instance = None
     try:
         # 获取或创建会话
         session_id, app_instance = session_manager.get_or_create_session(request.session_id)
@@ -133,221 +346,125 @@ async def chat(request: ChatRequest):
         if not user_input:
             raise HTTPException(status_code=400, detail="输入不能为空")
         
-        # 【优化】优先处理"确认"/"取消"命令，避免调用LLM导致识别错误
-        # 如果存在待确认的操作，优先检查是否是明确的确认/取消命令
-        if app_instance.pending_action:
-            user_input_lower = user_input.lower().strip()
-            # 检查是否是明确的确认命令
-            if user_input_lower in ['确认', 'confirm', 'yes', 'y', '是', '好的', '好']:
-                # 直接处理确认操作，不调用LLM
-                action = app_instance.pending_action
-                if action["intent"] == "DELETE_CONTENT":
-                    app_instance.doc_manager.clear_document(action["title"])
-                    app_instance.pending_action = None
-                    return ChatResponse(
-                        response_type="TEXT",
-                        content=f"✅ 已成功清空文档 '{action['title']}' 的所有内容。",
-                        new_session_id=session_id if not request.session_id else None
-                    )
-            # 检查是否是明确的取消命令
-            elif user_input_lower in ['取消', 'cancel', 'no', 'n', '否', '不']:
-                action = app_instance.pending_action
-                app_instance.pending_action = None
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=f"❌ 已取消清空文档 '{action['title']}' 的操作。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        # 调用SmartClipLLM的意图识别和处理逻辑
-        # 我们需要模拟run()方法中的处理流程，但不使用input()，而是直接处理
-        intent_data = app_instance.intent_recognizer.recognize(user_input)
-        
-        # 检查是否需要确认
-        confirmation_needed = intent_data.get("confirmation_needed", False)
-        intent = intent_data.get("intent")
-        
-        # 处理不同类型的意图
-        if intent == "CONFIRM":
-            # 用户确认操作
-            if app_instance.pending_action:
-                # 执行待确认的操作
-                action = app_instance.pending_action
-                if action["intent"] == "DELETE_CONTENT":
-                    app_instance.doc_manager.clear_document(action["title"])
-                    app_instance.pending_action = None
-                    return ChatResponse(
-                        response_type="TEXT",
-                        content=f"已成功清空文档 '{action['title']}' 的所有内容。",
-                        new_session_id=session_id if not request.session_id else None
-                    )
-            else:
-                return ChatResponse(
-                    response_type="TEXT",
-                    content="没有待确认的操作。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        elif intent == "CANCEL":
-            # 用户取消操作
-            if app_instance.pending_action:
-                action = app_instance.pending_action
-                app_instance.pending_action = None
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=f"已取消清空文档 '{action['title']}' 的操作。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-            else:
-                return ChatResponse(
-                    response_type="TEXT",
-                    content="没有待确认的操作。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        elif intent == "DELETE_CONTENT" and confirmation_needed:
-            # 需要确认的删除操作
-            doc_title = intent_data.get("doc_title") or app_instance.doc_manager.active_doc_title
-            app_instance.pending_action = {
-                "intent": "DELETE_CONTENT",
-                "title": doc_title
-            }
-            return ChatResponse(
-                response_type="CONFIRMATION",
-                content=f"您确定要清空文档 '{doc_title}' 的所有内容吗？此操作不可恢复。",
-                new_session_id=session_id if not request.session_id else None
-            )
-        
-        elif intent == "DELETE_CONTENT":
-            # 直接删除（不需要确认的情况，理论上不应该发生，但保留作为兜底）
-            doc_title = intent_data.get("doc_title") or app_instance.doc_manager.active_doc_title
-            app_instance.doc_manager.clear_document(doc_title)
-            return ChatResponse(
-                response_type="TEXT",
-                content=f"已成功清空文档 '{doc_title}' 的所有内容。",
-                new_session_id=session_id if not request.session_id else None
-            )
-        
-        elif intent == "ADD_CONTENT":
-            # 添加内容
-            doc_title = intent_data.get("doc_title") or app_instance.doc_manager.active_doc_title
-            content = intent_data.get("content", "")
-            position = intent_data.get("position", "end")
-            
-            # 确保position不为None
-            if position is None:
-                position = "end"
-            
-            app_instance.doc_manager.add_content(doc_title, content, position)
-            return ChatResponse(
-                response_type="TEXT",
-                content=f"已成功将内容添加到文档 '{doc_title}' 的{('开头' if position.lower() == 'start' else '结尾')}。",
-                new_session_id=session_id if not request.session_id else None
-            )
-        
-        elif intent == "SET_ACTIVE":
-            # 切换文档
-            doc_title = intent_data.get("doc_title")
-            if doc_title:
-                app_instance.doc_manager.set_active_document(doc_title)
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=f"已切换到文档：{doc_title}",
-                    new_session_id=session_id if not request.session_id else None
-                )
-            else:
-                return ChatResponse(
-                    response_type="TEXT",
-                    content="未指定要切换的文档。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        elif intent == "DISPLAY_DOC":
-            # 显示文档内容
-            doc_title = intent_data.get("doc_title") or app_instance.doc_manager.active_doc_title
-            doc_content = app_instance.doc_manager.documents.get(doc_title)
-            if doc_content and len(doc_content) > 0:
-                # 将文档内容列表合并为字符串
-                content = '\n'.join(doc_content)
-                return ChatResponse(
-                    response_type="DOCUMENT",
-                    content=content,
-                    new_session_id=session_id if not request.session_id else None
-                )
-            else:
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=f"文档 '{doc_title}' 不存在或为空。",
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        elif intent == "HELP":
-            # 帮助信息
-            # 检查LLM是否生成了内容
-            content = intent_data.get("content")
-            if content and isinstance(content, str) and len(content.strip()) > 0:
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=content,
-                    new_session_id=session_id if not request.session_id else None
-                )
-            else:
-                help_text = """我能理解以下指令：
-1. 添加内容：'把[内容]加到[文档名]的[开头/结尾/某个段落之后]'
-   示例：'把今天的会议要点加到项目周报的结尾'
-2. 切换文档：'打开[文档名]'
-   示例：'打开学习笔记'
-3. 查看文档：'查看[文档名]'
-   示例：'显示项目周报'
-4. 删除/清空文档：'删除[文档名]所有内容' 或 '清空[文档名]'
-   示例：'删除默认文档所有内容'
-5. 重置对话：'重置对话' 或 '清空对话历史'
-   示例：'重置对话'（清空对话历史，重新开始）
-6. 退出：'退出'"""
-                return ChatResponse(
-                    response_type="TEXT",
-                    content=help_text,
-                    new_session_id=session_id if not request.session_id else None
-                )
-        
-        elif intent == "RESET_CONVERSATION" or intent == "CLEAR_CONVERSATION":
-            # 重置对话
-            app_instance.intent_recognizer.reset_conversation()
-            if app_instance.pending_action:
-                app_instance.pending_action = None
-            return ChatResponse(
-                response_type="TEXT",
-                content="对话历史已重置，可以重新开始对话了。",
-                new_session_id=session_id if not request.session_id else None
-            )
-        
-        elif intent == "EXIT":
-            # 退出（在API中，我们只返回消息，不实际退出）
-            return ChatResponse(
-                response_type="TEXT",
-                content="感谢您的使用，再见！",
-                new_session_id=session_id if not request.session_id else None
-            )
-        
-        else:
-            # 未知意图或UNKNOWN
-            return ChatResponse(
-                response_type="TEXT",
-                content=intent_data.get("content", "抱歉，我没有理解您的指令。请尝试使用更清晰的表达。"),
-                new_session_id=session_id if not request.session_id else None
-            )
+        if prefetcher is not None:
+            # 正式请求到了，输入过程中的预取不再需要
+            prefetcher.cancel(session_id)
+        async with session_manager.get_lock(session_id):
+            response = await _handle_chat(request, session_id, app_instance, user_input, deadline)
+        _record_chat(request, session_id, 200, started, response, app_instance)
+        return _json_response(response)
     
+    except HTTPException as e:
+        _record_chat(request, session_id, e.status_code, started)
+        raise
+    except AdmissionRejected as e:
+        # 系统饱和：快速失败，告诉客户端多久后重试
+        print(f"[准入控制] 拒绝请求 ({e.status_code}): {e.reason}")
+        _record_chat(request, session_id, e.status_code, started)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"服务繁忙（{e.reason}），请 {e.retry_after} 秒后重试。",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         # 捕获所有异常并返回友好的错误消息
         import traceback
         error_detail = str(e)
         print(f"[API错误] {error_detail}")
         print(traceback.format_exc())
+        _record_chat(request, session_id, 500, started)
         raise HTTPException(
             status_code=500,
             detail=f"处理请求时发生错误：{error_detail}"
         )
 
+@app.post("/api/chat/prefetch", response_model=PrefetchResponse)
+async def chat_prefetch(request: ChatRequest):
+    """
+    输入过程中的预取：前端在用户每次按键（建议加少量防抖）时发送当前的半句输入
+    
+    用本地规则猜测意图和目标文档（不调用 LLM），提前加载会话组件、文档上下文和目标文档，
+    正式的 /api/chat 到达时只剩 LLM 调用。同一会话新的预取会取消上一次，正式请求到达时也会取消预取。
+    只为已有的会话预取（不会为按键创建新会话）：没有 session_id 时返回 400，会话不存在时返回 404。
+    """
+    if prefetcher is None:
+        raise HTTPException(status_code=404, detail="未启用输入预取 (PREFETCH_ENABLED)")
+    session_id = request.session_id
+    if not session_id:
+        raise HTTPException(status_code=400, detail="预取需要已有会话的 session_id")
+    app_instance = session_manager.sessions.get(session_id)
+    if app_instance is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    text = request.text.strip()
+    if not text:
+        # 输入被清空：取消进行中的预取
+        prefetcher.cancel(session_id)
+        return PrefetchResponse(status="cancelled")
+    result = await prefetcher.prefetch(session_id, app_instance, session_manager.get_lock(session_id), text)
+    return PrefetchResponse(**result)
+
+def _record_chat(request: ChatRequest, session_id: Optional[str], status_code: int, started: float,
+                 response: Optional[ChatResponse] = None, app_instance: Optional[SmartClipLLM] = None):
+    """录制一轮对话（未启用录制时什么也不做）；写入在后台线程完成，不阻塞请求"""
+    if chat_recorder is None:
+        return
+    llm_call = app_instance.last_llm_call if app_instance is not None else None
+    chat_recorder.record(build_entry(session_id, request.text, status_code,
+                                     time.monotonic() - started, response, llm_call))
+
+async def _handle_chat(request: ChatRequest, session_id: str, app_instance: SmartClipLLM, user_input: str, deadline: float) -> ChatResponse:
+    """在持有会话锁的情况下处理一轮对话"""
+    app_instance.last_llm_call = None
+    # 【优化】优先处理"确认"/"取消"命令，避免调用LLM导致识别错误
+    # 如果存在待确认的操作，优先检查是否是明确的确认/取消命令
+    if app_instance.pending_action:
+        control = control_matcher.classify(user_input)
+        # 检查是否是明确的确认命令
+        if control == "CONFIRM":
+            # 直接处理确认操作，不调用LLM（文档读写在文档 I/O 线程池中进行）
+            result = await run_io(execute_pending_action, app_instance)
+            if app_instance.pending_action:
+                # 文档刚被其他会话修改，操作没有执行，仍在等待确认
+                return _make_response(request, session_id, "CONFIRMATION", result)
+            return _make_response(request, session_id, "TEXT", f"✅ {result}")
+        # 检查是否是明确的取消命令
+        elif control == "CANCEL":
+            return _make_response(request, session_id, "TEXT", f"❌ {cancel_pending_action(app_instance)}")
+    
+    # 撤销/重做是完整的一句话，直接执行，不调用LLM
+    control = control_matcher.classify(user_input)
+    if control in ("UNDO", "REDO"):
+        response_type, content = await run_io(dispatch, app_instance, {"intent": control})
+        return _make_response(request, session_id, response_type, content)
+    
+    # 调用SmartClipLLM的意图识别和处理逻辑
+    # 我们需要模拟run()方法中的处理流程，但不使用input()，而是直接处理
+    # LLM 调用经过全局准入控制，并放到线程池执行，避免阻塞事件循环；
+    # 存在待确认操作时（多半是确认/取消轮次）优先获得执行槽位
+    priority = PRIORITY_HIGH if app_instance.pending_action else PRIORITY_NORMAL
+    async with admission_controller.slot(priority, timeout=deadline - time.monotonic()) as slot:
+        # 截止时间到了被放弃的上游请求仍在执行时，槽位要等它们结束才归还；
+        # recognize 在每条路径上都会调用一次 settle（没有调用 LLM 时在返回前调用）
+        settle = slot.hold()
+        intent_data = await asyncio.to_thread(app_instance.intent_recognizer.recognize, user_input,
+                                              deadline, settle)
+    app_instance.last_llm_call = dict(app_instance.intent_recognizer.last_llm_call or {},
+                                      intent=intent_data.get("intent"))
+    
+    # 按意图查表分发到对应的处理函数（见 intent_handlers.py）；
+    # 处理函数会同步读写文档文件，放到文档 I/O 线程池中执行，不阻塞事件循环
+    response_type, content = await run_io(dispatch, app_instance, intent_data)
+    return _make_response(request, session_id, response_type, content)
+
+def _make_response(request: ChatRequest, session_id: str, response_type: str, content: str) -> ChatResponse:
+    """构造聊天响应；只有新建会话时才返回 new_session_id"""
+    return ChatResponse(
+        response_type=response_type,
+        content=content,
+        new_session_id=session_id if not request.session_id else None
+    )
+
+
 @app.get("/api/documents", response_model=DocumentsResponse)
 async def get_documents(session_id: Optional[str] = None):
     """
@@ -358,13 +475,12 @@ async def get_documents(session_id: Optional[str] = None):
     """
     try:
         if session_id:
-            documents = session_manager.get_documents(session_id)
+            documents = await run_io(session_manager.get_documents, session_id)
         else:
-            # 如果没有session_id，创建一个临时实例来获取文档列表
-            temp_manager = DocumentManager()
-            documents = list(temp_manager.documents.keys())
+            # 没有session_id时只列出目录中的文档文件，不为此加载文档
+            documents = await run_io(list_document_titles)
         
-        return DocumentsResponse(documents=documents)
+        return _json_response(DocumentsResponse(documents=documents))
     
     except Exception as e:
         import traceback
@@ -376,10 +492,278 @@ async def get_documents(session_id: Optional[str] = None):
             detail=f"获取文档列表时发生错误：{error_detail}"
         )
 
+# 分页参数
+DEFAULT_PAGE_LINES = 200
+MAX_PAGE_LINES = 2000
+# 流式输出时每次读取的行数
+STREAM_BATCH_LINES = 1000
+
+def _encode_cursor(title: str, offset: int) -> str:
+    """把下一页的位置编码为不透明的游标"""
+    raw = json.dumps({"t": title, "o": offset}, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(title: str, cursor: str) -> int:
+    """解析游标，返回起始行号；游标无效或不属于该文档时返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        if data.get("t") == title and isinstance(data.get("o"), int) and data["o"] >= 0:
+            return data["o"]
+    except Exception:
+        pass
+    raise HTTPException(status_code=400, detail="无效的分页游标")
+
+@app.get("/api/documents/{title}", response_model=DocumentPageResponse)
+async def get_document_page(
+    title: str,
+    session_id: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_LINES, ge=1, le=MAX_PAGE_LINES),
+    cursor: Optional[str] = None
+):
+    """
+    分页读取文档内容
+    
+    支持两种方式：offset/limit 直接指定范围，或使用上一页返回的 next_cursor 继续读取。
+    只读取请求的行范围，不会把整篇文档拼成一个字符串。
+    """
+    doc_manager = await session_manager.aget_doc_manager(session_id)
+    if cursor:
+        offset = _decode_cursor(title, cursor)
+    
+    total = await doc_manager.acount_lines(title)
+    if total is None:
+        raise HTTPException(status_code=404, detail=f"文档 '{title}' 不存在")
+    
+    lines = await doc_manager.aread_lines(title, offset, limit)
+    next_offset = offset + len(lines)
+    return DocumentPageResponse(
+        title=title,
+        offset=offset,
+        total_lines=total,
+        lines=lines,
+        next_cursor=_encode_cursor(title, next_offset) if next_offset < total else None
+    )
+
+@app.get("/api/documents/{title}/text")
+async def get_document_text(
+    title: str,
+    session_id: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    以纯文本流的方式输出文档内容（可选 offset/limit 行范围）
+    
+    按批读取并逐块发送，适合大文档下载。
+    """
+    doc_manager = await session_manager.aget_doc_manager(session_id)
+    total = await doc_manager.acount_lines(title)
+    if total is None:
+        raise HTTPException(status_code=404, detail=f"文档 '{title}' 不存在")
+    end = total if limit is None else min(total, offset + limit)
+    
+    def generate():
+        position = offset
+        while position < end:
+            batch = doc_manager.read_lines(title, position, min(STREAM_BATCH_LINES, end - position))
+            if not batch:
+                break
+            position += len(batch)
+            # 每批末尾补换行，最后一批除外，保证输出与文件内容一致
+            yield ("\n".join(batch) + ("\n" if position < end else "")).encode("utf-8")
+    
+    return StreamingResponse(generate(), media_type="text/plain; charset=utf-8")
+
+@app.get("/api/search", response_model=SearchResponse)
+async def search_documents(
+    q: str = Query(..., min_length=1),
+    session_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200)
+):
+    """
+    全文检索所有文档，返回按相关度排序的命中行
+    
+    中文按字符二元组建立倒排索引，无需分词。
+    """
+    doc_manager = await session_manager.aget_doc_manager(session_id)
+    start = time.perf_counter()
+    results = await doc_manager.asearch(q, limit)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return SearchResponse(query=q, results=results, elapsed_ms=round(elapsed_ms, 3))
+
+@app.post("/api/import")
+async def import_archive(
+    request: Request,
+    fmt: str = Query("auto", alias="format", description="auto / jsonl / tar / zip"),
+    mode: str = Query("replace", description="replace 覆盖同名文档 / append 追加到末尾")
+):
+    """
+    批量导入文档：请求体为 tar（可压缩）、zip 或 JSONL 归档，直接写入文档存储，不经过 LLM
+    
+    上传内容按 TRANSFER_BLOCK_BYTES 攒成块，在线程中写入临时文件（识别格式和 zip 都需要随机访问），
+    不在内存中累积，也不阻塞事件循环；超过 IMPORT_MAX_BYTES 时返回 413。
+    导入时每写完一个文档返回一行进度（application/x-ndjson），最后一行为汇总。
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导入格式: {fmt}")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的导入方式: {mode}")
+    too_large = HTTPException(status_code=413, detail=f"上传内容超过 {IMPORT_MAX_BYTES} 字节的上限 (IMPORT_MAX_BYTES)")
+    declared = request.headers.get("content-length", "")
+    if IMPORT_MAX_BYTES and declared.isdigit() and int(declared) > IMPORT_MAX_BYTES:
+        raise too_large
+    spool = await asyncio.to_thread(tempfile.TemporaryFile)
+    try:
+        received = 0
+        buffer = bytearray()
+        async for chunk in request.stream():
+            received += len(chunk)
+            if IMPORT_MAX_BYTES and received > IMPORT_MAX_BYTES:
+                # 没有 Content-Length（分块上传）或声明的长度不实
+                raise too_large
+            buffer += chunk
+            if len(buffer) >= TRANSFER_BLOCK_BYTES:
+                await asyncio.to_thread(spool.write, buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(spool.write, buffer)
+        await asyncio.to_thread(spool.seek, 0)
+    except BaseException:
+        spool.close()
+        raise
+    # 导入经过共享实例写入，各会话按文件变更重新加载
+    doc_manager = await session_manager.aget_doc_manager()
+    
+    def generate():
+        with spool:
+            try:
+                for event in import_documents(doc_manager, spool, fmt, mode):
+                    yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            except TRANSFER_ERRORS as e:
+                print(f"[API错误] 导入文档失败: {e}")
+                yield (json.dumps({"event": "error", "message": str(e)}, ensure_ascii=False) + "\n").encode("utf-8")
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/api/export")
+async def export_archive(
+    session_id: Optional[str] = None,
+    fmt: str = Query("zip", alias="format", description="zip / tar / tar.gz / jsonl")
+):
+    """
+    把所有文档导出为归档，边读文档文件边打包发送，不把整个归档放进内存
+    
+    JSONL 每行为 {"title", "content"}，大文档按行边界切成多行，可直接用 /api/import 导回。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {fmt}")
+    doc_manager = await session_manager.aget_doc_manager(session_id)
+    return StreamingResponse(
+        export_documents(doc_manager, fmt),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="documents.{fmt}"'}
+    )
+
+@app.get("/api/admin/llm")
+async def llm_stats():
+    """LLM 调用层运行状态：准入控制、熔断器、调用/对冲统计、连接池复用率、聊天录制状态和各意图处理耗时"""
+    return {
+        "admission": admission_controller.stats(),
+        "circuit_breaker": llm_circuit_breaker.stats(),
+        "client": llm_client.stats(),
+        "recorder": chat_recorder.stats() if chat_recorder is not None else None,
+        "prefetch": prefetcher.stats() if prefetcher is not None else None,
+        "handlers": handler_timing_stats(),
+    }
+
+@app.get("/api/admin/memory")
+async def memory_stats(
+    top: int = Query(MEMORY_TOP_SESSIONS, ge=1, le=1000, description="列出占用最多的会话数"),
+    fresh: bool = Query(True, description="是否立即重新统计；为 false 时返回最近一次后台采样的结果")
+):
+    """
+    内存占用：进程 RSS、各会话按组件（文档副本、检索索引、对话历史、文档上下文、待确认操作）估算的字节数，
+    以及占用最多的会话和最近的采样历史
+    """
+    report = memory_sampler.latest if not fresh else None
+    if report is None:
+        report = await asyncio.to_thread(session_manager.memory_report, top)
+    return {**report, "history": list(memory_sampler.history)}
+
+@app.get("/api/admin/snapshot")
+async def snapshot_stats():
+    """状态快照：路径、写入次数、最近一次的大小和耗时"""
+    if state_snapshotter is None:
+        return {"enabled": False}
+    return {"enabled": True, **state_snapshotter.stats()}
+
+@app.post("/api/admin/snapshot")
+async def save_snapshot():
+    """立即写一次状态快照（例如部署前）"""
+    if state_snapshotter is None:
+        raise HTTPException(status_code=404, detail="未启用状态快照 (SNAPSHOT_ENABLED)")
+    await asyncio.to_thread(state_snapshotter.save)
+    return {"enabled": True, **state_snapshotter.stats()}
+
+logger = logging.getLogger(__name__)
+
+
+def _report_prewarm(future):
+    """后台预热结束后的回调：失败时记录日志，不在事件循环的回调里重新抛出异常"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.warning("dashscope SDK 预热失败: %s", error, exc_info=error)
+        return
+    print(f"[系统] dashscope SDK 预热完成，耗时 {future.result():.2f} 秒")
+
+
+@app.on_event("startup")
+async def startup():
+    """启动时检查配置、从状态快照恢复会话，并在后台预热 dashscope SDK（不阻塞服务开始接受请求）"""
+    report_config()
+    session_manager.loop = asyncio.get_running_loop()
+    if state_snapshotter is not None:
+        started = time.perf_counter()
+        state = read_snapshot(SNAPSHOT_PATH)
+        if state is not None:
+            restored = session_manager.restore_state(state)
+            print(f"[系统] 已从状态快照恢复 {restored} 个会话，耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+        state_snapshotter.start()
+    memory_sampler.start()
+    if LLM_PREWARM:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, llm_client.prewarm)
+        future.add_done_callback(_report_prewarm)
+
+
+@app.on_event("shutdown")
+async def flush_on_shutdown():
+    """退出前把尚未落盘的检索索引等写入文件"""
+    # 先等进行中的文档读写完成（在线程中等待，不阻塞事件循环）
+    await asyncio.to_thread(shutdown_io_executor)
+    flush_search_indexes()
+    if state_snapshotter is not None:
+        # 快照要在事件循环中获取会话锁，不能在循环线程里同步等待
+        await asyncio.to_thread(state_snapshotter.stop)
+    if chat_recorder is not None:
+        chat_recorder.close()
+    memory_sampler.stop()
+    stop_watchers()
+    flush_duplicate_indexes()
+
 # ============================================
 # 启动服务器
 # ============================================
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        # 分析冷启动耗时（导入各模块、启动钩子、dashscope SDK），不启动服务
+        from startup_profile import profile_startup
+        sys.exit(profile_startup())
+
     import uvicorn
     # 从环境变量获取端口，默认为 8000
     port = int(os.environ.get("PORT", 8000))
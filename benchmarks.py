@@ -0,0 +1,393 @@
+# benchmarks.py
+# 性能基准测试脚本 (Micro/Macro Benchmarks)
+#
+# 用法：
+#   python benchmarks.py keywords [--iterations N]
+#   python benchmarks.py responses [--lines N] [--iterations N]
+#   python benchmarks.py sessions [--docs N] [--iterations N]
+#   python benchmarks.py conversation [--turns N]
+#   python benchmarks.py lines [--lines N] [--iterations N]
+#   python benchmarks.py bigdoc [--mb N]
+#
+# 每个子命令对应一个 bench_xxx 函数，只依赖本地模块，不会调用 LLM 服务。
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _timeit(func, iterations):
+    """执行 func() iterations 次，返回每次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _report(rows):
+    """打印 (名称, 平均耗时微秒) 列表，并以第一行为基准给出加速比"""
+    baseline = rows[0][1]
+    for name, micros in rows:
+        speedup = baseline / micros if micros else float("inf")
+        print(f"  {name:<36} {micros:9.3f} us/次   x{speedup:.2f}")
+
+
+# ============================================
+# 控制语句识别（确认/取消/退出/帮助）
+# ============================================
+
+_KEYWORD_SAMPLES = [
+    "确认", "好的", "取消", "No", "不",                       # 确认/取消轮次
+    "退出", "谢谢，再见", "帮助", "你能做什么",                 # 退出/帮助
+    "把今天的会议要点加到项目周报的结尾",                      # 普通指令
+    "把项目周报里的周一开会改成周二开会",
+    "我把快递单号存在哪了",
+]
+
+
+def _legacy_classify(text):
+    """原实现：内联列表 + 每次调用 re.search（依赖 re 模块内部的编译缓存）"""
+    lowered = text.lower().strip()
+    if lowered in ['确认', 'confirm', 'yes', 'y', '是', '好的', '好']:
+        return "CONFIRM"
+    elif lowered in ['取消', 'cancel', 'no', 'n', '否', '不']:
+        return "CANCEL"
+    if re.search(r"(退出|再见|结束)", text):
+        return "EXIT"
+    if re.search(r"(帮助|能做什么|怎么用)", text):
+        return "HELP"
+    return None
+
+
+def bench_keywords(args):
+    from keyword_matcher import control_matcher
+
+    # 两种实现在样本上的结果必须一致
+    for text in _KEYWORD_SAMPLES:
+        legacy, current = _legacy_classify(text), control_matcher.classify(text)
+        if legacy != current:
+            print(f"[基准测试] 结果不一致: {text!r} 原实现={legacy} 匹配器={current}")
+
+    print(f"控制语句识别：{len(_KEYWORD_SAMPLES)} 条样本，每种实现 {args.iterations} 轮")
+    rows = []
+    for name, classify in (("列表 + re.search（原实现）", _legacy_classify),
+                           ("预编译匹配器 control_matcher", control_matcher.classify)):
+        def run(classify=classify):
+            for text in _KEYWORD_SAMPLES:
+                classify(text)
+        rows.append((name, _timeit(run, args.iterations) / len(_KEYWORD_SAMPLES)))
+    _report(rows)
+
+
+# ============================================
+# 响应序列化与压缩
+# ============================================
+
+def _cjk_document(lines):
+    """生成一篇中文为主的长文档"""
+    samples = [
+        "今天的项目周会讨论了第三季度的交付计划，重点是检索模块的性能优化。",
+        "待办：整理用户反馈，周五之前把会议纪要发给所有参会人员。",
+        "学习笔记：倒排索引按字符二元组切分中文，不需要额外的分词器。",
+        "Release 2.3 将包含压缩中间件和快速 JSON 序列化（orjson）。",
+    ]
+    return "\n".join(f"{i + 1}. {samples[i % len(samples)]}" for i in range(lines))
+
+
+def bench_responses(args):
+    import gzip
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from api_server import ChatResponse, DocumentsResponse
+    from fast_json import dumps, orjson
+    from compression import brotli
+    from config import COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+
+    document = _cjk_document(args.lines)
+    payloads = [
+        (f"DISPLAY_DOC（{args.lines} 行）", ChatResponse(response_type="DOCUMENT", content=document)),
+        ("文档列表（200 个标题）", DocumentsResponse(documents=[f"项目文档{i}" for i in range(200)])),
+    ]
+
+    for label, model in payloads:
+        # FastAPI 默认路径：按 response_model 转换为字典后再编码
+        def default_path(model=model):
+            return JSONResponse(jsonable_encoder(model.model_dump())).body
+
+        def fast_path(model=model):
+            return dumps(model)
+
+        body = fast_path()
+        print(f"\n{label}：JSON {len(body)} 字节（orjson {'已' if orjson else '未'}安装）")
+        print("序列化耗时：")
+        _report([("FastAPI 默认（jsonable_encoder + json）", _timeit(default_path, args.iterations)),
+                 ("FastJSONResponse", _timeit(fast_path, args.iterations))])
+
+        print("压缩（字节数 / 占原始比例 / 耗时）：")
+        codecs = [(f"gzip level {COMPRESSION_GZIP_LEVEL}", lambda: gzip.compress(body, COMPRESSION_GZIP_LEVEL))]
+        if brotli is not None:
+            codecs.append((f"brotli quality {COMPRESSION_BROTLI_QUALITY}",
+                           lambda: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)))
+        else:
+            print("  （未安装 brotli，跳过 br）")
+        for name, compress in codecs:
+            size = len(compress())
+            micros = _timeit(compress, max(1, args.iterations // 10))
+            print(f"  {name:<36} {size:9d} 字节  {size / len(body):6.1%}  {micros:9.1f} us/次")
+
+
+# ============================================
+# 会话创建
+# ============================================
+
+def bench_sessions(args):
+    from api_server import SessionManager
+    from document_manager import DocumentManager
+
+    # 在临时目录中准备文档，避免触碰真实数据
+    workdir = tempfile.mkdtemp(prefix="smartclip-bench-")
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed = DocumentManager()
+        for i in range(args.docs):
+            seed.add_content(f"文档{i}", _cjk_document(200), "end")
+        seed.search_index.flush()
+
+    def eager():
+        # 原先的构造方式：立即创建全部组件并重置对话历史
+        manager = SessionManager()
+        _, app_instance = manager.get_or_create_session()
+        app_instance.intent_recognizer.reset_conversation()
+
+    def lazy():
+        SessionManager().get_or_create_session()
+
+    def lazy_confirm():
+        # 只处理"确认"轮次的会话：检查待确认操作，不触发任何组件创建
+        _, app_instance = SessionManager().get_or_create_session()
+        return app_instance.pending_action
+
+    print(f"新建会话：{args.docs} 个文档（目录 {workdir}）")
+    rows = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, func, iterations in (("立即创建全部组件（原实现）", eager, max(1, args.iterations // 100)),
+                                       ("延迟创建", lazy, args.iterations),
+                                       ("延迟创建 + 确认轮次", lazy_confirm, args.iterations)):
+            rows.append((name, _timeit(func, iterations)))
+    _report(rows)
+    for name, micros in rows:
+        print(f"  {name:<36} {1e6 / micros:12.0f} 会话/秒")
+
+
+# ============================================
+# 对话历史压缩
+# ============================================
+
+def _simulated_turns(turns):
+    """生成模拟对话：(用户输入, 助手回复 JSON)，文档名随对话推进不断变化"""
+    templates = [
+        ("把{note}加到{doc}的结尾", "ADD_CONTENT"),
+        ("查看{doc}", "DISPLAY_DOC"),
+        ("打开{doc}", "SET_ACTIVE"),
+        ("把{doc}里的{note}改成{note}（已确认）", "EDIT_CONTENT"),
+    ]
+    notes = ["周一例会的三项结论", "客户反馈的登录问题", "下周出差的行程安排", "读书笔记第三章要点"]
+    for i in range(turns):
+        template, intent = templates[i % len(templates)]
+        doc = f"项目{i // 3}周报"
+        note = notes[i % len(notes)]
+        user = template.format(doc=doc, note=note)
+        reply = json.dumps({"intent_type": intent.replace("_CONTENT", "").replace("DISPLAY_DOC", "QUERY"),
+                            "target_document": doc, "content_to_process": note,
+                            "target_location_raw": "end", "confirmation_needed": False}, ensure_ascii=False)
+        yield user, reply, doc
+
+
+def bench_conversation(args):
+    from conversation_summary import ConversationCompactor, estimate_tokens
+    from config import CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT
+
+    strategies = {
+        "完整历史": lambda messages: messages,
+        f"截断为最近 {CONVERSATION_MAX_MESSAGES} 条": lambda messages: messages[-CONVERSATION_MAX_MESSAGES:],
+    }
+    compactor = ConversationCompactor(CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT)
+    strategies[f"摘要折叠（保留最近 {CONVERSATION_KEEP_RECENT} 条）"] = compactor.compact
+
+    print(f"模拟 {args.turns} 轮对话（token 为估算值）")
+    print(f"  {'策略':<28} {'累计 token':>10} {'最后一轮':>8} {'单轮最大':>8} {'节省':>7} {'文档召回':>8}")
+    baseline = None
+    for name, shrink in strategies.items():
+        messages, total, peak, last, mentioned = [], 0, 0, 0, []
+        for user, reply, doc in _simulated_turns(args.turns):
+            messages = shrink(messages)
+            messages.append({"role": "user", "content": user})
+            last = estimate_tokens(messages)
+            total += last
+            peak = max(peak, last)
+            messages.append({"role": "assistant", "content": reply})
+            if doc not in mentioned:
+                mentioned.append(doc)
+        # 文档召回：最近提到的 10 个文档中，仍能在最终 prompt 中找到的比例
+        prompt_text = "".join(m["content"] for m in shrink(messages))
+        recent_docs = mentioned[-10:]
+        recall = sum(1 for doc in recent_docs if doc in prompt_text) / len(recent_docs)
+        baseline = baseline or total
+        print(f"  {name:<28} {total:>10} {last:>8} {peak:>8} {1 - total / baseline:>7.1%} {recall:>8.0%}")
+
+    compactor = ConversationCompactor(CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT)
+    history = []
+    for user, reply, _ in _simulated_turns(CONVERSATION_MAX_MESSAGES // 2 + 1):
+        history += [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+    micros = _timeit(lambda: ConversationCompactor(CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT).compact(history), 2000)
+    print(f"单次折叠耗时：{micros:.1f} us")
+
+
+# ============================================
+# 文档行存储（list[str] 与紧凑存储）
+# ============================================
+
+# 在独立进程中加载文档并测量 RSS 增量，避免两种存储方式互相干扰（已释放的内存不一定归还给系统）
+_LINES_RSS_PROBE = """
+import sys
+from compact_lines import CompactLines
+from memory_accounting import process_rss
+kind, lines = sys.argv[1], int(sys.argv[2])
+text = "\\n".join(f"{i}. 短笔记 #{i % 97}" for i in range(lines))
+before = process_rss()
+doc = CompactLines.from_text(text) if kind == "compact" else text.split("\\n")
+after = process_rss()
+print(after - before, sys.getsizeof(doc) if kind == "compact" else
+      sys.getsizeof(doc) + sum(map(sys.getsizeof, doc)))
+"""
+
+
+def bench_lines(args):
+    from compact_lines import CompactLines
+
+    print(f"{args.lines} 行短笔记（每行约 15 字节）")
+    print(f"  {'存储方式':<20} {'RSS 增量':>12} {'对象大小':>12} {'每行':>8}")
+    for kind, name in (("list", "list[str]"), ("compact", "CompactLines")):
+        output = subprocess.run([sys.executable, "-c", _LINES_RSS_PROBE, kind, str(args.lines)],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        rss, size = int(output[0]), int(output[1])
+        print(f"  {name:<20} {rss / 1048576:>9.1f} MB {size / 1048576:>9.1f} MB {size / args.lines:>6.1f} B")
+
+    text = "\n".join(f"{i}. 短笔记 #{i % 97}" for i in range(args.lines))
+    plain = text.split("\n")
+    compact = CompactLines.from_text(text)
+    indexes = [(i * 7919) % args.lines for i in range(1000)]
+
+    print("加载（由文件内容构建）：")
+    _report([("list[str]", _timeit(lambda: text.split("\n"), args.iterations)),
+             ("CompactLines", _timeit(lambda: CompactLines.from_text(text), args.iterations))])
+    print("随机读取 1000 行：")
+    _report([("list[str]", _timeit(lambda: [plain[i] for i in indexes], args.iterations * 10)),
+             ("CompactLines", _timeit(lambda: [compact[i] for i in indexes], args.iterations * 10))])
+    print("读取一页（500 行）：")
+    _report([("list[str]", _timeit(lambda: plain[1000:1500], args.iterations * 100)),
+             ("CompactLines", _timeit(lambda: compact[1000:1500], args.iterations * 100))])
+    print("完整遍历：")
+    _report([("list[str]", _timeit(lambda: sum(1 for _ in plain), args.iterations)),
+             ("CompactLines", _timeit(lambda: sum(1 for _ in compact), args.iterations))])
+    print("末尾追加 1000 行：")
+    new_lines = [f"追加的笔记 {i}" for i in range(1000)]
+    _report([("list[str]", _timeit(lambda: list(plain[:10]).extend(new_lines), args.iterations * 10)),
+             ("CompactLines", _timeit(lambda: CompactLines(plain[:10]).extend(new_lines), args.iterations * 10))])
+
+
+# ============================================
+# 大文档加载（整篇读入与内存映射）
+# ============================================
+
+# 在独立进程中按 DocumentManager 加载文档的方式打开文件并取第一页，输出：加载耗时、第一页耗时、RSS 增量
+_BIGDOC_PROBE = """
+import sys, time
+from compact_lines import CompactLines
+from mapped_document import MappedLines
+from memory_accounting import process_rss
+kind, path, page = sys.argv[1], sys.argv[2], int(sys.argv[3])
+before = process_rss()
+start = time.perf_counter()
+if kind == "mapped":
+    doc = MappedLines(path)
+else:
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    doc = CompactLines.from_text(content) if kind == "compact" else content.split("\\n")
+    del content
+loaded = time.perf_counter()
+lines = doc[0:page]
+shown = time.perf_counter()
+print(loaded - start, shown - loaded, process_rss() - before)
+"""
+
+
+def bench_bigdoc(args):
+    from config import DISPLAY_DOC_MAX_LINES
+
+    workdir = tempfile.mkdtemp(prefix="smartclip-bench-")
+    path = os.path.join(workdir, "归档.txt")
+    line = "2024-05-01 归档笔记：今天的项目周会讨论了检索模块的性能优化。\n".encode("utf-8")
+    with open(path, "wb") as f:
+        for _ in range(max(1, args.mb * 1048576 // len(line) // 10000)):
+            f.write(line * 10000)
+    size = os.path.getsize(path)
+
+    print(f"{size / 1048576:.0f} MB 文档（{size // len(line)} 行），打开后读取第一页（{DISPLAY_DOC_MAX_LINES} 行）")
+    print(f"  {'加载方式':<28} {'打开':>10} {'读取第一页':>10} {'RSS 增量':>10}")
+    root = os.path.dirname(os.path.abspath(__file__))
+    for kind, name in (("list", "整篇读入 list[str]"), ("compact", "整篇读入 CompactLines"),
+                       ("mapped", "内存映射 MappedLines")):
+        output = subprocess.run([sys.executable, "-c", _BIGDOC_PROBE, kind, path, str(DISPLAY_DOC_MAX_LINES)],
+                                capture_output=True, text=True, check=True, cwd=root).stdout.split()
+        load, show, rss = float(output[0]), float(output[1]), int(output[2])
+        print(f"  {name:<28} {load * 1000:>7.1f} ms {show * 1000:>7.2f} ms {rss / 1048576:>7.1f} MB")
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartClip 性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    keywords = subparsers.add_parser("keywords", help="确认/取消/退出/帮助识别的微基准")
+    keywords.add_argument("--iterations", type=int, default=20000)
+    keywords.set_defaults(func=bench_keywords)
+
+    responses = subparsers.add_parser("responses", help="大文档响应的序列化与压缩基准")
+    responses.add_argument("--lines", type=int, default=5000)
+    responses.add_argument("--iterations", type=int, default=50)
+    responses.set_defaults(func=bench_responses)
+
+    sessions = subparsers.add_parser("sessions", help="每秒可创建的会话数")
+    sessions.add_argument("--docs", type=int, default=20)
+    sessions.add_argument("--iterations", type=int, default=20000)
+    sessions.set_defaults(func=bench_sessions)
+
+    conversation = subparsers.add_parser("conversation", help="对话历史压缩节省的 token")
+    conversation.add_argument("--turns", type=int, default=60)
+    conversation.set_defaults(func=bench_conversation)
+
+    lines = subparsers.add_parser("lines", help="大文档的内存占用与读写：list[str] 与紧凑存储")
+    lines.add_argument("--lines", type=int, default=1000000)
+    lines.add_argument("--iterations", type=int, default=5)
+    lines.set_defaults(func=bench_lines)
+
+    bigdoc = subparsers.add_parser("bigdoc", help="大文档的打开耗时、第一页耗时和内存：整篇读入与内存映射")
+    bigdoc.add_argument("--mb", type=int, default=200)
+    bigdoc.set_defaults(func=bench_bigdoc)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
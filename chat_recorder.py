@@ -0,0 +1,167 @@
+# chat_recorder.py
+# 聊天请求录制 (Chat Request Recorder)
+#
+# 把 /api/chat 的请求/响应对（含 LLM 原始输出和耗时）脱敏后追加写入 JSONL 文件，供 replay.py 回放。
+# - 写入在后台线程中进行，请求线程只把记录放进有界队列；队列满时丢弃并计数，绝不阻塞请求
+# - 文件超过 max_bytes 后轮转：chat.jsonl -> chat.jsonl.1 -> ... -> chat.jsonl.N
+# - 会话 ID 只保存哈希值，文本中的手机号、邮箱、身份证号、API Key 替换为占位符
+
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+
+# 单条记录中响应内容最多保存的字符数（完整内容只保存长度和哈希，用于回放比对）
+MAX_CONTENT_CHARS = 2000
+
+_SENSITIVE_PATTERNS = [
+    (re.compile(r"sk-[0-9a-zA-Z]{16,}"), "<API_KEY>"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<EMAIL>"),
+    (re.compile(r"(?<!\d)\d{17}[\dXx](?!\d)"), "<ID_NUMBER>"),
+    (re.compile(r"(?<!\d)1[3-9]\d{9}(?!\d)"), "<PHONE>"),
+]
+
+
+def sanitize(text):
+    """替换文本中的敏感信息"""
+    if not isinstance(text, str):
+        return text
+    for pattern, placeholder in _SENSITIVE_PATTERNS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def hash_session(session_id):
+    """会话 ID 的短哈希：回放时仍能按会话分组，但无法还原真实 ID"""
+    if not session_id:
+        return None
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+def content_digest(content):
+    return hashlib.sha1((content or "").encode("utf-8")).hexdigest()
+
+
+class ChatRecorder:
+    """
+    非阻塞的 JSONL 录制器
+
+    Args:
+        path: 录制文件路径
+        max_bytes: 单个文件的最大字节数，超过后轮转
+        backup_count: 保留的历史文件个数
+        queue_size: 待写入队列的容量，写入跟不上时丢弃新记录
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=1000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="chat-recorder", daemon=True)
+                self._thread.start()
+
+    def record(self, entry):
+        """提交一条记录（不阻塞）；返回是否成功放入队列"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def _run(self):
+        f = None
+        size = 0
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is self._STOP:
+                    break
+                try:
+                    if f is None:
+                        f = open(self.path, "ab")
+                        size = f.tell()
+                    line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                    f.write(line)
+                    size += len(line)
+                    self.recorded += 1
+                    if size >= self.max_bytes:
+                        f.close()
+                        f = None
+                        self._rotate()
+                    elif self._queue.empty():
+                        # 队列暂时空了再刷盘，高峰期批量写入
+                        f.flush()
+                except Exception as e:
+                    print(f"[系统警告] 写入聊天录制文件失败: {e}")
+                    if f is not None:
+                        f.close()
+                        f = None
+        finally:
+            if f is not None:
+                f.close()
+
+    def close(self, timeout=5.0):
+        """写完队列中剩余的记录后停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {"path": str(self.path), "recorded": self.recorded, "dropped": self.dropped,
+                "queued": self._queue.qsize()}
+
+
+def build_entry(session_id, text, status_code, elapsed_seconds, response=None, llm_call=None):
+    """构造一条脱敏后的录制记录"""
+    entry = {
+        "ts": round(time.time() - elapsed_seconds, 3),  # 请求开始时间，回放按它排定发送时刻
+        "session": hash_session(session_id),
+        "request": {"text": sanitize(text)},
+        "status": status_code,
+        "elapsed_ms": round(elapsed_seconds * 1000, 1),
+    }
+    if response is not None:
+        content = response.content or ""
+        entry["response"] = {
+            "response_type": response.response_type,
+            "content": sanitize(content[:MAX_CONTENT_CHARS]),
+            "content_length": len(content),
+            "content_sha1": content_digest(content),
+        }
+    if llm_call:
+        llm = dict(llm_call)
+        if "raw_output" in llm:
+            llm["raw_output"] = sanitize(llm["raw_output"])
+        entry["llm"] = llm
+    return entry
@@ -0,0 +1,163 @@
+# circuit_breaker.py
+# 熔断器 (Circuit Breaker)
+#
+# 包在 DashScope 调用外面：最近一段窗口内错误率或慢调用比例过高时熔断（OPEN），
+# 熔断期间完全不访问网络，由调用方走本地降级逻辑；
+# 冷却时间过后进入半开状态（HALF_OPEN），放行少量试探请求，成功则恢复（CLOSED）。
+
+import threading
+import time
+from collections import deque
+
+STATE_CLOSED = "CLOSED"
+STATE_OPEN = "OPEN"
+STATE_HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """
+    基于滑动窗口的熔断器（线程安全）
+
+    Args:
+        failure_rate_threshold: 窗口内失败比例达到该值时熔断
+        slow_call_seconds: 单次调用超过该耗时视为慢调用
+        slow_call_rate_threshold: 窗口内慢调用比例达到该值时熔断
+        window_size: 统计最近多少次调用
+        min_calls: 窗口内至少有多少次调用才开始判断
+        open_seconds: 熔断后多久进入半开状态
+        half_open_max_calls: 半开状态下允许同时进行的试探调用数
+        half_open_successes: 半开状态下连续成功多少次后恢复
+    """
+
+    def __init__(self, failure_rate_threshold=0.5, slow_call_seconds=8.0,
+                 slow_call_rate_threshold=0.8, window_size=20, min_calls=5,
+                 open_seconds=30.0, half_open_max_calls=1, half_open_successes=2):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_successes = half_open_successes
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._window = deque(maxlen=window_size)  # (失败?, 慢调用?)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_ok = 0
+
+        # 统计信息
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        """OPEN 状态冷却结束后转为 HALF_OPEN（调用方需持有锁）"""
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_ok = 0
+            print("[熔断器] 冷却结束，进入半开状态，开始试探调用")
+
+    def _trip(self, reason):
+        """转为 OPEN 状态（调用方需持有锁）"""
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self.times_opened += 1
+        print(f"[熔断器] 已熔断（{reason}），{self.open_seconds:.0f} 秒内跳过 LLM 调用")
+
+    def allow_request(self):
+        """是否允许本次请求访问上游；返回 False 时调用方应直接走降级逻辑"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self, latency):
+        """记录一次成功调用（latency 为耗时秒数，过慢也会计入慢调用比例）"""
+        slow = latency is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if slow:
+                    self._trip("半开试探调用仍然过慢")
+                    return
+                self._half_open_ok += 1
+                if self._half_open_ok >= self.half_open_successes:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    print("[熔断器] 试探调用成功，已恢复正常")
+                return
+            self._window.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self, latency=None):
+        """记录一次失败调用（网络异常、非 200 响应等）"""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                self._trip("半开试探调用失败")
+                return
+            slow = latency is not None and latency >= self.slow_call_seconds
+            self._window.append((True, slow))
+            self._evaluate()
+
+    def record_timeout(self, latency):
+        """
+        记录一次因调用方截止时间到达而放弃等待的调用
+
+        截止时间可能来自客户端的 X-Request-Timeout，不能说明上游出了问题，因此不计为失败；
+        只有等待时间已经超过服务端的慢调用阈值时才计为一次慢调用。
+        """
+        slow = latency is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if slow:
+                    self._trip("半开试探调用仍然过慢")
+                return
+            if slow:
+                self._window.append((False, True))
+                self._evaluate()
+
+    def release(self):
+        """归还 allow_request() 放行的名额但不记录结果（调用没有得到任何结果时使用）"""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _evaluate(self):
+        """根据窗口统计判断是否需要熔断（调用方需持有锁）"""
+        if self._state != STATE_CLOSED or len(self._window) < self.min_calls:
+            return
+        total = len(self._window)
+        failures = sum(1 for failed, _ in self._window if failed)
+        slow_calls = sum(1 for _, slow in self._window if slow)
+        if failures / total >= self.failure_rate_threshold:
+            self._trip(f"错误率 {failures}/{total}")
+        elif slow_calls / total >= self.slow_call_rate_threshold:
+            self._trip(f"慢调用 {slow_calls}/{total}")
+
+    def stats(self):
+        """返回熔断器状态统计"""
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self._state,
+                "window_calls": len(self._window),
+                "window_failures": sum(1 for failed, _ in self._window if failed),
+                "times_opened": self.times_opened,
+                "short_circuited": self.short_circuited,
+            }
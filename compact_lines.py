@@ -0,0 +1,253 @@
+# compact_lines.py
+# 紧凑行存储 (Compact Line Storage)
+#
+# list[str] 中每一行都是一个独立的 str 对象，即使是很短的行也要约 50~80 字节的对象开销。
+# CompactLines 把整篇文档存成一块 UTF-8 字节缓冲区（各行以 \n 连接，与文档文件内容完全相同），
+# 另用 array 记录每行的结束偏移（每行 4 字节），对外表现为一个可变的行序列：
+# - 按下标取行 O(1)（只解码这一行）；连续区间一次解码后再切分
+# - 在末尾追加是均摊 O(1)
+# - 在中间插入、删除、替换需要移动后面的字节和偏移，与 list 的插入一样是 O(n)
+# 文档保存时直接写出缓冲区，加载时也不需要为每一行创建 str 对象。
+
+from array import array
+from collections.abc import MutableSequence
+from itertools import accumulate, count
+from operator import add
+
+# 缓冲区超过 4GB 时偏移改用 8 字节
+_MAX_UINT32 = 2 ** 32 - 1
+
+# 迭代时每次解码的行数
+_ITER_BATCH = 4096
+
+# 从文本构建时每次切分的字节数（限制临时对象占用的内存）
+_LOAD_CHUNK = 1 << 20
+
+
+class CompactLines(MutableSequence):
+    """
+    以 UTF-8 缓冲区 + 偏移数组存储的行列表，可以替代 list[str] 使用
+
+    行内不能包含换行符（与文档按 \\n 分行存储的约定一致）。
+    """
+
+    __slots__ = ("_buf", "_ends")
+
+    def __init__(self, lines=()):
+        self._buf = bytearray()
+        self._ends = array("I")
+        self.extend(lines)
+
+    @classmethod
+    def from_text(cls, text):
+        """从以 \\n 分隔的文本创建；空文本得到空文档"""
+        instance = cls()
+        if not text:
+            return instance
+        buf = bytearray(text.encode("utf-8"))
+        ends = array("I" if len(buf) <= _MAX_UINT32 else "Q")
+        # 分块切分，每次只为约 1MB 的内容创建临时对象；块边界总是落在换行符上
+        start = 0
+        while True:
+            stop = buf.find(b"\n", start + _LOAD_CHUNK)
+            if stop < 0:
+                stop = len(buf)
+            # 块内第 k 行的结束偏移 = 块起点 + 前 k+1 行的字节数之和 + 前面的 k 个换行符
+            lengths = map(len, buf[start:stop].split(b"\n"))
+            ends.extend(map(add, accumulate(lengths), count(start)))
+            if stop == len(buf):
+                break
+            start = stop + 1
+        instance._buf = buf
+        instance._ends = ends
+        return instance
+
+    def text(self):
+        """整篇文档的文本（各行以 \\n 连接）"""
+        return self._buf.decode("utf-8")
+
+    def encoded(self):
+        """整篇文档的 UTF-8 字节，保存文件时直接写出"""
+        return bytes(self._buf)
+
+    def _start(self, index):
+        return self._ends[index - 1] + 1 if index > 0 else 0
+
+    @staticmethod
+    def _encode(lines):
+        """把若干行编码为 (以 \\n 连接的 UTF-8 字节, 各行的字节数)"""
+        lines = list(lines)
+        try:
+            joined = "\n".join(lines)
+        except TypeError:
+            raise TypeError("行必须是 str") from None
+        if joined.count("\n") != max(0, len(lines) - 1):
+            raise ValueError("行内不能包含换行符")
+        if joined.isascii():
+            return joined.encode("ascii"), list(map(len, lines))
+        return joined.encode("utf-8"), [len(line.encode("utf-8")) for line in lines]
+
+    @staticmethod
+    def _relative_ends(first_start, lengths):
+        """第一行从 first_start 开始时各行的结束偏移"""
+        return map(add, accumulate(lengths), count(first_start))
+
+    def _index(self, index):
+        n = len(self._ends)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("行号超出范围")
+        return index
+
+    # ---------- 读取 ----------
+
+    def __len__(self):
+        return len(self._ends)
+
+    def _decode_range(self, i, j):
+        """解码第 i 到 j-1 行（0 <= i < j <= len）"""
+        return self._buf[self._start(i):self._ends[j - 1]].decode("utf-8").split("\n")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            i, j, step = index.indices(len(self._ends))
+            if step != 1:
+                return [self[k] for k in range(i, j, step)]
+            return self._decode_range(i, j) if i < j else []
+        index = self._index(index)
+        return self._buf[self._start(index):self._ends[index]].decode("utf-8")
+
+    def __iter__(self):
+        n = len(self._ends)
+        for i in range(0, n, _ITER_BATCH):
+            yield from self._decode_range(i, min(n, i + _ITER_BATCH))
+
+    def __contains__(self, value):
+        return isinstance(value, str) and any(line == value for line in self)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactLines):
+            return self._buf == other._buf and self._ends == other._ends
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CompactLines({list(self[:5])!r}{'...' if len(self) > 5 else ''}, lines={len(self)})"
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._buf.__sizeof__() + self._ends.__sizeof__()
+
+    def __reduce__(self):
+        return (self.__class__._restore, (bytes(self._buf), self._ends.typecode, self._ends.tobytes()))
+
+    @classmethod
+    def _restore(cls, buf, typecode, ends):
+        instance = cls()
+        instance._buf = bytearray(buf)
+        instance._ends = array(typecode)
+        instance._ends.frombytes(ends)
+        return instance
+
+    # ---------- 修改 ----------
+
+    def append(self, line):
+        self.extend((line,))
+
+    def extend(self, lines):
+        joined, lengths = self._encode(lines)
+        if not lengths:
+            return
+        if self._ends:
+            self._buf += b"\n"
+        first_start = len(self._buf)
+        self._buf += joined
+        self._extend_ends(self._relative_ends(first_start, lengths))
+
+    def _extend_ends(self, ends):
+        if len(self._buf) > _MAX_UINT32 and self._ends.typecode == "I":
+            self._ends = array("Q", self._ends)
+        self._ends.extend(ends)
+
+    def insert(self, index, line):
+        n = len(self._ends)
+        if index < 0:
+            index = max(0, index + n)
+        self._splice(min(index, n), min(index, n), [line])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            i, j, step = index.indices(len(self._ends))
+            if step != 1:
+                values = list(value)
+                positions = range(i, j, step)
+                if len(values) != len(positions):
+                    raise ValueError("扩展切片赋值的长度不一致")
+                for k, v in zip(positions, values):
+                    self._splice(k, k + 1, [v])
+                return
+            self._splice(i, max(i, j), list(value))
+        else:
+            index = self._index(index)
+            self._splice(index, index + 1, [value])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            i, j, step = index.indices(len(self._ends))
+            if step != 1:
+                for k in sorted(range(i, j, step), reverse=True):
+                    self._splice(k, k + 1, [])
+                return
+            if i < j:
+                self._splice(i, j, [])
+        else:
+            index = self._index(index)
+            self._splice(index, index + 1, [])
+
+    def clear(self):
+        self._buf = bytearray()
+        self._ends = array("I")
+
+    def _splice(self, i, j, lines):
+        """把第 i 到 j-1 行替换为 lines（i == j 时为插入）"""
+        n = len(self._ends)
+        if i == j and not lines:
+            return
+        if i == n and j == n:
+            self.extend(lines)
+            return
+        joined, lengths = self._encode(lines)
+
+        if i == j:
+            # 插入到第 i 行之前，新内容后面补一个换行
+            byte_start = byte_end = self._start(i)
+            replacement = joined + b"\n"
+        elif lengths:
+            # 替换第 i..j-1 行，两侧的换行保持不变
+            byte_start, byte_end = self._start(i), self._ends[j - 1]
+            replacement = joined
+        elif j < n:
+            # 删除中间或开头的行：连同后面的换行一起删除
+            byte_start, byte_end = self._start(i), self._start(j)
+            replacement = b""
+        elif i > 0:
+            # 删除末尾的行：连同前面的换行一起删除
+            byte_start, byte_end = self._ends[i - 1], self._ends[j - 1]
+            replacement = b""
+        else:
+            self.clear()
+            return
+
+        self._buf[byte_start:byte_end] = replacement
+        # 后面各行的偏移整体平移；这一步是纯 Python 循环，是中间插入/删除的主要开销
+        delta = len(replacement) - (byte_end - byte_start)
+        tail = self._ends[j:]
+        if delta:
+            tail = map(delta.__add__, tail)
+        ends = array("I" if len(self._buf) <= _MAX_UINT32 else "Q", self._ends[:i])
+        ends.extend(self._relative_ends(byte_start, lengths))
+        ends.extend(tail)
+        self._ends = ends
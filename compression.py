@@ -0,0 +1,168 @@
+# compression.py
+# 响应压缩中间件 (Response Compression Middleware)
+#
+# 按请求的 Accept-Encoding 协商压缩算法：优先 Brotli（需安装可选依赖 brotli），其次 gzip。
+# 小于 minimum_size 的响应不压缩；流式响应（如 /api/documents/{title}/text）按块增量压缩。
+# 已经带有 Content-Encoding 的响应原样透传。
+
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 压缩收益很低的内容类型
+_SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def _accepted_encodings(scope):
+    """解析 Accept-Encoding，返回 q 值大于 0 的编码集合"""
+    accepted = set()
+    for key, value in scope.get("headers", ()):
+        if key != b"accept-encoding":
+            continue
+        for item in value.decode("latin-1").split(","):
+            parts = item.strip().split(";")
+            name = parts[0].strip().lower()
+            quality = 1.0
+            for param in parts[1:]:
+                param = param.strip()
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            if name and quality > 0:
+                accepted.add(name)
+    return accepted
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31：输出带 gzip 头的数据流
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI 压缩中间件
+
+    Args:
+        app: 下游 ASGI 应用
+        minimum_size: 响应体达到该字节数才压缩
+        gzip_level: gzip 压缩级别（1-9）
+        brotli_quality: Brotli 压缩质量（0-11），实时压缩建议 4-5
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope):
+        accepted = _accepted_encodings(scope)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == "br":
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # 先缓存响应头，看到第一块响应体后再决定是否压缩
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = {key.lower(): value for key, value in start_message.get("headers", ())}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if (b"content-encoding" in headers
+                        or content_type.startswith(_SKIP_CONTENT_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = self._compressor(encoding)
+                response_headers = [(key, value) for key, value in start_message.get("headers", ())
+                                    if key.lower() != b"content-length"]
+                response_headers.append((b"content-encoding", encoding.encode("latin-1")))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    # 一次性响应：整体压缩并给出准确的 Content-Length
+                    compressed = compressor.compress(body) + compressor.finish()
+                    response_headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start_message, "headers": response_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": response_headers})
+
+            # 流式响应：每块立即 flush，客户端可以边收边解压
+            if more_body:
+                chunk = compressor.compress(body) + compressor.flush()
+            else:
+                chunk = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def decompress(data, encoding):
+    """解压响应体（供基准测试和调试使用）"""
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    return data
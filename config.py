@@ -2,8 +2,6 @@
 
 import os
 
-print("[配置加载] 正在从环境变量加载配置...")
-
 # --- API Key 加载 ---
 # 优先从 'DASHSCOPE_API_KEY' 读取，这是阿里云SDK的官方推荐名称。
 # 如果找不到，再从通用的 'API_KEY' 读取。
@@ -15,30 +13,182 @@ API_KEY = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("API_KEY")
 APP_ID = os.environ.get("APP_ID")
 
 # --- 启动时检查 ---
-# 在程序启动时就进行严格检查，如果关键配置缺失，直接打印错误。
-if not API_KEY:
-    print("[配置错误] 严重错误：环境变量 'DASHSCOPE_API_KEY' 或 'API_KEY' 未设置或为空！")
-else:
-    # 为了安全，只打印部分key来确认加载成功
-    print(f"[配置加载] API Key 加载成功 (开头: {API_KEY[:5]}...)")
-
-if not APP_ID:
-    print("[配置错误] 严重错误：环境变量 'APP_ID' 未设置或为空！")
-else:
-    print(f"[配置加载] App ID 加载成功: {APP_ID}")
+# 导入本模块不再打印任何内容；由服务启动钩子调用 report_config() 检查关键配置，
+# 如果关键配置缺失，直接打印错误。
+def report_config():
+    print("[配置加载] 正在从环境变量加载配置...")
+    if not API_KEY:
+        print("[配置错误] 严重错误：环境变量 'DASHSCOPE_API_KEY' 或 'API_KEY' 未设置或为空！")
+    else:
+        # 为了安全，只打印部分key来确认加载成功
+        print(f"[配置加载] API Key 加载成功 (开头: {API_KEY[:5]}...)")
+
+    if not APP_ID:
+        print("[配置错误] 严重错误：环境变量 'APP_ID' 未设置或为空！")
+    else:
+        print(f"[配置加载] App ID 加载成功: {APP_ID}")
+
+# --- 并发与背压配置 ---
+# 同时在途的 LLM 调用上限、等待队列长度、排队超时（秒）。
+# 超出后 /api/chat 会快速返回 429/503 并带上 Retry-After，而不是让所有请求一起超时。
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "5"))
+
+# --- LLM 连接池配置 ---
+# 所有会话共享一个 HTTP 连接池调用 DashScope；池大小默认是并发上限的两倍（对冲请求会额外占用连接）。
+# 连接闲置超过 LLM_HTTP_KEEPALIVE_SECONDS 秒后不再复用。
+LLM_HTTP_POOL_ENABLED = os.environ.get("LLM_HTTP_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HTTP_POOL_SIZE = int(os.environ.get("LLM_HTTP_POOL_SIZE", str(LLM_MAX_CONCURRENCY * 2)))
+LLM_HTTP_KEEPALIVE_SECONDS = float(os.environ.get("LLM_HTTP_KEEPALIVE_SECONDS", "60"))
+
+# --- 熔断配置 ---
+# 最近窗口内 LLM 调用错误率或慢调用比例过高时熔断，熔断期间直接使用本地规则解析，
+# LLM_BREAKER_OPEN_SECONDS 秒后放行试探调用，成功即恢复。
+LLM_BREAKER_FAILURE_RATE = float(os.environ.get("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("LLM_BREAKER_SLOW_CALL_SECONDS", "8"))
+LLM_BREAKER_OPEN_SECONDS = float(os.environ.get("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# --- 截止时间与对冲请求配置 ---
+# 每个 /api/chat 请求的总时间预算（秒），客户端可通过 X-Request-Timeout 请求头缩短。
+# 启用对冲后，主请求超过历史 p95 耗时仍未返回时会再发一个请求，先返回者胜出；
+# LLM_HEDGE_BUDGET 限制对冲请求占主请求的比例（默认最多多花 10% 的调用）。
+CHAT_DEADLINE_SECONDS = float(os.environ.get("CHAT_DEADLINE_SECONDS", "20"))
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# --- LLM 后端与录制配置 ---
+# LLM_BACKEND=local 时不调用 DashScope，改用本地替身（规则解析 + 模拟耗时），用于压测和回放。
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "dashscope").lower()
+LOCAL_LLM_LATENCY_MS = float(os.environ.get("LOCAL_LLM_LATENCY_MS", "0"))
+# 录制脱敏后的 /api/chat 请求/响应到 JSONL 文件（按大小轮转），供 replay.py 回放
+CHAT_RECORD_ENABLED = os.environ.get("CHAT_RECORD_ENABLED", "false").lower() in ("1", "true", "yes")
+CHAT_RECORD_PATH = os.environ.get("CHAT_RECORD_PATH", "recordings/chat.jsonl")
+CHAT_RECORD_MAX_BYTES = int(os.environ.get("CHAT_RECORD_MAX_BYTES", str(10 * 1024 * 1024)))
+CHAT_RECORD_BACKUPS = int(os.environ.get("CHAT_RECORD_BACKUPS", "5"))
+
+# --- 内存统计配置 ---
+# 每隔 MEMORY_SAMPLE_INTERVAL_SECONDS 秒在后台估算一次各会话的内存占用（0 表示不做周期采样，
+# /api/admin/memory 仍可按需统计），报告中列出占用最多的 MEMORY_TOP_SESSIONS 个会话。
+MEMORY_SAMPLE_INTERVAL_SECONDS = float(os.environ.get("MEMORY_SAMPLE_INTERVAL_SECONDS", "60"))
+MEMORY_TOP_SESSIONS = int(os.environ.get("MEMORY_TOP_SESSIONS", "10"))
+
+# --- 状态快照配置 ---
+# 每隔 SNAPSHOT_INTERVAL_SECONDS 秒把会话状态（对话历史、待确认操作）和文档副本写入 SNAPSHOT_PATH，
+# 启动时从中恢复；退出时也会写一次（间隔为 0 表示只在退出时写）。
+SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes")
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "snapshots/state.snapshot")
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "60"))
+
+# --- 冷启动配置 ---
+# 服务启动后在后台线程预先导入 dashscope SDK，避免第一个请求承担导入耗时。
+LLM_PREWARM = os.environ.get("LLM_PREWARM", "true").lower() in ("1", "true", "yes")
+
+# --- 对话历史压缩配置 ---
+# 对话历史超过 CONVERSATION_MAX_MESSAGES 条时，较早的轮次折叠为一条摘要，只保留最近 CONVERSATION_KEEP_RECENT 条原文。
+CONVERSATION_MAX_MESSAGES = int(os.environ.get("CONVERSATION_MAX_MESSAGES", "20"))
+CONVERSATION_KEEP_RECENT = int(os.environ.get("CONVERSATION_KEEP_RECENT", "6"))
+
+# --- 文档上下文配置 ---
+# 每次调用 LLM 时注入当前文档列表和活跃文档；文档数超过 DOC_CONTEXT_MAX_TITLES 时只列出一部分，
+# 再按本轮输入的相关度补充最多 DOC_CONTEXT_RELEVANT_TITLES 个。
+DOC_CONTEXT_ENABLED = os.environ.get("DOC_CONTEXT_ENABLED", "true").lower() in ("1", "true", "yes")
+DOC_CONTEXT_MAX_TITLES = int(os.environ.get("DOC_CONTEXT_MAX_TITLES", "50"))
+DOC_CONTEXT_RELEVANT_TITLES = int(os.environ.get("DOC_CONTEXT_RELEVANT_TITLES", "10"))
+
+# --- 文档存储配置 ---
+# 文档在内存中以紧凑格式保存（一块 UTF-8 缓冲区 + 行偏移数组），行数很多时显著减少内存占用；
+# 设为 false 则使用普通的 list[str]。
+COMPACT_LINES_ENABLED = os.environ.get("COMPACT_LINES_ENABLED", "true").lower() in ("1", "true", "yes")
+# 不小于 MMAP_DOCUMENT_MIN_BYTES 字节的文档文件以内存映射方式只读打开，按需建立行索引（0 表示关闭）。
+MMAP_DOCUMENT_MIN_BYTES = int(os.environ.get("MMAP_DOCUMENT_MIN_BYTES", str(16 * 1024 * 1024)))
+
+# --- 重复内容检测配置 ---
+# 按内容哈希记录添加过的片段，再次添加相同内容时：off 不检测 / warn 照常添加并提示 / skip 任一文档中已有时不再添加。
+DUPLICATE_CHECK_MODE = os.environ.get("DUPLICATE_CHECK_MODE", "warn").lower()
+
+# --- 撤销/重做配置 ---
+# 每个会话最多保留 UNDO_MAX_OPERATIONS 次可撤销的修改（0 表示关闭撤销），记录的内容估算不超过 UNDO_MAX_BYTES 字节。
+UNDO_MAX_OPERATIONS = int(os.environ.get("UNDO_MAX_OPERATIONS", "20"))
+UNDO_MAX_BYTES = int(os.environ.get("UNDO_MAX_BYTES", str(16 * 1024 * 1024)))
+# 清空文档前是否要求确认；默认在可以撤销时直接清空（说"撤销"即可恢复），关闭撤销或文档超出撤销字节上限时仍要求确认。
+DELETE_CONFIRMATION = os.environ.get(
+    "DELETE_CONFIRMATION", "false" if UNDO_MAX_OPERATIONS > 0 else "true"
+).lower() in ("1", "true", "yes")
+
+# --- 文档 I/O 线程池配置 ---
+# 服务中的文档读写（加载、保存、重新加载变化的文档）在专用线程池中执行，不阻塞事件循环。
+DOC_IO_THREADS = int(os.environ.get("DOC_IO_THREADS", "4"))
+
+# --- 输入预取配置 ---
+# /api/chat/prefetch（可选，默认关闭）：用户输入过程中用本地规则猜测意图，提前加载会话、文档上下文和目标文档；
+# 每个会话每分钟最多预取 PREFETCH_MAX_PER_MINUTE 次。
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_PER_MINUTE = int(os.environ.get("PREFETCH_MAX_PER_MINUTE", "30"))
+
+# --- 批量导入导出配置 ---
+# 导入/导出按 TRANSFER_BLOCK_BYTES 字节分块读写，内存占用与归档大小无关。
+TRANSFER_BLOCK_BYTES = int(os.environ.get("TRANSFER_BLOCK_BYTES", str(1024 * 1024)))
+# /api/import 上传内容的大小上限（字节），超出时返回 413；0 表示不限制
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# --- 文档目录监听配置 ---
+# 监听 documents/ 目录中其他会话或外部工具对文档的修改，只重新加载变化的文档。
+# DOC_WATCH_BACKEND: auto（Linux 上使用 inotify，否则轮询）/ inotify / poll；轮询间隔为 DOC_WATCH_POLL_SECONDS 秒。
+DOC_WATCH_ENABLED = os.environ.get("DOC_WATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+DOC_WATCH_BACKEND = os.environ.get("DOC_WATCH_BACKEND", "auto").lower()
+DOC_WATCH_POLL_SECONDS = float(os.environ.get("DOC_WATCH_POLL_SECONDS", "2"))
+
+# --- 文档显示配置 ---
+# 聊天中"查看文档"最多直接返回的行数，更长的文档请通过 /api/documents/{title} 分页读取。
+DISPLAY_DOC_MAX_LINES = int(os.environ.get("DISPLAY_DOC_MAX_LINES", "500"))
+
+# --- 控制语句同义词配置 ---
+# 为确认/取消/退出/帮助追加同义词，格式："CONFIRM=行,可以;CANCEL=算了;EXIT=拜拜;HELP=教教我"
+CONTROL_SYNONYMS = os.environ.get("CONTROL_SYNONYMS", "")
+
+# --- 响应压缩与序列化配置 ---
+# 达到 COMPRESSION_MIN_SIZE 字节的响应按 Accept-Encoding 压缩（安装 brotli 后优先使用 br）。
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+# 聊天和文档列表接口直接序列化响应模型（跳过 FastAPI 的二次校验和 jsonable_encoder）
+FAST_JSON_ENABLED = os.environ.get("FAST_JSON_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 客户端配置只读且进程内不变，所有会话共享同一份
+_llm_client_config = None
+_llm_client_checked = False
 
 def get_llm_client():
     """
     初始化并返回LLM客户端配置信息。
     在云环境中，如果配置不完整，返回 None，让调用者处理。
+    结果会被缓存，配置缺失的警告只打印一次。
     """
+    global _llm_client_config, _llm_client_checked
+    if _llm_client_checked:
+        return _llm_client_config
+    _llm_client_checked = True
+
+    # 本地替身不需要真实的密钥
+    if LLM_BACKEND == "local":
+        _llm_client_config = {
+            "api_key": API_KEY or "local",
+            "app_id": APP_ID or "local"
+        }
+        return _llm_client_config
+
     # 再次验证配置是否完整
     if not API_KEY or not APP_ID:
         print("警告：由于 API Key 或 App ID 缺失，无法初始化LLM客户端。")
         return None
     
-    return {
+    _llm_client_config = {
         "api_key": API_KEY,
         "app_id": APP_ID
     }
+    return _llm_client_config
 
@@ -0,0 +1,158 @@
+# conversation_summary.py
+# 对话历史压缩 (Conversation Summarization)
+#
+# 对话历史超过阈值时，把较早的轮次折叠成一条摘要消息，只保留最近几轮原文，
+# 使每次发送给 LLM 的 messages 长度有上限，同时保留"之前提到的那个文档"这类指代所需的信息。
+#
+# 摘要由本地抽取式规则生成（不额外调用 LLM，不增加延迟和费用）：
+# - 提到过的文档（按最近提及排序）
+# - 较早轮次的用户原话节选及识别出的意图
+# 摘要是增量维护的：每次折叠只处理新移出窗口的轮次，两次折叠之间复用同一条摘要消息。
+
+import json
+import re
+from collections import OrderedDict, deque
+
+SUMMARY_PREFIX = "[对话摘要]"
+
+_CJK_PATTERN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def estimate_tokens(messages):
+    """粗略估算 messages 的 token 数：CJK 字符每字 1 个，其余字符每 4 个算 1 个，每条消息另加 4 个"""
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        cjk = len(_CJK_PATTERN.findall(content))
+        total += cjk + (len(content) - cjk + 3) // 4 + 4
+    return total
+
+
+def _shorten(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _parse_assistant_output(text):
+    """从助手回复中取出意图 JSON（兼容新旧两种字段名），解析失败返回空字典"""
+    start, end = (text or "").find("{"), (text or "").rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        "intent": data.get("intent") or data.get("intent_type"),
+        "doc_title": data.get("doc_title") or data.get("target_document"),
+        "content": data.get("content") or data.get("content_to_process"),
+    }
+
+
+class ConversationCompactor:
+    """
+    增量对话摘要器
+
+    Args:
+        max_messages: 历史（不含摘要）超过该条数时触发折叠
+        keep_recent: 折叠后保留的最近消息条数（原文）
+        max_turns: 摘要中最多保留的较早轮次条目数
+        max_documents: 摘要中最多列出的文档数
+    """
+
+    def __init__(self, max_messages=20, keep_recent=6, max_turns=8, max_documents=10):
+        self.max_messages = max(2, int(max_messages))
+        self.keep_recent = max(0, min(int(keep_recent), self.max_messages - 1))
+        self.max_documents = max_documents
+        self.documents = OrderedDict()         # 提到过的文档，最近提及的在最后
+        self.turns = deque(maxlen=max_turns)   # 较早轮次的要点
+        self.folded_turns = 0
+        self._summary_message = None
+
+    def reset(self):
+        self.documents.clear()
+        self.turns.clear()
+        self.folded_turns = 0
+        self._summary_message = None
+
+    def state(self, messages):
+        """摘要状态的副本（用于状态快照）；messages 为当前对话历史，用于记录第一条是否是本摘要"""
+        return {
+            "documents": list(self.documents),
+            "turns": list(self.turns),
+            "folded_turns": self.folded_turns,
+            "has_summary": bool(messages) and messages[0] is self._summary_message,
+        }
+
+    def restore(self, state, messages):
+        """从 state() 的结果恢复；messages 为一同恢复的对话历史"""
+        self.reset()
+        for title in state.get("documents", ()):
+            self.documents[title] = True
+        self.turns.extend(state.get("turns", ()))
+        self.folded_turns = state.get("folded_turns", 0)
+        if state.get("has_summary") and messages:
+            self._summary_message = messages[0]
+
+    def _fold(self, old_messages):
+        """把移出窗口的消息并入摘要状态"""
+        user_text = None
+        for message in old_messages:
+            role = message.get("role")
+            if role == "user":
+                if user_text is not None:
+                    self._add_turn(user_text, {})
+                user_text = message.get("content") or ""
+            elif role == "assistant":
+                self._add_turn(user_text, _parse_assistant_output(message.get("content")))
+                user_text = None
+        if user_text is not None:
+            self._add_turn(user_text, {})
+
+    def _add_turn(self, user_text, intent):
+        self.folded_turns += 1
+        title = intent.get("doc_title")
+        if isinstance(title, str) and title:
+            self.documents.pop(title, None)
+            self.documents[title] = True
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+        line = f"用户：\"{_shorten(user_text, 40)}\""
+        if intent.get("intent"):
+            line += f" → {intent['intent']}"
+            if title:
+                line += f"（文档：{title}）"
+            if isinstance(intent.get("content"), str) and intent["content"]:
+                line += f" 内容：{_shorten(intent['content'], 30)}"
+        self.turns.append(line)
+
+    def _render(self):
+        lines = [f"{SUMMARY_PREFIX} 以下是更早的 {self.folded_turns} 轮对话的要点，供理解指代时参考："]
+        if self.documents:
+            titles = list(self.documents)
+            lines.append(f"- 提到过的文档：{'、'.join(titles)}（最近提到的是：{titles[-1]}）")
+        if self.turns:
+            lines.append("- 较早的对话：")
+            lines.extend(f"  {i + 1}. {turn}" for i, turn in enumerate(self.turns))
+        return {"role": "system", "content": "\n".join(lines)}
+
+    def compact(self, messages):
+        """
+        需要时折叠较早的消息，返回新的 messages 列表（不需要折叠时原样返回）
+
+        第一条消息若是本摘要器生成的摘要，会被替换为更新后的摘要。
+        """
+        has_summary = bool(messages) and messages[0] is self._summary_message
+        body = messages[1:] if has_summary else messages
+        if len(body) <= self.max_messages:
+            return messages
+
+        # 从一条用户消息处切开，保证保留的部分以完整轮次开始
+        cut = len(body) - self.keep_recent
+        while cut < len(body) and body[cut].get("role") != "user":
+            cut += 1
+        self._fold(body[:cut])
+        self._summary_message = self._render()
+        return [self._summary_message] + list(body[cut:])
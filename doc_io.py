@@ -0,0 +1,103 @@
+# doc_io.py
+# 文档 I/O 线程池 (Document I/O Pool)
+#
+# DocumentManager 的读写方法都是同步的（open/read/write/os.replace），直接在 async 处理函数里调用会阻塞事件循环，
+# 磁盘或网络卷慢的时候所有会话一起变慢。这里提供一个专用的文档 I/O 线程池：
+# - run_io(fn, ...)：在 I/O 线程池中执行同步函数并等待结果，供 DocumentManager 的异步接口（aadd_content 等）
+#   和 api_server 调用；与 asyncio 默认线程池（LLM 调用等）分开，慢的 LLM 调用不会占满文档读写的线程
+# - read_text(path, fingerprint)：同一文件（同一指纹）的并发读取合并为一次，
+#   其余线程等待并共用读到的内容；例如外部修改一个文档后，各会话同时重新加载它时只读一次文件
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DOC_IO_THREADS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_io_executor():
+    """返回文档 I/O 线程池（第一次用到时创建）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, DOC_IO_THREADS), thread_name_prefix="doc-io")
+    return _executor
+
+
+async def run_io(fn, *args, **kwargs):
+    """在文档 I/O 线程池中执行 fn(*args, **kwargs)，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_io_executor():
+    """等待进行中的读写完成后关闭线程池（服务退出时调用）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+class _PendingRead:
+    __slots__ = ("done", "content", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.content = None
+        self.error = None
+
+
+class ReadCoalescer:
+    """合并对同一文件的并发读取：第一个线程读，其余等待它的结果"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.coalesced = 0
+
+    def read_text(self, path, fingerprint):
+        """
+        读取文件的全部文本（UTF-8）
+
+        Args:
+            fingerprint: 调用方看到的文件指纹；指纹相同的并发读取才会合并，文件变化后的读取不会拿到旧内容
+        """
+        key = (str(path), tuple(fingerprint))
+        with self._lock:
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = _PendingRead()
+                self.reads += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.content
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                pending.content = f.read()
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+        return pending.content
+
+    def stats(self):
+        return {"reads": self.reads, "coalesced": self.coalesced}
+
+
+# 进程内共享：不同会话的 DocumentManager 读取同一文件时也会合并
+read_coalescer = ReadCoalescer()
@@ -0,0 +1,433 @@
+# doc_transfer.py
+# 文档批量导入/导出 (Bulk Document Import/Export)
+#
+# 用法：
+#   python doc_transfer.py import notes.tar.gz [--dir documents] [--mode replace|append] [--format auto]
+#   python doc_transfer.py export backup.zip [--dir documents] [--format zip|tar|tar.gz|jsonl]
+#   （文件名为 - 时读标准输入/写标准输出；导出格式默认按文件扩展名判断）
+#
+# 支持的格式：
+# - tar（可带 gzip/bz2/xz 压缩）与 zip：每个 .txt 成员是一个文档，标题为去掉目录和扩展名的文件名
+# - JSONL：每行 {"title": ..., "content": ...}；同一标题的连续多行依次拼接（以换行分隔），
+#   导出时大文档按行边界切成多条，每条约 TRANSFER_BLOCK_BYTES 字节
+# 导入和导出都按块流式处理：导入边解包边写入文档的临时文件，导出边读文档文件边打包，
+# 内存占用与归档大小无关。导入直接经过 DocumentManager 的存储层（import_document），不经过聊天和 LLM。
+# 服务端接口见 api_server 的 POST /api/import（逐行返回进度）和 GET /api/export。
+
+import argparse
+import codecs
+import gzip
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from config import TRANSFER_BLOCK_BYTES
+
+IMPORT_FORMATS = ("auto", "jsonl", "tar", "zip")
+EXPORT_FORMATS = ("zip", "tar", "tar.gz", "jsonl")
+IMPORT_MODES = ("replace", "append")
+
+EXPORT_MEDIA_TYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+    "jsonl": "application/x-ndjson",
+}
+
+# 归档损坏、格式不符或读写失败时可能抛出的异常
+TRANSFER_ERRORS = (ValueError, OSError, tarfile.TarError, zipfile.BadZipFile)
+
+# 识别格式需要读取的文件头长度（tar 的 "ustar" 标记位于第 257 字节）
+_SNIFF_BYTES = 512
+
+
+# ============================================
+# 导入
+# ============================================
+
+def detect_format(head):
+    """按文件头判断归档格式：zip / tar（含 gzip、bz2、xz 压缩）/ jsonl"""
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if head.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")) or head[257:262] == b"ustar":
+        return "tar"
+    return "jsonl"
+
+
+def _member_title(name):
+    """归档成员对应的文档标题；不是 .txt 文档（目录、隐藏文件、其他类型）时返回 None"""
+    path = Path(name)
+    if path.suffix.lower() != ".txt" or path.name.startswith("."):
+        return None
+    return path.stem
+
+
+def _text_chunks(raw):
+    """把二进制流按块解码为文本：UTF-8（去掉 BOM），换行符统一为 '\\n'（tar 的流式成员不支持 TextIOWrapper）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    carry = ""
+    while True:
+        block = raw.read(TRANSFER_BLOCK_BYTES)
+        text = carry + decoder.decode(block, final=not block)
+        carry = ""
+        if block and text.endswith("\r"):
+            # 块末尾的 \r 可能与下一块开头的 \n 组成一个换行
+            text, carry = text[:-1], "\r"
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if text:
+            yield text
+        if not block:
+            return
+
+
+def _iter_tar(fileobj):
+    # 流式读取（"r|*"），不需要随机访问，压缩格式自动识别
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            title = _member_title(member.name) if member.isfile() else None
+            if title is None:
+                yield member.name, None
+                continue
+            yield title, _text_chunks(archive.extractfile(member))
+
+
+def _iter_zip(fileobj):
+    # zip 的目录在文件末尾，需要可随机访问的文件对象
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            name = _zip_member_name(info)
+            title = _member_title(name) if not info.is_dir() else None
+            if title is None:
+                yield name, None
+                continue
+            with archive.open(info) as raw:
+                yield title, _text_chunks(raw)
+
+
+def _zip_member_name(info):
+    """成员文件名：没有 UTF-8 标记的按 cp437 解码，很多工具实际写入的是 UTF-8，能按 UTF-8 还原时还原"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("utf-8")
+    except UnicodeError:
+        return info.filename
+
+
+def _iter_jsonl(fileobj):
+    reader = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=None)
+    records = _jsonl_records(reader)
+    state = {"next": next(records, None)}
+    while state["next"] is not None:
+        chunks = _grouped_contents(state["next"], records, state)
+        yield state["next"][0], chunks
+        # 调用方没有读完时跳过该文档剩余的记录
+        for _ in chunks:
+            pass
+
+
+def _grouped_contents(first, records, state):
+    """同一标题的连续记录拼成一个文档（以换行分隔）；遇到下一个标题时记入 state["next"] 并停下"""
+    yield first[1]
+    for record in records:
+        if record[0] != first[0]:
+            state["next"] = record
+            return
+        yield "\n"
+        yield record[1]
+    state["next"] = None
+
+
+def _jsonl_records(reader):
+    for line_number, line in enumerate(reader, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第 {line_number} 行不是有效的 JSON: {e}") from None
+        if not isinstance(data, dict) or not isinstance(data.get("title"), str) or not data["title"].strip():
+            raise ValueError(f"第 {line_number} 行缺少 title 字段")
+        content = data.get("content") or ""
+        if not isinstance(content, str):
+            raise ValueError(f"第 {line_number} 行的 content 不是字符串")
+        yield data["title"].strip(), content
+
+
+def iter_documents(fileobj, fmt="auto"):
+    """
+    逐个读出归档中的文档
+
+    Args:
+        fileobj: 可随机访问的二进制文件对象
+        fmt: auto / jsonl / tar / zip
+
+    Yields:
+        (标题, 文本块迭代器)；跳过的成员为 (成员名, None)。文本块必须在取下一个文档前读完。
+    """
+    if fmt == "auto":
+        fmt = detect_format(fileobj.read(_SNIFF_BYTES))
+        fileobj.seek(0)
+    if fmt == "tar":
+        return _iter_tar(fileobj)
+    if fmt == "zip":
+        return _iter_zip(fileobj)
+    if fmt == "jsonl":
+        return _iter_jsonl(fileobj)
+    raise ValueError(f"不支持的导入格式: {fmt}")
+
+
+def import_documents(doc_manager, fileobj, fmt="auto", mode="replace"):
+    """
+    把归档中的文档逐个写入 DocumentManager
+
+    Yields:
+        进度事件：每导入一个文档 {"event": "document", "title", "bytes", "documents", "total_bytes"}，
+        最后 {"event": "done", "documents", "total_bytes", "skipped", "elapsed_ms"}
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"不支持的导入方式: {mode}")
+    started = time.perf_counter()
+    documents = total_bytes = skipped = 0
+    for title, chunks in iter_documents(fileobj, fmt):
+        if chunks is None:
+            skipped += 1
+            continue
+        title, written = doc_manager.import_document(title, chunks, mode)
+        documents += 1
+        total_bytes += written
+        yield {"event": "document", "title": title, "bytes": written,
+               "documents": documents, "total_bytes": total_bytes}
+    # 检索索引在后台按间隔落盘，导入结束时立即保存一次
+    doc_manager.search_index.maybe_save(force=True)
+    yield {"event": "done", "documents": documents, "total_bytes": total_bytes, "skipped": skipped,
+           "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+# ============================================
+# 导出
+# ============================================
+
+class _StreamSink:
+    """只支持 write 的输出缓冲：归档写入的字节暂存在这里，由生成器及时取走（不可 seek，zip 会使用数据描述符）"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _read_blocks(f, size):
+    """读取文件的前 size 字节（导出开始时的长度），按块返回"""
+    remaining = size
+    while remaining > 0:
+        block = f.read(min(TRANSFER_BLOCK_BYTES, remaining))
+        if not block:
+            return
+        remaining -= len(block)
+        yield block
+
+
+def _line_chunks(f, size):
+    """按行边界切块读取文件的前 size 字节，返回不含分隔换行的文本块（用换行拼回即为原文）"""
+    pending = b""
+    for block in _read_blocks(f, size):
+        pending += block
+        cut = pending.rfind(b"\n")
+        if cut < 0:
+            continue
+        yield pending[:cut].decode("utf-8", "replace")
+        pending = pending[cut + 1:]
+    yield pending.decode("utf-8", "replace")
+
+
+def _open_documents(doc_manager):
+    """逐个打开要导出的文档文件：(标题, 文件名, 文件对象, 字节数, 修改时间)"""
+    for title in doc_manager.get_document_titles():
+        opened = doc_manager.open_document_file(title)
+        if opened is None:
+            continue
+        f, size = opened
+        with f:
+            yield title, Path(f.name).name, f, size, os.fstat(f.fileno()).st_mtime
+
+
+def _export_tar(doc_manager, compress):
+    sink = _StreamSink()
+    out = gzip.GzipFile(fileobj=sink, mode="wb") if compress else sink
+    offset = 0
+    for _, name, f, size, mtime in _open_documents(doc_manager):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        # PAX 格式：中文文件名以 UTF-8 写入扩展头
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        out.write(header)
+        for block in _read_blocks(f, size):
+            out.write(block)
+            yield sink.drain()
+        padding = -size % tarfile.BLOCKSIZE
+        out.write(tarfile.NUL * padding)
+        offset += len(header) + size + padding
+    # 归档结尾：两个空块，再补齐到整条记录
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(offset + end) % tarfile.RECORDSIZE
+    out.write(tarfile.NUL * end)
+    if compress:
+        out.close()
+    yield sink.drain()
+
+
+def _export_zip(doc_manager):
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for _, name, f, size, mtime in _open_documents(doc_manager):
+            info = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size
+            with archive.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                for block in _read_blocks(f, size):
+                    dest.write(block)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _export_jsonl(doc_manager):
+    for title, _, f, size, _ in _open_documents(doc_manager):
+        for content in _line_chunks(f, size):
+            yield (json.dumps({"title": title, "content": content}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def export_documents(doc_manager, fmt="zip"):
+    """
+    把所有文档打包为归档，按块返回字节（直接读文档文件，不把整篇文档或整个归档放进内存）
+
+    Args:
+        fmt: zip / tar / tar.gz / jsonl
+    """
+    if fmt == "zip":
+        chunks = _export_zip(doc_manager)
+    elif fmt in ("tar", "tar.gz"):
+        chunks = _export_tar(doc_manager, compress=fmt == "tar.gz")
+    elif fmt == "jsonl":
+        chunks = _export_jsonl(doc_manager)
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    return (chunk for chunk in chunks if chunk)
+
+
+def format_for_path(path):
+    """按文件扩展名推断导出格式，无法判断时返回 zip"""
+    name = str(path).lower()
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar.gz"
+    for fmt in ("tar", "jsonl", "zip"):
+        if name.endswith("." + fmt):
+            return fmt
+    if name.endswith(".ndjson"):
+        return "jsonl"
+    return "zip"
+
+
+# ============================================
+# 命令行
+# ============================================
+
+def _format_bytes(size):
+    return f"{size / (1024 * 1024):.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.1f} KB"
+
+
+def _run_import(doc_manager, args):
+    if args.file == "-":
+        # 标准输入不可随机访问（识别格式、zip 都需要），先按块写入临时文件
+        source = tempfile.TemporaryFile()
+        while True:
+            block = sys.stdin.buffer.read(TRANSFER_BLOCK_BYTES)
+            if not block:
+                break
+            source.write(block)
+        source.seek(0)
+    else:
+        source = open(args.file, "rb")
+    with source:
+        for event in import_documents(doc_manager, source, args.format, args.mode):
+            if event["event"] == "document":
+                print(f"[系统] 已导入 {event['documents']} 个文档（{_format_bytes(event['total_bytes'])}）："
+                      f"{event['title']}", file=sys.stderr)
+            else:
+                print(f"[系统] 导入完成：{event['documents']} 个文档，{_format_bytes(event['total_bytes'])}，"
+                      f"跳过 {event['skipped']} 个非文档成员，耗时 {event['elapsed_ms'] / 1000:.2f} 秒",
+                      file=sys.stderr)
+
+
+def _run_export(doc_manager, args):
+    fmt = args.format if args.format != "auto" else format_for_path(args.file)
+    started = time.perf_counter()
+    written = 0
+    target = sys.stdout.buffer if args.file == "-" else open(args.file, "wb")
+    try:
+        for chunk in export_documents(doc_manager, fmt):
+            target.write(chunk)
+            previous, written = written, written + len(chunk)
+            if previous // (16 * 1024 * 1024) != written // (16 * 1024 * 1024):
+                print(f"[系统] 已导出 {_format_bytes(written)}", file=sys.stderr)
+    finally:
+        if target is not sys.stdout.buffer:
+            target.close()
+    print(f"[系统] 导出完成（{fmt}）：{_format_bytes(written)}，耗时 {time.perf_counter() - started:.2f} 秒",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入/导出 SmartClip 文档")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("file", help="归档文件路径（- 表示标准输入/标准输出）")
+    parser.add_argument("--dir", default="documents", help="文档目录，默认为 documents")
+    parser.add_argument("--format", default="auto",
+                        help="导入：auto / jsonl / tar / zip；导出：zip / tar / tar.gz / jsonl（默认按扩展名）")
+    parser.add_argument("--mode", choices=IMPORT_MODES, default="replace",
+                        help="导入时覆盖同名文档 (replace) 还是追加到末尾 (append)")
+    args = parser.parse_args()
+
+    from document_manager import DocumentManager
+    from doc_watcher import stop_watchers
+    from duplicate_index import flush_duplicate_indexes
+
+    doc_manager = DocumentManager(args.dir)
+    try:
+        if args.command == "import":
+            if args.format not in IMPORT_FORMATS:
+                parser.error(f"不支持的导入格式: {args.format}")
+            _run_import(doc_manager, args)
+        else:
+            if args.format not in EXPORT_FORMATS + ("auto",):
+                parser.error(f"不支持的导出格式: {args.format}")
+            _run_export(doc_manager, args)
+    except TRANSFER_ERRORS as e:
+        print(f"[系统错误] {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        doc_manager.search_index.flush()
+        flush_duplicate_indexes()
+        stop_watchers()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# doc_versions.py
+# 文档版本号与乐观并发控制 (Document Versions)
+#
+# 每个会话有自己的 DocumentManager 和文档副本，两个会话同时修改同一文档时，后保存的会覆盖先保存的。
+# VersionRegistry 为同一目录下的每个文档维护一个单调递增的版本号（同一目录的所有 DocumentManager 共享）：
+# - DocumentManager 加载文档时记下当时的版本号，修改后保存时做"比较并交换"：
+#   版本号和文件指纹都与记下的一致才写入并把版本号加 1，否则说明文档已被其他会话或外部工具修改过
+# - 比较和写入在该文档自己的锁内完成，锁只覆盖这一步；不同文档的写入互不阻塞，也没有全局锁
+# 冲突如何处理由 DocumentManager 决定：添加内容会在最新内容上重新插入（合并），修改、移动、清空则拒绝。
+
+import os
+import threading
+
+
+class DocumentConflict(Exception):
+    """保存时发现文档已被其他会话或外部工具修改"""
+
+    def __init__(self, title):
+        super().__init__(f"文档 '{title}' 已被其他会话修改")
+        self.title = title
+
+
+class DocumentSaveError(Exception):
+    """写入文档文件失败（磁盘已满、没有权限等）：版本号没有变化，内存中的修改已丢弃"""
+
+    def __init__(self, title, error):
+        super().__init__(f"保存文档 '{title}' 失败: {error}")
+        self.title = title
+
+
+class VersionRegistry:
+    """文档标题 -> 版本号，以及每个文档的提交锁"""
+
+    def __init__(self):
+        self._versions = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self.commits = 0
+        self.conflicts = 0
+
+    def version(self, title):
+        return self._versions.get(title, 0)
+
+    def lock(self, title):
+        """返回该文档的提交锁（第一次用到时创建；可重入，冲突处理时会在锁内再次保存）"""
+        lock = self._locks.get(title)
+        if lock is None:
+            with self._registry_lock:
+                lock = self._locks.setdefault(title, threading.RLock())
+        return lock
+
+    def bump(self, title):
+        """提交成功后调用（需持有该文档的提交锁），返回新的版本号"""
+        version = self._versions.get(title, 0) + 1
+        self._versions[title] = version
+        self.commits += 1
+        return version
+
+    def stats(self):
+        return {"documents": len(self._versions), "commits": self.commits, "conflicts": self.conflicts}
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_version_registry(directory):
+    """返回目录对应的共享版本表"""
+    key = os.path.realpath(str(directory))
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = VersionRegistry()
+        return registry
@@ -0,0 +1,215 @@
+# doc_watcher.py
+# 文档目录变更监听 (Document Directory Watcher)
+#
+# 所有会话和外部工具都写同一个 documents/ 目录，而每个 DocumentManager 只在创建时加载一次文件。
+# DirectoryWatcher 在后台监听目录中 .txt 文档和 metadata.json 的变化，把变化的文件名记入一个带序号的变更日志；
+# DocumentManager 在每次读写前用自己上次看到的序号取出之后变化的文件，只重新加载这些文件。
+# - Linux 上通过 inotify（ctypes 调用 libc，无需额外依赖）接收事件
+# - 其他平台或 inotify 不可用时，退化为后台线程按间隔比较文件的修改时间和大小
+# - 变更日志有长度上限，读者落后太多（或 inotify 事件队列溢出）时会被要求整体重新扫描一次
+# 同一目录的所有 DocumentManager 共享一个监听器（get_watcher）。
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+
+METADATA_FILE = "metadata.json"
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_watched_name(name):
+    """是否是需要关注的文件：文档 (*.txt，不含以 . 开头的临时文件) 和元数据文件"""
+    return name == METADATA_FILE or (name.endswith(".txt") and not name.startswith("."))
+
+
+class DirectoryWatcher:
+    """
+    监听一个目录并维护变更日志
+
+    Args:
+        directory: 要监听的目录
+        backend: "auto"（优先 inotify）、"inotify" 或 "poll"
+        poll_seconds: 轮询模式的扫描间隔
+        journal_size: 变更日志保留的条数
+    """
+
+    def __init__(self, directory, backend="auto", poll_seconds=2.0, journal_size=1024):
+        self.directory = Path(directory)
+        self.poll_seconds = float(poll_seconds)
+        self.seq = 0                   # 最新一条变更的序号
+        self._journal = deque(maxlen=journal_size)
+        self._reset_seq = 0            # 该序号之前的变更已无法逐条追溯，读者需要整体重新扫描
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.events = 0
+        self.backend = None
+        self._fd = None
+
+        if backend in ("auto", "inotify"):
+            self._fd = self._init_inotify()
+            if self._fd is not None:
+                self.backend = "inotify"
+            elif backend == "inotify":
+                print("[系统警告] inotify 不可用，文档目录改为轮询监听")
+        if self.backend is None:
+            self.backend = "poll"
+
+    def _init_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, os.fsencode(str(self.directory)), _WATCH_MASK) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    # ---------- 变更日志 ----------
+
+    def _record(self, names):
+        with self._lock:
+            for name in names:
+                self.seq += 1
+                self._journal.append((self.seq, name))
+            self.events += len(names)
+
+    def _record_reset(self):
+        """事件丢失：之前的所有读者都需要整体重新扫描"""
+        with self._lock:
+            self.seq += 1
+            self._reset_seq = self.seq
+            self._journal.clear()
+
+    def changes_since(self, seq):
+        """
+        返回 (最新序号, 序号 seq 之后变化的文件名集合)
+
+        无法逐条追溯时（日志已被挤出或发生过事件丢失）文件名集合为 None，调用方应整体重新扫描。
+        """
+        with self._lock:
+            if seq >= self.seq:
+                return self.seq, set()
+            oldest = self._journal[0][0] if self._journal else self.seq + 1
+            if seq < self._reset_seq or seq + 1 < oldest:
+                return self.seq, None
+            return self.seq, {name for entry_seq, name in self._journal if entry_seq > seq}
+
+    # ---------- 后台线程 ----------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            target = self._run_inotify if self.backend == "inotify" else self._run_poll
+            self._thread = threading.Thread(target=target, name="doc-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([self._fd], [], [], 0.5)
+                if not readable:
+                    continue
+                data = os.read(self._fd, 65536)
+            except (OSError, ValueError):
+                if self._stop.is_set():
+                    return
+                continue
+            names = []
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    self._record_reset()
+                    names = []
+                elif is_watched_name(name):
+                    names.append(name)
+            if names:
+                # 同一批事件里重复的文件名只记一次
+                self._record(list(dict.fromkeys(names)))
+
+    def _snapshot(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if is_watched_name(entry.name):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def _run_poll(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_seconds):
+            current = self._snapshot()
+            changed = [name for name, state in current.items() if previous.get(name) != state]
+            changed += [name for name in previous if name not in current]
+            if changed:
+                self._record(changed)
+            previous = current
+
+    def stats(self):
+        return {"directory": str(self.directory), "backend": self.backend, "seq": self.seq, "events": self.events}
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(directory, backend="auto", poll_seconds=2.0):
+    """返回目录对应的共享监听器（首次调用时创建并启动）"""
+    key = os.path.realpath(str(directory))
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            watcher = DirectoryWatcher(directory, backend, poll_seconds)
+            watcher.start()
+            _watchers[key] = watcher
+        return watcher
+
+
+def stop_watchers():
+    """停止所有监听器（服务退出时调用）"""
+    with _watchers_lock:
+        watchers = list(_watchers.values())
+        _watchers.clear()
+    for watcher in watchers:
+        watcher.stop()
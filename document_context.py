@@ -0,0 +1,111 @@
+# document_context.py
+# 文档上下文注入 (Document Context Injection)
+#
+# 每次调用 LLM 时，在 messages 最前面放一条 system 消息，告诉模型当前有哪些文档、活跃文档是哪个，
+# 避免模型猜错文档名、多出一轮纠正对话。
+#
+# - 这条消息按（文档集合版本, 活跃文档）缓存，只有文档增删或切换活跃文档时才重建；
+#   内容不随用户输入变化，保证请求前缀稳定，便于服务商侧的前缀缓存命中
+# - 文档很多时只列出前 max_titles 个（活跃文档总在其中），
+#   再根据本轮输入挑出最相关的若干个未列出的文档，作为单独一条消息放在用户输入之前
+
+from search_index import tokenize
+
+CONTEXT_PREFIX = "[文档上下文]"
+
+
+def _score_title(title, title_terms, query_terms, user_input):
+    """标题与输入的相关度：共享的索引词数，标题整体出现在输入中额外加分"""
+    score = len(query_terms.intersection(title_terms))
+    if title and title in user_input:
+        score += 10
+    return score
+
+
+class DocumentContextBuilder:
+    """
+    为一个 DocumentManager 生成文档上下文消息
+
+    Args:
+        max_titles: 稳定前缀中最多列出的文档数
+        relevant_titles: 文档数超过 max_titles 时，额外按相关度补充的文档数
+    """
+
+    def __init__(self, max_titles=50, relevant_titles=10):
+        self.max_titles = max(1, int(max_titles))
+        self.relevant_titles = max(0, int(relevant_titles))
+        self.version = 0          # 上下文消息每重建一次加 1
+        self.rebuilds = 0
+        self.cache_hits = 0
+        self._cache_key = None
+        self._message = None
+        self._listed = frozenset()
+        self._unlisted = []       # [(title, 标题的索引词集合)]，重建时预先切分
+
+    def _rebuild(self, doc_manager):
+        titles = doc_manager.get_document_titles()
+        active = doc_manager.active_doc_title
+        if len(titles) <= self.max_titles:
+            listed = titles
+        else:
+            listed = [active] + [title for title in titles if title != active][:self.max_titles - 1]
+        self._listed = frozenset(listed)
+        self._unlisted = [(title, frozenset(tokenize(title))) for title in titles if title not in self._listed]
+
+        lines = [f"{CONTEXT_PREFIX} 以下是系统中真实存在的文档，识别意图时请使用这些准确的文档标题。"]
+        lines.append(f"当前活跃文档：{active}")
+        if self._unlisted:
+            lines.append(f"共有 {len(titles)} 个文档，以下列出其中 {len(listed)} 个：")
+        else:
+            lines.append(f"全部文档（{len(titles)} 个）：")
+        lines.append("、".join(listed))
+        self._message = {"role": "system", "content": "\n".join(lines)}
+        self.version += 1
+        self.rebuilds += 1
+
+    def context_message(self, doc_manager):
+        """返回缓存的上下文消息，文档集合或活跃文档变化时重建"""
+        # 文档集合可能已被其他会话或外部工具修改，先应用目录变更再判断缓存是否失效
+        doc_manager.refresh()
+        key = (doc_manager.titles_version, doc_manager.active_doc_title)
+        if key != self._cache_key:
+            self._rebuild(doc_manager)
+            self._cache_key = key
+        else:
+            self.cache_hits += 1
+        return self._message
+
+    def relevant_message(self, user_input):
+        """
+        文档数超过 max_titles 时，返回与本轮输入最相关、但没有出现在上下文消息中的文档；
+        没有这样的文档时返回 None。需要先调用 context_message()。
+        """
+        if not self._unlisted or not self.relevant_titles:
+            return None
+        query_terms = set(tokenize(user_input))
+        scored = []
+        for title, title_terms in self._unlisted:
+            score = _score_title(title, title_terms, query_terms, user_input)
+            if score > 0:
+                scored.append((score, title))
+        if not scored:
+            return None
+        scored.sort(key=lambda item: -item[0])
+        titles = [title for _, title in scored[:self.relevant_titles]]
+        return {"role": "system", "content": f"{CONTEXT_PREFIX} 与本条输入可能相关的其他文档：{'、'.join(titles)}"}
+
+    def build_messages(self, doc_manager, history):
+        """
+        组装发送给 LLM 的 messages：[上下文] + 历史 (+ 相关文档提示) + 本轮用户输入
+
+        history 的最后一条应为本轮用户输入；history 本身不会被修改。
+        """
+        messages = [self.context_message(doc_manager)]
+        if history and history[-1].get("role") == "user":
+            hint = self.relevant_message(history[-1].get("content") or "")
+            if hint is not None:
+                return messages + history[:-1] + [hint, history[-1]]
+        return messages + history
+
+    def stats(self):
+        return {"version": self.version, "rebuilds": self.rebuilds, "cache_hits": self.cache_hits}
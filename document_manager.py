@@ -2,7 +2,40 @@
 # 本地文本文件存储系统 (Local Text File Storage System)
 
 import json
+import os
+import shutil
+import threading
+from itertools import islice
 from pathlib import Path
+from search_index import get_search_index, tokenize
+from compact_lines import CompactLines
+from mapped_document import MappedLines
+from doc_watcher import METADATA_FILE, get_watcher
+from duplicate_index import get_duplicate_index, normalize_block
+from doc_versions import DocumentConflict, DocumentSaveError, get_version_registry
+from operation_log import Operation, OperationLog, apply_splices
+from doc_io import read_coalescer, run_io
+from config import COMPACT_LINES_ENABLED, MMAP_DOCUMENT_MIN_BYTES, DUPLICATE_CHECK_MODE
+from config import UNDO_MAX_OPERATIONS, UNDO_MAX_BYTES, TRANSFER_BLOCK_BYTES
+from config import DOC_WATCH_ENABLED, DOC_WATCH_BACKEND, DOC_WATCH_POLL_SECONDS
+
+# 从状态快照恢复的文档副本：目录 -> {文件名: (文件指纹, 紧凑存储的数据)}
+_warm_documents = {}
+
+
+def preload_documents(storage_dir, documents):
+    """
+    登记某个目录的文档预热副本（见 state_snapshot）
+    
+    之后创建的 DocumentManager 加载文档时，文件指纹一致的直接从副本复制，不再读取和切分文件。
+    """
+    _warm_documents[os.path.realpath(str(storage_dir))] = dict(documents)
+
+
+def list_document_titles(storage_dir="documents"):
+    """列出目录中的文档标题（只看文件名，不加载文档内容，也不建立检索索引）"""
+    return [file_path.stem for file_path in Path(storage_dir).glob("*.txt")]
+
 
 class DocumentManager:
     def __init__(self, storage_dir="documents"):
@@ -17,18 +50,52 @@ class DocumentManager:
         self.storage_dir.mkdir(exist_ok=True)  # 如果目录不存在则创建
         
         # 元数据文件，记录文档列表和当前活跃文档
-        self.metadata_file = self.storage_dir / "metadata.json"
+        self.metadata_file = self.storage_dir / METADATA_FILE
+        
+        # 目录变更监听：记下加载前的序号，加载期间发生的变化会在第一次读写时补上
+        self._watcher = None
+        self._watch_seq = 0
+        if DOC_WATCH_ENABLED:
+            self._watcher = get_watcher(self.storage_dir, DOC_WATCH_BACKEND, DOC_WATCH_POLL_SECONDS)
+            self._watch_seq = self._watcher.seq
+        self._refresh_lock = threading.Lock()
+        # 本实例最后一次加载/保存时各文档文件的指纹，用于忽略自己写入引起的变更
+        self._file_states = {}
+        self._warm = _warm_documents.get(os.path.realpath(str(self.storage_dir)), {})
+        # 文档版本号（同一目录共享）与本实例加载/保存时看到的版本，保存时比较并交换
+        self._versions = get_version_registry(self.storage_dir)
+        self._doc_versions = {}
+        # 本实例所做修改的撤销/重做记录
+        self.operation_log = OperationLog(UNDO_MAX_OPERATIONS, UNDO_MAX_BYTES)
+        # 全文检索索引（同一目录共享），持久化在存储目录下，只索引指纹有变化的文档
+        self.search_index = get_search_index(self.storage_dir)
         
         # 从本地文件加载文档
         self.documents = {}
         self.active_doc_title = "默认文档"
+        # 文档集合版本：新建/删除文档时加 1，供文档上下文等缓存判断是否失效
+        self.titles_version = 0
         self._load_documents()
         
         # 如果没有任何文档，创建默认文档
         if not self.documents:
-            self.documents["默认文档"] = ["这是您的默认文档，可以随时添加内容。"]
-            self._save_document("默认文档")
-            self._save_metadata()
+            self.documents["默认文档"] = self._new_document(["这是您的默认文档，可以随时添加内容。"])
+            try:
+                saved = self._save_document("默认文档")
+            except DocumentSaveError:
+                # 目录不可写：默认文档先只保留在内存中
+                self.documents["默认文档"] = self._new_document(["这是您的默认文档，可以随时添加内容。"])
+                saved = None
+            if saved:
+                self._save_metadata()
+            elif saved is False:
+                # 其他会话刚刚创建了文档，改为加载它们
+                self.documents.clear()
+                self._load_documents()
+        
+        # 重复内容索引：用于发现重复添加的内容（同一目录的会话共享）
+        self.duplicate_index = get_duplicate_index(self.storage_dir) if DUPLICATE_CHECK_MODE != "off" else None
+        self._sync_search_index()
 
     def _get_document_file(self, title):
         """获取文档对应的文件路径"""
@@ -38,94 +105,356 @@ class DocumentManager:
             safe_title = "untitled"
         return self.storage_dir / f"{safe_title}.txt"
     
+    def _new_document(self, lines=()):
+        """创建文档的行容器：默认为紧凑存储，关闭时为普通列表"""
+        return CompactLines(lines) if COMPACT_LINES_ENABLED else list(lines)
+    
+    def _writable(self, title):
+        """返回可修改的文档；内存映射的只读文档在第一次修改前读入内存"""
+        doc = self.documents[title]
+        if isinstance(doc, MappedLines):
+            doc = doc.to_compact() if COMPACT_LINES_ENABLED else list(doc)
+            self.documents[title] = doc
+        return doc
+    
     def _load_documents(self):
         """从本地文件加载所有文档"""
         # 加载元数据
         if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                    self.active_doc_title = metadata.get("active_doc_title", "默认文档")
-            except Exception as e:
-                print(f"[系统警告] 加载元数据失败: {e}")
+            self._load_metadata()
         
         # 加载所有文档文件
         for file_path in self.storage_dir.glob("*.txt"):
             title = file_path.stem  # 文件名（不含扩展名）
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    # 按行分割内容，保留空行
-                    if content:
-                        self.documents[title] = [line for line in content.split('\n')]
-                    else:
-                        self.documents[title] = []
+                # 先记版本号再读文件：读取期间有新的提交时，保存时会发现版本不一致
+                self._doc_versions[title] = self._versions.version(title)
+                self._file_states[title] = self._stat_fingerprint(file_path)
+                self.documents[title] = self._read_document_file(file_path, self._file_states[title])
             except Exception as e:
                 print(f"[系统警告] 加载文档 '{title}' 失败: {e}")
         
         # 确保活跃文档存在
+        self._ensure_active_document()
+    
+    def _load_metadata(self):
+        """从元数据文件读取活跃文档"""
+        try:
+            with open(self.metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+                self.active_doc_title = metadata.get("active_doc_title", "默认文档")
+        except Exception as e:
+            print(f"[系统警告] 加载元数据失败: {e}")
+    
+    def _ensure_active_document(self):
         if self.active_doc_title not in self.documents and self.documents:
             self.active_doc_title = list(self.documents.keys())[0]
     
-    def _save_document(self, title):
-        """将文档保存到本地文件"""
-        if title not in self.documents:
+    def _read_document_file(self, file_path, fingerprint=None):
+        """读取一个文档文件，返回行容器（fingerprint 为文件当前的指纹，与预热副本一致时直接复制副本）"""
+        # 大文件只做内存映射，按需读取
+        if MMAP_DOCUMENT_MIN_BYTES > 0 and file_path.stat().st_size >= MMAP_DOCUMENT_MIN_BYTES:
+            return MappedLines(file_path)
+        warm = self._warm.get(file_path.name)
+        if warm is not None and fingerprint is not None and warm[0] == fingerprint:
+            doc = CompactLines._restore(*warm[1])
+            return doc if COMPACT_LINES_ENABLED else list(doc)
+        if fingerprint is not None:
+            # 多个会话同时加载同一文件（例如外部修改后各自重新加载）时只读一次
+            content = read_coalescer.read_text(file_path, fingerprint).strip()
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+        # 按行分割内容，保留空行
+        if COMPACT_LINES_ENABLED:
+            return CompactLines.from_text(content)
+        if content:
+            return [line for line in content.split('\n')]
+        return []
+    
+    def refresh(self):
+        """
+        应用目录中自上次刷新以来的文件变更（其他会话或外部工具写入的）
+        
+        只重新加载变化了的文档，并同步更新检索索引和文档集合版本；
+        由各个读写方法在开始时调用，没有变更时只是一次整数比较。
+        """
+        if self._watcher is None or self._watcher.seq == self._watch_seq:
             return
+        with self._refresh_lock:
+            seq, names = self._watcher.changes_since(self._watch_seq)
+            if seq == self._watch_seq:
+                return
+            self._watch_seq = seq
+            if names is None:
+                # 变更日志已无法追溯：检查目录中的全部文档（未变化的文件会按指纹跳过）
+                names = {path.name for path in self.storage_dir.glob("*.txt")}
+                names.update(self._get_document_file(title).name for title in self.documents)
+                names.add(METADATA_FILE)
+            
+            changed = False
+            for name in sorted(names):
+                if name != METADATA_FILE:
+                    changed = self._reload_document(name) or changed
+            if METADATA_FILE in names and self.metadata_file.exists():
+                self._load_metadata()
+            self._ensure_active_document()
+            if changed:
+                self.search_index.maybe_save()
+    
+    def _title_for_file(self, name):
+        """文件名对应的文档标题：优先匹配已加载的文档（标题可能含有文件名中被去掉的字符）"""
+        for title in self.documents:
+            if self._get_document_file(title).name == name:
+                return title
+        return Path(name).stem
+    
+    def _reload_document(self, name):
+        """重新加载一个发生变化的文档文件，返回文档是否有变化"""
+        title = self._title_for_file(name)
+        # 持有该文档的提交锁读取：不会读到本进程其他实例写了一半的追加，版本号与内容一致
+        with self._versions.lock(title):
+            return self._reload_locked(title, self.storage_dir / name)
+    
+    def _reload_locked(self, title, file_path):
+        version = self._versions.version(title)
+        fingerprint = self._stat_fingerprint(file_path)
+        if fingerprint is None:
+            # 文件已被删除
+            if title not in self.documents:
+                return False
+            del self.documents[title]
+            self._file_states.pop(title, None)
+            self._doc_versions.pop(title, None)
+            self.titles_version += 1
+            self.search_index.remove_document(title)
+            if self.duplicate_index is not None:
+                self.duplicate_index.forget_document(title)
+            self.operation_log.forget_document(title)
+            print(f"[系统] 文档 '{title}' 已在磁盘上被删除。")
+            return True
+        if self._file_states.get(title) == fingerprint:
+            # 本实例自己写入的，或者内容没有变化
+            self._doc_versions[title] = max(version, self._doc_versions.get(title, 0))
+            return False
+        try:
+            doc = self._read_document_file(file_path, fingerprint)
+        except Exception as e:
+            print(f"[系统警告] 重新加载文档 '{title}' 失败: {e}")
+            return False
+        if title not in self.documents:
+            self.titles_version += 1
+        self.documents[title] = doc
+        self._file_states[title] = fingerprint
+        self._doc_versions[title] = version
+        # 内存映射的文档等到第一次检索时再索引（见 _index_mapped_documents）
+        if not isinstance(doc, MappedLines) and not self.search_index.is_current(title, fingerprint):
+            self.search_index.index_document(title, doc, fingerprint)
+        return True
+    
+    def _reload_stale(self, title):
+        """保存冲突后从磁盘重新加载文档，丢弃本实例未保存的修改"""
+        # 清掉记下的指纹，强制按磁盘上的文件重新加载（文件已不存在时文档会被移除）
+        self._file_states.pop(title, None)
+        self._reload_document(self._get_document_file(title).name)
+        self.search_index.maybe_save()
+    
+    def _save_document(self, title, appended_from=None):
+        """
+        将文档保存到本地文件（比较并交换）
+        
+        文档的版本号和文件指纹都与本实例加载/上次保存时一致才写入，写入后版本号加 1；
+        比较和写入在该文档的提交锁内完成，不同文档的保存互不阻塞。
+        
+        Args:
+            appended_from: 只在末尾追加了行时传入追加前的行数；文件仍是本实例上次写入的内容时只追加新行
+        
+        Returns:
+            False 表示文档已被其他会话或外部工具修改过，本次修改没有写入
+        
+        Raises:
+            DocumentSaveError: 写入文件失败；版本号不变，文档已按磁盘上的内容重新加载
+        """
+        if title not in self.documents:
+            return True
         
         file_path = self._get_document_file(title)
+        doc = self.documents[title]
+        with self._versions.lock(title):
+            previous = self._file_states.get(title)
+            if (self._versions.version(title) != self._doc_versions.get(title, 0)
+                    or self._stat_fingerprint(file_path) != previous):
+                self._versions.conflicts += 1
+                return False
+            if appended_from is None or not self._append_to_file(title, file_path, doc, appended_from):
+                try:
+                    # 将内容列表写入文件，每行一个（紧凑存储的缓冲区本身就是这个格式）
+                    self._write_file_atomic(file_path, doc.text() if isinstance(doc, CompactLines) else '\n'.join(doc))
+                    self._file_states[title] = self._stat_fingerprint(file_path)
+                except Exception as e:
+                    print(f"[系统错误] 保存文档 '{title}' 失败: {e}")
+                    # 文件是原子替换的，磁盘上仍是修改前的内容：丢弃内存中的修改，不增加版本号
+                    self._reload_stale(title)
+                    raise DocumentSaveError(title, e) from e
+                appended_from = None
+            self._doc_versions[title] = self._versions.bump(title)
+            # 在提交锁内更新共享索引：索引与刚写入的文件内容一致，不会被其他实例随后的提交插进来
+            self._update_search_index(title, previous, appended_from)
+        self.search_index.maybe_save()
+        return True
+    
+    def document_version(self, title):
+        """本实例持有的文档内容对应的版本号"""
+        self.refresh()
+        return self._doc_versions.get(title, 0)
+    
+    def _commit(self, title):
+        """保存修改后的文档；发现并发修改时重新加载最新内容并拒绝本次修改"""
+        if not self._save_document(title):
+            self._reload_stale(title)
+            print(f"[系统] 文档 '{title}' 已被其他会话修改，本次修改未保存。")
+            raise DocumentConflict(title)
+    
+    def _append_to_file(self, title, file_path, doc, appended_from):
+        """把第 appended_from 行之后的新行追加到文件末尾，不能安全追加时返回 False（改为整篇重写）"""
+        if appended_from <= 0:
+            return False
+        if appended_from >= len(doc):
+            return True
+        fingerprint = self._stat_fingerprint(file_path)
+        if fingerprint is None or fingerprint != self._file_states.get(title):
+            return False
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                # 将内容列表写入文件，每行一个
-                f.write('\n'.join(self.documents[title]))
+            with open(file_path, 'rb+') as f:
+                # 文件末尾有空白时（例如外部工具写入的换行），加载时已被去掉，直接追加会多出空行
+                f.seek(-1, os.SEEK_END)
+                if f.read(1).isspace():
+                    return False
+                f.write(('\n' + '\n'.join(doc[appended_from:])).encode('utf-8'))
+            self._file_states[title] = self._stat_fingerprint(file_path)
+            return True
         except Exception as e:
-            print(f"[系统错误] 保存文档 '{title}' 失败: {e}")
+            print(f"[系统警告] 追加写入文档 '{title}' 失败，改为整篇保存: {e}")
+            return False
     
+    def _write_file_atomic(self, file_path, text):
+        """
+        先写临时文件再原子替换：其他实例映射着的旧文件不会被截断，
+        其他实例和目录监听器也不会读到写了一半的文件
+        """
+        temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    @staticmethod
+    def _stat_fingerprint(file_path):
+        """文件的指纹（修改时间 + 大小），文件不存在时返回 None"""
+        try:
+            stat = file_path.stat()
+            return [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            return None
+    
+    def _file_fingerprint(self, title):
+        """文档文件的指纹（修改时间 + 大小），用于判断持久化的索引是否过期"""
+        return self._stat_fingerprint(self._get_document_file(title))
+
+    def _sync_search_index(self):
+        """
+        让共享的检索索引覆盖本实例加载的文档
+        
+        第一个实例从文件恢复索引；之后只重建指纹与已索引内容不一致的文档，
+        其他会话已经索引过的文档不会重复索引。
+        内存映射的大文档不在这里索引：索引要扫描并解码整个文件，打开时按需建立行索引就没有意义了，
+        改为第一次检索时再索引。
+        """
+        restored = self.search_index.load(dict(self._file_states))
+        for title, lines in list(self.documents.items()):
+            if title not in restored and not isinstance(lines, MappedLines):
+                self._index_if_stale(title, lines)
+        for title in self.search_index.titles():
+            if title not in self.documents and self._file_fingerprint(title) is None:
+                self.search_index.remove_document(title)
+        # 有文档被重建时立即在后台落盘，下次启动可以直接加载
+        self.search_index.maybe_save(force=True)
+
+    def _index_if_stale(self, title, lines):
+        """已索引的内容与本实例加载的文件指纹不一致时重建该文档的索引"""
+        fingerprint = self._file_states.get(title)
+        if self.search_index.is_current(title, fingerprint):
+            return
+        with self._versions.lock(title):
+            # 持锁再检查一次：其他实例可能刚刚索引完同一文档
+            if not self.search_index.is_current(title, fingerprint):
+                self.search_index.index_document(title, lines, fingerprint)
+
+    def _index_mapped_documents(self):
+        """检索前补上尚未索引的内存映射文档（每个文件版本只索引一次，所有会话共享）"""
+        indexed = False
+        for title, doc in list(self.documents.items()):
+            if isinstance(doc, MappedLines) and not self.search_index.is_current(title, self._file_states.get(title)):
+                self._index_if_stale(title, doc)
+                indexed = True
+        if indexed:
+            self.search_index.maybe_save()
+
+    def _update_search_index(self, title, previous, appended_from=None):
+        """
+        文档保存后更新检索索引（调用方持有该文档的提交锁）
+        
+        Args:
+            previous: 保存前的文件指纹
+            appended_from: 只在文件末尾追加了行时传入追加前的行数；
+                索引正好对应保存前的文件时只索引新增的行
+        """
+        doc = self.documents.get(title, [])
+        fingerprint = self._file_states.get(title)
+        if appended_from is not None and self.search_index.is_current(title, previous):
+            self.search_index.append_lines(title, appended_from, doc[appended_from:], fingerprint)
+        else:
+            self.search_index.index_document(title, doc, fingerprint)
+
     def _save_metadata(self):
         """保存元数据（活跃文档等）"""
         try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "active_doc_title": self.active_doc_title
-                }, f, ensure_ascii=False, indent=2)
+            self._write_file_atomic(self.metadata_file, json.dumps({
+                "active_doc_title": self.active_doc_title
+            }, ensure_ascii=False, indent=2))
         except Exception as e:
             print(f"[系统警告] 保存元数据失败: {e}")
 
     def get_document_titles(self):
         """获取所有文档标题"""
+        self.refresh()
         return list(self.documents.keys())
 
     def get_document(self, title):
         """获取指定标题的文档内容"""
+        self.refresh()
         return self.documents.get(title)
 
     def set_active_document(self, title):
         """设置当前活跃文档"""
+        self.refresh()
         if title in self.documents:
             self.active_doc_title = title
             self._save_metadata()
             return True
         return False
 
-    def add_content(self, title, content, position="end"):
+    def _normalize_position(self, position):
         """
-        基础文字内容添加和极简文档定位。
-        支持定位到文档标题、开头、结尾。
+        规范化位置参数：None/空/非字符串一律视为 "end"，并转换为小写
+        start/end 以外的值表示"某个段落之后"
         """
-        if title not in self.documents:
-            self.documents[title] = []
-            print(f"[系统] 文档 '{title}' 不存在，已为您创建。")
-
-        doc = self.documents[title]
-        
-        # 处理内容：如果包含换行符，按行分割添加到文档
-        # 这样可以保留多行内容的格式
-        content_lines = content.split('\n') if '\n' in content else [content]
-        # 过滤掉空行（保留内容的原始格式，但去掉首尾空行）
-        while content_lines and not content_lines[0].strip():
-            content_lines.pop(0)
-        while content_lines and not content_lines[-1].strip():
-            content_lines.pop()
-        
         # 处理position为None或非字符串的情况，默认为"end"
         # 确保 position 始终是字符串，避免调用 .lower() 时出错
         if position is None:
@@ -144,74 +473,507 @@ class DocumentManager:
         
         # 转换为小写（此时 position_str 一定是字符串）
         try:
-            position = position_str.lower()
+            return position_str.lower()
         except (AttributeError, TypeError):
             # 理论上不应该到这里，但为了安全还是加上
-            position = "end"
+            return "end"
+
+    def _find_line(self, doc, text):
+        """返回第一行包含 text 的行号，找不到返回 -1"""
+        for i, line in enumerate(doc):
+            if text in line:
+                return i
+        return -1
+
+    def _find_block(self, doc, lines):
+        """返回连续若干行（忽略首尾空白）与 lines 相同的起始行号，找不到返回 -1"""
+        wanted = [line.strip() for line in lines]
+        for i, line in enumerate(doc):
+            if line.strip() == wanted[0] and [l.strip() for l in doc[i:i + len(wanted)]] == wanted:
+                return i
+        return -1
+
+    def find_duplicates(self, content, limit=5):
+        """
+        查找已经存在于文档中的相同内容（先按哈希查重复内容索引，再到文档中核实位置）
+        
+        Returns:
+            [{"title", "line_number", "whole"}]：whole 为 True 表示整块内容重复，否则是其中某一行重复；
+            未启用重复内容索引时返回空列表
+        """
+        lines = normalize_block(content)
+        if self.duplicate_index is None or not lines:
+            return []
+        self.refresh()
+        found = []
+        for digest, chunk_lines, whole in self.duplicate_index.chunks(lines):
+            for title in self.duplicate_index.lookup(digest):
+                doc = self.documents.get(title)
+                index = self._find_block(doc, chunk_lines) if doc is not None else -1
+                if index < 0:
+                    # 记录已过期：文档被修改、移动或删除过
+                    self.duplicate_index.discard(digest, title)
+                    continue
+                self.duplicate_index.hits += 1
+                found.append({"title": title, "line_number": index + 1, "whole": whole})
+                if len(found) >= limit:
+                    return found
+            if found and whole:
+                # 整块重复时不再逐行报告
+                return found
+        return found
+
+    def _remember_content(self, title, lines):
+        """记录新添加的内容出现在哪个文档中"""
+        if self.duplicate_index is None or not lines:
+            return
+        for digest, _, _ in self.duplicate_index.chunks(lines):
+            self.duplicate_index.add(digest, title)
+        self.duplicate_index.maybe_save()
+
+    def add_content(self, title, content, position="end"):
+        """
+        基础文字内容添加和极简文档定位。
+        支持定位到文档标题、开头、结尾。
+        
+        保存时发现文档已被其他会话修改，会在最新内容上重新插入（添加内容之间不会互相覆盖）。
+        """
+        self.refresh()
+        # 处理内容：如果包含换行符，按行分割添加到文档
+        # 这样可以保留多行内容的格式
+        content_lines = content.split('\n') if '\n' in content else [content]
+        # 过滤掉空行（保留内容的原始格式，但去掉首尾空行）
+        while content_lines and not content_lines[0].strip():
+            content_lines.pop(0)
+        while content_lines and not content_lines[-1].strip():
+            content_lines.pop()
+        position = self._normalize_position(position)
+        
+        pos_desc, appended_from, start = self._insert_content(title, content_lines, position)
+        # 保存到本地文件（只在末尾追加时直接追加到文件，不重写整篇）
+        if not self._save_document(title, appended_from):
+            # 冲突：持有该文档的提交锁重新加载并插入，这期间其他会话的提交不会再插进来
+            with self._versions.lock(title):
+                print(f"[系统] 文档 '{title}' 已被其他会话修改，在最新内容上重新添加。")
+                self._reload_stale(title)
+                pos_desc, appended_from, start = self._insert_content(title, content_lines, position)
+                if not self._save_document(title, appended_from):
+                    # 只有其他进程或外部工具同时在写这个文件时才会再次冲突
+                    self._reload_stale(title)
+                    raise DocumentConflict(title)
+        
+        self._remember_content(title, content_lines)
+        self.operation_log.record(Operation(title, f"向文档 '{title}' 添加的内容", [(start, [], content_lines)]))
+        
+        print(f"[系统] 内容已成功添加到文档 '{title}' 的 {pos_desc}。")
+        return True
+    
+    def _insert_content(self, title, content_lines, position):
+        """把内容插入到文档（文档不存在时创建），返回 (位置描述, 插入前的行数, 插入的行号)"""
+        if title not in self.documents:
+            self.documents[title] = self._new_document()
+            self.titles_version += 1
+            print(f"[系统] 文档 '{title}' 不存在，已为您创建。")
+        return self._insert_lines(self._writable(title), content_lines, position)
+
+    def _insert_lines(self, doc, content_lines, position):
+        """
+        按位置插入内容
+        
+        Returns:
+            (位置描述, 插入前的行数, 插入的行号)；不是在末尾追加时第二项为 None（不能增量更新检索索引）
+        """
+        # 追加前的行数：只在末尾追加时可以增量更新检索索引
+        appended_from = len(doc)
         
         # 简化定位逻辑：只处理 start/end，其他视为 end
+        # 多行内容一次性插入/追加（紧凑存储每次插入都要移动后面的内容，不能逐行插入）
         if position == "start":
-            # 插入到开头（注意：列表在前面，所以从后往前插入）
-            for line in reversed(content_lines):
-                doc.insert(0, line)
-            pos_desc = "开头"
-        elif position == "end":
+            # 插入到开头
+            doc[0:0] = content_lines
+            return "开头", None, 0
+        if position == "end":
             # 追加到结尾
-            for line in content_lines:
-                doc.append(line)
-            pos_desc = "结尾"
+            doc.extend(content_lines)
+            return "结尾", appended_from, appended_from
+        # 尝试按内容定位（MVP简化版）
+        try:
+            index = -1
+            for i, line in enumerate(doc):
+                if position in line:
+                    index = i
+                    break
+        
+            if index != -1:
+                # 插入到指定位置之后
+                doc[index + 1:index + 1] = content_lines
+                return f"'{position}' 之后", None, index + 1
+            # 未找到位置，追加到结尾
+            doc.extend(content_lines)
+            return "结尾 (未找到指定位置)", appended_from, appended_from
+        except Exception:
+            # 定位失败，追加到结尾
+            doc.extend(content_lines)
+            return "结尾 (定位失败)", appended_from, appended_from
+        
+    def edit_content(self, title, target, new_content):
+        """
+        修改文档内容：把第一处包含 target 的文字替换为 new_content
+        
+        Returns:
+            是否找到并修改成功
+        """
+        self.refresh()
+        doc = self.documents.get(title)
+        if doc is None:
+            print(f"[系统] 文档 '{title}' 不存在。")
+            return False
+        
+        index = self._find_line(doc, target)
+        if index == -1:
+            print(f"[系统] 在文档 '{title}' 中未找到 '{target}'。")
+            return False
+        
+        # 替换后的内容可能包含换行，按行展开
+        doc = self._writable(title)
+        old_line = doc[index]
+        new_lines = old_line.replace(target, new_content, 1).split('\n')
+        doc[index:index + 1] = new_lines
+        self._commit(title)
+        self.operation_log.record(Operation(title, f"对文档 '{title}' 第 {index + 1} 行的修改",
+                                            [(index, [old_line], new_lines)]))
+        print(f"[系统] 文档 '{title}' 第 {index + 1} 行已修改。")
+        return True
+
+    def move_content(self, title, content, position="end"):
+        """
+        移动文档内容：把第一行包含 content 的行移动到 start/end 或某个段落之后
+        
+        Returns:
+            是否移动成功
+        """
+        self.refresh()
+        doc = self.documents.get(title)
+        if doc is None:
+            print(f"[系统] 文档 '{title}' 不存在。")
+            return False
+        
+        index = self._find_line(doc, content)
+        if index == -1:
+            print(f"[系统] 在文档 '{title}' 中未找到 '{content}'。")
+            return False
+        
+        position = self._normalize_position(position)
+        doc = self._writable(title)
+        line = doc.pop(index)
+        if position == "start":
+            insert_at = 0
+        elif position == "end":
+            insert_at = len(doc)
         else:
-            # 尝试按内容定位（MVP简化版）
-            try:
-                index = -1
-                for i, line in enumerate(doc):
-                    if position in line:
-                        index = i
-                        break
-                
-                if index != -1:
-                    # 插入到指定位置之后
-                    for i, line in enumerate(content_lines):
-                        doc.insert(index + 1 + i, line)
-                    pos_desc = f"'{position}' 之后"
-                else:
-                    # 未找到位置，追加到结尾
-                    for line in content_lines:
-                        doc.append(line)
-                    pos_desc = "结尾 (未找到指定位置)"
-            except Exception:
-                # 定位失败，追加到结尾
-                for line in content_lines:
-                    doc.append(line)
-                pos_desc = "结尾 (定位失败)"
-
-        # 保存到本地文件
-        self._save_document(title)
+            anchor = self._find_line(doc, position)
+            if anchor == -1:
+                # 未找到目标位置，恢复原状
+                doc.insert(index, line)
+                print(f"[系统] 在文档 '{title}' 中未找到目标位置 '{position}'。")
+                return False
+            insert_at = anchor + 1
+        doc.insert(insert_at, line)
         
-        print(f"[系统] 内容已成功添加到文档 '{title}' 的 {pos_desc}。")
+        self._commit(title)
+        self.operation_log.record(Operation(title, f"在文档 '{title}' 中的移动",
+                                            [(index, [line], []), (insert_at, [], [line])]))
+        print(f"[系统] 文档 '{title}' 中的内容已移动。")
         return True
 
+    def can_undo_clear(self, title):
+        """清空该文档能否撤销（撤销已开启，且文档内容没有超出撤销记录的字节预算）"""
+        self.refresh()
+        doc = self.documents.get(title)
+        return doc is not None and self.operation_log.can_record(doc)
+
     def clear_document(self, title):
         """清空文档的所有内容"""
+        self.refresh()
         if title not in self.documents:
             print(f"[系统] 文档 '{title}' 不存在。")
             return False
         
-        self.documents[title] = []
-        self._save_document(title)
+        # 被清空的文档对象不再修改，直接留给撤销记录，不复制内容
+        old_doc = self.documents[title]
+        self.documents[title] = self._new_document()
+        self._commit(title)
+        self.operation_log.record(Operation(title, f"清空文档 '{title}'", [(0, old_doc, [])]))
+        if self.duplicate_index is not None:
+            self.duplicate_index.forget_document(title)
         print(f"[系统] 文档 '{title}' 的所有内容已清空。")
         return True
 
+    def undo(self):
+        """
+        撤销本实例最近一次修改
+        
+        Returns:
+            被撤销的操作；没有可撤销的操作时返回 None
+        
+        Raises:
+            DocumentConflict: 文档已被其他会话改动，无法撤销（这条记录随之丢弃）
+        """
+        self.refresh()
+        operation = self.operation_log.peek_undo()
+        if operation is None:
+            return None
+        if not self._apply_operation(operation.title, operation.inverse().splices):
+            self.operation_log.discard_undo()
+            raise DocumentConflict(operation.title)
+        self.operation_log.pop_undo()
+        print(f"[系统] 已撤销{operation.description}。")
+        return operation
+    
+    def redo(self):
+        """
+        重做最近一次撤销的修改
+        
+        Returns:
+            被重做的操作；没有可重做的操作时返回 None
+        
+        Raises:
+            DocumentConflict: 文档已被其他会话改动，无法重做（这条记录随之丢弃）
+        """
+        self.refresh()
+        operation = self.operation_log.peek_redo()
+        if operation is None:
+            return None
+        if not self._apply_operation(operation.title, operation.splices):
+            self.operation_log.discard_redo()
+            raise DocumentConflict(operation.title)
+        self.operation_log.pop_redo()
+        print(f"[系统] 已重做{operation.description}。")
+        return operation
+    
+    def _apply_operation(self, title, splices):
+        """核对并执行撤销/重做的区间替换，然后保存；返回是否成功"""
+        if title not in self.documents:
+            return False
+        if not apply_splices(self._writable(title), splices):
+            return False
+        try:
+            self._commit(title)
+        except DocumentConflict:
+            return False
+        return True
+    
+    def import_document(self, title, chunks, mode="replace"):
+        """
+        批量导入：把分块给出的文本直接写成文档文件，不经过 add_content 逐条插入
+        
+        文本边读边写入临时文件（读取期间不持有提交锁），写完后在提交锁内原子替换或追加到文件末尾，
+        版本号加 1 并重新加载该文档；其他会话按文件变更重新加载。写入失败时原文档保持不变。
+        导入不做比较并交换，也不能撤销。
+        
+        Args:
+            chunks: 文本块的迭代器，换行符为 '\n'
+            mode: "replace" 覆盖原有内容 / "append" 追加到原有内容之后
+        
+        Returns:
+            (文档标题, 写入的字节数)：标题按文件名规范化，与其他会话从目录加载时一致
+        """
+        self.refresh()
+        file_path = self._get_document_file(title)
+        title = self._title_for_file(file_path.name)
+        temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.import")
+        written = 0
+        try:
+            with open(temp_path, 'wb', buffering=TRANSFER_BLOCK_BYTES) as out:
+                for chunk in chunks:
+                    data = chunk.encode('utf-8')
+                    out.write(data)
+                    written += len(data)
+            with self._versions.lock(title):
+                if mode == "append" and self._stat_fingerprint(file_path) is not None:
+                    with open(file_path, 'rb+') as f, open(temp_path, 'rb') as src:
+                        f.seek(0, os.SEEK_END)
+                        if f.tell() > 0 and written > 0:
+                            f.seek(-1, os.SEEK_END)
+                            if f.read(1) != b'\n':
+                                f.write(b'\n')
+                        shutil.copyfileobj(src, f, TRANSFER_BLOCK_BYTES)
+                    os.unlink(temp_path)
+                else:
+                    os.replace(temp_path, file_path)
+                self._versions.bump(title)
+                self._file_states.pop(title, None)
+                self._reload_locked(title, file_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        if mode != "append":
+            if self.duplicate_index is not None:
+                self.duplicate_index.forget_document(title)
+            self.operation_log.forget_document(title)
+        self.search_index.maybe_save()
+        return title, written
+    
+    def open_document_file(self, title):
+        """
+        以二进制方式打开文档文件用于导出，返回 (文件对象, 字节数)；文档或文件不存在时返回 None
+        
+        字节数在提交锁内取得，只读到这个长度就不会读到其他会话写了一半的追加
+        （整篇保存是原子替换，已打开的文件不受影响）。
+        """
+        self.refresh()
+        if title not in self.documents:
+            return None
+        with self._versions.lock(title):
+            try:
+                f = open(self._get_document_file(title), 'rb')
+            except FileNotFoundError:
+                return None
+            return f, os.fstat(f.fileno()).st_size
+    
+    def warm_document(self, title, lines=0, writable=False):
+        """
+        预热文档（输入过程中的预取使用，不改变文档内容）
+        
+        Args:
+            lines: 预先读取前多少行（内存映射文档会为这部分建立行索引、读入页缓存）
+            writable: 提前把内存映射的只读文档读入内存，之后的修改不必再等
+        
+        Returns:
+            文档是否存在
+        """
+        self.refresh()
+        doc = self.documents.get(title)
+        if doc is None:
+            return False
+        if writable:
+            self._writable(title)
+        elif lines > 0:
+            doc[:lines]
+        return True
+    
+    def count_lines(self, title, exact=True):
+        """
+        返回文档的总行数，文档不存在时返回 None
+        
+        exact=False 时，尚未扫描完的内存映射文档也返回 None，而不是为了计数读完整个文件
+        """
+        self.refresh()
+        doc = self.documents.get(title)
+        if doc is None:
+            return None
+        if not exact and isinstance(doc, MappedLines):
+            return doc.known_length()
+        return len(doc)
+
+    def read_lines(self, title, offset=0, limit=None):
+        """
+        读取文档的一段行（只复制请求的范围）
+        
+        Args:
+            title: 文档标题
+            offset: 起始行号（从 0 开始）
+            limit: 最多返回多少行，None 表示读到末尾
+            
+        Returns:
+            行列表；文档不存在时返回 None
+        """
+        self.refresh()
+        doc = self.documents.get(title)
+        if doc is None:
+            return None
+        offset = max(0, offset)
+        # 切片自动截断到文档末尾，不需要先求总行数（内存映射文档求总行数要扫描全文）
+        if limit is None:
+            return doc[offset:]
+        return doc[offset:offset + max(0, limit)]
+
+    def search(self, query, limit=20):
+        """
+        全文检索，返回按相关度排序的命中行
+        
+        Returns:
+            [{"title", "line_number"(从 1 开始), "line", "score"}, ...]
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        self.refresh()
+        self._index_mapped_documents()
+        
+        hits = self.search_index.search(query, limit=max(limit * 5, 100))
+        stale = ()
+        if hits is None:
+            # 查询太短（例如单个汉字）无法使用索引，直接扫描，凑够候选数量即停止
+            hits = list(islice(((title, i, 1.0) for title, doc in self.documents.items()
+                                for i, line in enumerate(doc) if query in line), max(limit * 5, 100)))
+        else:
+            # 共享索引对应磁盘上最新的内容；本实例还没重新加载的文档，命中行要在自己的副本中核实
+            stale = {title for title in self.documents
+                     if self.search_index.fingerprint(title) != self._file_states.get(title)}
+            terms = set(tokenize(query))
+        
+        query_lower = query.lower()
+        results = []
+        for title, line_no, score in hits:
+            doc = self.documents.get(title)
+            if not doc or line_no >= len(doc):
+                continue
+            line = doc[line_no]
+            if title in stale and not terms & set(tokenize(line)):
+                continue
+            # 完整包含查询串的行排在前面
+            if query_lower in line.lower():
+                score *= 2
+            results.append({
+                "title": title,
+                "line_number": line_no + 1,
+                "line": line,
+                "score": round(score, 4)
+            })
+        results.sort(key=lambda item: (-item["score"], item["title"], item["line_number"]))
+        return results[:limit]
+
     def display_document(self, title):
         """显示文档内容"""
+        self.refresh()
         doc = self.documents.get(title, [])
         if not doc:
             return f"文档 '{title}' 为空。"
         
-        output = f"--- 文档: {title} ---\n"
-        for i, line in enumerate(doc):
-            output += f"{i+1}. {line}\n"
-        output += "----------------------"
-        return output
+        # 先收集各段再一次性拼接，避免重复 += 导致的二次方开销
+        parts = [f"--- 文档: {title} ---"]
+        parts.extend(f"{i+1}. {line}" for i, line in enumerate(doc))
+        parts.append("----------------------")
+        return "\n".join(parts)
+
+    # ============================================
+    # 异步接口：在文档 I/O 线程池中执行同名的同步方法，文件读写不阻塞事件循环
+    # ============================================
+
+    async def aget_document(self, title):
+        """get_document 的异步版本（读取前会重新加载变化了的文档文件）"""
+        return await run_io(self.get_document, title)
+
+    async def aadd_content(self, title, content, position="end"):
+        """add_content 的异步版本"""
+        return await run_io(self.add_content, title, content, position)
+
+    async def aclear_document(self, title):
+        """clear_document 的异步版本"""
+        return await run_io(self.clear_document, title)
+
+    async def acount_lines(self, title, exact=True):
+        """count_lines 的异步版本"""
+        return await run_io(self.count_lines, title, exact)
 
+    async def aread_lines(self, title, offset=0, limit=None):
+        """read_lines 的异步版本"""
+        return await run_io(self.read_lines, title, offset, limit)
 
+    async def asearch(self, query, limit=20):
+        """search 的异步版本"""
+        return await run_io(self.search, query, limit)
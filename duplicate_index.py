@@ -0,0 +1,212 @@
+# duplicate_index.py
+# 重复内容索引 (Duplicate Content Index)
+#
+# 用户经常把同一段剪藏内容加到好几个文档里，或者不小心重复添加。
+# DuplicateIndex 以片段内容的哈希为键，记录每个片段（一次添加的整块内容，以及其中每一行）出现在哪些文档中：
+# - 添加内容前按哈希查找，发现重复时提示用户，或直接跳过（DUPLICATE_CHECK_MODE=skip，任一文档中已有时都不再写入）
+# - 记录只是"提示"：文档可能已被修改、移动或清空，命中后由 DocumentManager 在文档中核实位置，失效的记录会被丢弃
+# - 同一目录的所有会话共享一个实例（get_duplicate_index），记录保存在目录下的 .duplicates.json，重启后仍然有效
+# 条目数有上限，超过后按最近使用淘汰最旧的记录。
+# 落盘与 SearchIndex 一样有最短间隔：两次保存之间的添加只在内存中累积，服务退出时再写入剩余的修改。
+#
+# 这里只有索引，不保存内容：文档文件仍是普通的 .txt 全文（外部工具、目录监听和内存映射都依赖这一点）。
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+INDEX_FILE = ".duplicates.json"
+
+# 单行片段至少这么多个字符才单独记录，避免"好的""完成"之类的短行也被当作重复
+MIN_LINE_CHARS = 8
+
+
+def chunk_digest(lines):
+    """片段的内容哈希：各行去掉首尾空白后以 \\n 连接"""
+    data = "\n".join(line.strip() for line in lines).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def normalize_block(content):
+    """把要添加的内容切分成行，去掉首尾的空行（与 DocumentManager.add_content 一致）"""
+    lines = content.split("\n")
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+
+class DuplicateIndex:
+    """
+    片段哈希 -> 出现过该片段的文档标题
+
+    Args:
+        index_file: 持久化文件路径，None 表示只在内存中维护
+        max_chunks: 最多保留的片段记录数
+        save_interval: 有修改时两次落盘之间的最短间隔（秒）
+    """
+
+    def __init__(self, index_file=None, max_chunks=100000, save_interval=30.0):
+        self.index_file = index_file
+        self.max_chunks = max_chunks
+        self.save_interval = save_interval
+        self._chunks = OrderedDict()   # digest -> [title, ...]
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saving = False           # 后台保存线程是否在运行（持有 _lock 读写）
+        self._last_save = time.monotonic()
+        self._save_lock = threading.Lock()  # 后台保存和退出时的 flush 不同时写临时文件
+        self.hits = 0
+        self.stale = 0
+        if index_file is not None:
+            self._load()
+
+    def chunks(self, lines):
+        """
+        把要添加的内容拆成需要记录的片段：[(哈希, 片段的行, 是否为整块)]
+        
+        第一项总是整块内容；多行内容还包括其中足够长的每一行。
+        """
+        chunks = [(chunk_digest(lines), lines, True)]
+        if len(lines) > 1:
+            seen = {chunks[0][0]}
+            for line in lines:
+                if len(line.strip()) >= MIN_LINE_CHARS:
+                    digest = chunk_digest([line])
+                    if digest not in seen:
+                        seen.add(digest)
+                        chunks.append((digest, [line], False))
+        return chunks
+
+    def lookup(self, digest):
+        """返回记录中包含该片段的文档标题"""
+        with self._lock:
+            titles = self._chunks.get(digest)
+            if titles is None:
+                return []
+            self._chunks.move_to_end(digest)
+            return list(titles)
+
+    def add(self, digest, title):
+        with self._lock:
+            titles = self._chunks.get(digest)
+            if titles is None:
+                self._chunks[digest] = [title]
+                while len(self._chunks) > self.max_chunks:
+                    self._chunks.popitem(last=False)
+            else:
+                self._chunks.move_to_end(digest)
+                if title in titles:
+                    return
+                titles.append(title)
+            self._dirty = True
+
+    def discard(self, digest, title):
+        """核实失败：该文档中已经没有这个片段"""
+        with self._lock:
+            titles = self._chunks.get(digest)
+            if titles is None or title not in titles:
+                return
+            titles.remove(title)
+            if not titles:
+                del self._chunks[digest]
+            self._dirty = True
+            self.stale += 1
+
+    def forget_document(self, title):
+        """文档被清空或删除时移除它的全部记录"""
+        with self._lock:
+            for digest in [d for d, titles in self._chunks.items() if title in titles]:
+                titles = self._chunks[digest]
+                titles.remove(title)
+                if not titles:
+                    del self._chunks[digest]
+                self._dirty = True
+
+    def stats(self):
+        return {"chunks": len(self._chunks), "hits": self.hits, "stale": self.stale}
+
+    # ---------- 持久化 ----------
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[系统警告] 加载重复内容索引失败: {e}")
+            return
+        if isinstance(data, dict):
+            for digest, titles in data.items():
+                if isinstance(titles, list) and titles:
+                    self._chunks[digest] = [str(title) for title in titles]
+
+    def save(self):
+        if self.index_file is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._chunks, ensure_ascii=False, separators=(",", ":"))
+                self._dirty = False
+            tmp_file = Path(f"{self.index_file}.{os.getpid()}.tmp")
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_file, self.index_file)
+            except OSError as e:
+                self._dirty = True
+                print(f"[系统警告] 保存重复内容索引失败: {e}")
+            self._last_save = time.monotonic()
+
+    def _background_save(self):
+        try:
+            self.save()
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def maybe_save(self, force=False):
+        """有未保存的修改且距离上次保存超过 save_interval（或 force=True）时，在后台线程落盘"""
+        if self.index_file is None:
+            return
+        with self._lock:
+            # 检查和置位在同一把锁内，并发添加的多个线程只会启动一个保存线程
+            if not self._dirty or self._saving:
+                return
+            if not force and time.monotonic() - self._last_save < self.save_interval:
+                return
+            self._saving = True
+        threading.Thread(target=self._background_save, name="duplicate-index-save", daemon=True).start()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_duplicate_index(directory):
+    """返回目录对应的共享重复内容索引"""
+    key = os.path.realpath(str(directory))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = DuplicateIndex(Path(directory) / INDEX_FILE)
+            _indexes[key] = index
+        return index
+
+
+def flush_duplicate_indexes():
+    """保存所有重复内容索引（服务退出时调用）"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.flush()
@@ -0,0 +1,36 @@
+# fast_json.py
+# 快速 JSON 响应 (Fast JSON Response)
+#
+# FastAPI 默认会把返回的模型先按 response_model 重新校验，再经 jsonable_encoder 转成字典，
+# 最后用标准库 json 编码——对包含整篇文档的 DISPLAY_DOC 响应来说，这几步都要完整遍历一遍内容。
+# FastJSONResponse 直接序列化：pydantic 模型先 model_dump() 成字典，
+# 然后优先用 orjson（可选依赖）编码，未安装时用标准库 json 的 C 编码器。
+# 非 ASCII 字符一律原样输出为 UTF-8，不转义为 \uXXXX，中文内容体积约为转义后的一半。
+
+import json
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+
+def dumps(content):
+    """把模型或普通数据编码为 UTF-8 JSON 字节串"""
+    if isinstance(content, BaseModel):
+        # 对长文本字段，model_dump_json() 反而比 orjson / json 慢
+        content = content.model_dump()
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """直接序列化内容的 JSON 响应，可以传入 pydantic 模型或普通字典/列表"""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,123 @@
+# http_pool.py
+# LLM 调用的 HTTP 连接池 (Pooled HTTP Client)
+#
+# 所有会话共享一个长期存在的 requests.Session，通过 session= 参数传给 Application.call，
+# 复用与 DashScope 之间的 TCP/TLS 连接，避免每轮对话都重新握手。
+# - 连接池大小可配置（应不小于 LLM 并发数，否则多出的连接用完即关）
+# - 开启 TCP keepalive；连接闲置超过 keepalive_seconds 后主动丢弃，避免复用已被服务端关闭的连接
+# - 统计新建连接数与请求数，得出连接复用率
+#
+# 注意：dashscope SDK 只接受 requests.Session / aiohttp.ClientSession，
+# requests 不支持 HTTP/2，因此这里只能做 HTTP/1.1 keep-alive 连接复用。
+
+import socket
+import threading
+import time
+
+
+def _socket_options(keepalive_seconds):
+    """在 urllib3 默认选项（TCP_NODELAY）基础上开启 TCP keepalive"""
+    from urllib3.connection import HTTPConnection
+
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    idle = max(1, int(keepalive_seconds))
+    # 以下选项并非所有平台都有（例如 macOS 没有 TCP_KEEPIDLE）
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, idle // 3)))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3))
+    return options
+
+
+class PooledHTTPClient:
+    """
+    线程安全、延迟创建的共享 requests.Session
+
+    Args:
+        pool_size: 每个主机保留的最大连接数
+        keepalive_seconds: 连接闲置超过该秒数后不再复用（同时作为 TCP keepalive 探测的空闲时间）
+    """
+
+    def __init__(self, pool_size=16, keepalive_seconds=60.0):
+        self.pool_size = max(1, int(pool_size))
+        self.keepalive_seconds = float(keepalive_seconds)
+        self._session = None
+        self._adapter = None
+        self._lock = threading.Lock()
+        self._last_used = None
+
+        # 被丢弃的连接池里的计数，丢弃前累加到这里
+        self._retired_connections = 0
+        self._retired_requests = 0
+        self.idle_resets = 0
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        socket_options = _socket_options(self.keepalive_seconds)
+
+        class _KeepAliveAdapter(HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                kwargs["socket_options"] = socket_options
+                super().init_poolmanager(*args, **kwargs)
+
+        adapter = _KeepAliveAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session, adapter
+
+    def _pools(self):
+        manager = self._adapter.poolmanager
+        return [manager.pools[key] for key in list(manager.pools.keys())]
+
+    def _retire_idle_connections(self):
+        """闲置太久时清空连接池（服务端或中间网络设备多半已经关闭了这些连接）"""
+        for pool in self._pools():
+            self._retired_connections += pool.num_connections
+            self._retired_requests += pool.num_requests
+        self._adapter.poolmanager.clear()
+        self.idle_resets += 1
+
+    def get_session(self):
+        """返回共享的 Session，供 Application.call(session=...) 使用"""
+        with self._lock:
+            if self._session is None:
+                self._session, self._adapter = self._create_session()
+            now = time.monotonic()
+            if self._last_used is not None and now - self._last_used > self.keepalive_seconds:
+                self._retire_idle_connections()
+            self._last_used = now
+            return self._session
+
+    def close(self):
+        """关闭所有连接"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+                self._adapter = None
+
+    def stats(self):
+        """返回连接复用统计：请求数、新建连接数、复用率"""
+        with self._lock:
+            connections = self._retired_connections
+            requests_sent = self._retired_requests
+            if self._adapter is not None:
+                for pool in self._pools():
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+        reused = max(0, requests_sent - connections)
+        return {
+            "pool_size": self.pool_size,
+            "keepalive_seconds": self.keepalive_seconds,
+            "requests": requests_sent,
+            "new_connections": connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / requests_sent, 3) if requests_sent else None,
+            "idle_resets": self.idle_resets,
+        }
@@ -0,0 +1,342 @@
+# intent_handlers.py
+# 意图处理器注册表 (Intent Handler Registry)
+#
+# 每个意图对应一个处理函数，通过 @register_intent 注册，chat() 按意图查表分发。
+# 处理函数签名：handler(app_instance, intent_data) -> (response_type, content)
+# response_type 取值："TEXT" | "CONFIRMATION" | "DOCUMENT"
+
+import threading
+import time
+from config import DISPLAY_DOC_MAX_LINES, DUPLICATE_CHECK_MODE, DELETE_CONFIRMATION
+from doc_versions import DocumentConflict, DocumentSaveError
+
+# 意图 -> 处理函数
+INTENT_HANDLERS = {}
+
+# 每个意图的耗时统计：意图 -> {"count", "total_seconds", "max_seconds"}
+# dispatch 在文档 I/O 线程池中执行，更新和读取都要持有 _timings_lock
+HANDLER_TIMINGS = {}
+_timings_lock = threading.Lock()
+
+HELP_TEXT = """我能理解以下指令：
+1. 添加内容：'把[内容]加到[文档名]的[开头/结尾/某个段落之后]'
+   示例：'把今天的会议要点加到项目周报的结尾'
+2. 切换文档：'打开[文档名]'
+   示例：'打开学习笔记'
+3. 查看文档：'查看[文档名]'
+   示例：'显示项目周报'
+4. 删除/清空文档：'删除[文档名]所有内容' 或 '清空[文档名]'
+   示例：'删除默认文档所有内容'
+5. 修改内容：'把[文档名]里的[原内容]改成[新内容]'
+   示例：'把项目周报里的周一开会改成周二开会'
+6. 移动内容：'把[内容]移到[文档名]的[开头/结尾/某个段落之后]'
+   示例：'把待办事项移到学习笔记的开头'
+7. 搜索内容：'搜索[关键词]' 或 '[关键词]在哪'
+   示例：'搜索会议纪要'
+8. 撤销/重做：'撤销' 撤回上一次修改，'重做' 恢复刚撤销的修改
+   示例：'撤销'
+9. 重置对话：'重置对话' 或 '清空对话历史'
+   示例：'重置对话'（清空对话历史，重新开始）
+10. 退出：'退出'"""
+
+# 聊天中最多列出的检索结果条数
+SEARCH_RESULT_LIMIT = 10
+
+# LLM 返回的意图参数中应为文本的字段
+TEXT_FIELDS = ("doc_title", "content", "position")
+
+
+def register_intent(*intents):
+    """装饰器：把处理函数注册到一个或多个意图上"""
+    def decorator(handler):
+        for intent in intents:
+            INTENT_HANDLERS[intent] = handler
+        return handler
+    return decorator
+
+
+def handler_timing_stats():
+    """返回每个意图处理函数的调用次数、平均和最大耗时（毫秒）"""
+    with _timings_lock:
+        timings = {intent: dict(timing) for intent, timing in HANDLER_TIMINGS.items()}
+    return {
+        intent: {
+            "count": timing["count"],
+            "avg_ms": round(timing["total_seconds"] / timing["count"] * 1000, 2),
+            "max_ms": round(timing["max_seconds"] * 1000, 2),
+        }
+        for intent, timing in timings.items()
+    }
+
+
+def _coerce_text_fields(intent_data):
+    """
+    文本字段的值是数字时转成字符串（例如 "把 2024 加到结尾"）
+
+    Returns:
+        有字段是列表、对象等其他类型时返回 False，按无法理解的指令处理
+    """
+    for key in TEXT_FIELDS:
+        value = intent_data.get(key)
+        if value is None or isinstance(value, str):
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            intent_data[key] = str(value)
+            continue
+        return False
+    return True
+
+
+def dispatch(app_instance, intent_data):
+    """按意图查表调用处理函数，未注册的意图交给 UNKNOWN 处理（耗时也计入 UNKNOWN，统计表不会无限增长）"""
+    intent = intent_data.get("intent")
+    if not isinstance(intent, str) or intent not in INTENT_HANDLERS:
+        intent = "UNKNOWN"
+    if not _coerce_text_fields(intent_data):
+        intent, intent_data = "UNKNOWN", {"intent": "UNKNOWN"}
+    handler = INTENT_HANDLERS[intent]
+
+    start = time.perf_counter()
+    try:
+        return handler(app_instance, intent_data)
+    except DocumentConflict as e:
+        # 修改、移动、清空时文档已被其他会话修改：本次修改已被丢弃，文档已重新加载
+        return "TEXT", f"文档 '{e.title}' 刚刚被其他会话修改过，本次操作没有生效，请查看最新内容后重试。"
+    except DocumentSaveError as e:
+        # 写入文件失败：修改已丢弃，文档保持修改前的内容
+        return "TEXT", f"保存文档 '{e.title}' 失败，本次操作没有生效，请稍后重试。"
+    finally:
+        elapsed = time.perf_counter() - start
+        with _timings_lock:
+            timing = HANDLER_TIMINGS.setdefault(intent, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            timing["count"] += 1
+            timing["total_seconds"] += elapsed
+            timing["max_seconds"] = max(timing["max_seconds"], elapsed)
+
+
+def _target_title(app_instance, intent_data):
+    """意图里没有指定文档时，使用当前活跃文档"""
+    return intent_data.get("doc_title") or app_instance.doc_manager.active_doc_title
+
+
+def _position_desc(position):
+    if position.lower() == "start":
+        return "开头"
+    if position.lower() == "end":
+        return "结尾"
+    return f"'{position}' 之后"
+
+
+def _duplicate_desc(duplicates):
+    places = "、".join(f"'{dup['title']}' 第 {dup['line_number']} 行" for dup in duplicates)
+    if duplicates[0]["whole"]:
+        return f"相同内容之前已添加过（文档 {places}）。"
+    return f"其中部分行与已有内容重复（文档 {places}）。"
+
+
+# ============================================
+# 待确认操作
+# ============================================
+
+def execute_pending_action(app_instance):
+    """执行待确认的操作，返回结果文本；没有待确认操作时返回 None"""
+    action = app_instance.pending_action
+    if not action:
+        return None
+    app_instance.pending_action = None
+    if action["intent"] == "DELETE_CONTENT":
+        try:
+            app_instance.doc_manager.clear_document(action["title"])
+        except DocumentConflict:
+            # 保留待确认的操作：用户看过最新内容后可以再次确认
+            app_instance.pending_action = action
+            return f"文档 '{action['title']}' 刚刚被其他会话修改过，尚未清空。如仍要清空，请再次确认。"
+        except DocumentSaveError:
+            app_instance.pending_action = action
+            return f"保存文档 '{action['title']}' 失败，尚未清空。请稍后再次确认。"
+        return f"已成功清空文档 '{action['title']}' 的所有内容。"
+    return "没有待确认的操作。"
+
+
+def cancel_pending_action(app_instance):
+    """取消待确认的操作，返回结果文本；没有待确认操作时返回 None"""
+    action = app_instance.pending_action
+    if not action:
+        return None
+    app_instance.pending_action = None
+    return f"已取消清空文档 '{action['title']}' 的操作。"
+
+
+@register_intent("CONFIRM")
+def handle_confirm(app_instance, intent_data):
+    return "TEXT", execute_pending_action(app_instance) or "没有待确认的操作。"
+
+
+@register_intent("CANCEL")
+def handle_cancel(app_instance, intent_data):
+    return "TEXT", cancel_pending_action(app_instance) or "没有待确认的操作。"
+
+
+# ============================================
+# 文档操作
+# ============================================
+
+@register_intent("DELETE_CONTENT")
+def handle_delete(app_instance, intent_data):
+    doc_title = _target_title(app_instance, intent_data)
+    doc_manager = app_instance.doc_manager
+    # 能撤销时默认不再确认（见 config.DELETE_CONFIRMATION）；内容太大、撤销记录放不下时仍要确认
+    undoable = doc_manager.can_undo_clear(doc_title)
+    if intent_data.get("confirmation_needed", False) and (DELETE_CONFIRMATION or not undoable):
+        # 需要确认的删除操作
+        app_instance.pending_action = {
+            "intent": "DELETE_CONTENT",
+            "title": doc_title
+        }
+        warning = "" if undoable else "此操作不可恢复。"
+        return "CONFIRMATION", f"您确定要清空文档 '{doc_title}' 的所有内容吗？{warning}"
+    if not doc_manager.clear_document(doc_title):
+        return "TEXT", f"文档 '{doc_title}' 不存在。"
+    if undoable:
+        return "TEXT", f"已成功清空文档 '{doc_title}' 的所有内容。如需恢复，请说'撤销'。"
+    return "TEXT", f"已成功清空文档 '{doc_title}' 的所有内容。"
+
+
+@register_intent("UNDO")
+def handle_undo(app_instance, intent_data):
+    try:
+        operation = app_instance.doc_manager.undo()
+    except DocumentConflict as e:
+        return "TEXT", f"文档 '{e.title}' 已被其他会话修改，无法撤销上一次修改。"
+    if operation is None:
+        return "TEXT", "没有可以撤销的修改。"
+    return "TEXT", f"已撤销{operation.description}。如需恢复，请说'重做'。"
+
+
+@register_intent("REDO")
+def handle_redo(app_instance, intent_data):
+    try:
+        operation = app_instance.doc_manager.redo()
+    except DocumentConflict as e:
+        return "TEXT", f"文档 '{e.title}' 已被其他会话修改，无法重做。"
+    if operation is None:
+        return "TEXT", "没有可以重做的修改。"
+    return "TEXT", f"已重做{operation.description}。"
+
+
+@register_intent("ADD_CONTENT")
+def handle_add(app_instance, intent_data):
+    doc_title = _target_title(app_instance, intent_data)
+    content = intent_data.get("content") or ""
+    # 确保position不为None
+    position = intent_data.get("position") or "end"
+    duplicates = app_instance.doc_manager.find_duplicates(content)
+    if DUPLICATE_CHECK_MODE == "skip":
+        # 任一文档中已有整块相同的内容都不再写入（优先报告目标文档中的位置）
+        whole = sorted((dup for dup in duplicates if dup["whole"]), key=lambda dup: dup["title"] != doc_title)
+        if whole:
+            dup = whole[0]
+            if dup["title"] == doc_title:
+                return "TEXT", f"文档 '{doc_title}' 第 {dup['line_number']} 行已有相同内容，未重复添加。"
+            return "TEXT", f"文档 '{dup['title']}' 第 {dup['line_number']} 行已有相同内容，未重复添加到 '{doc_title}'。"
+    app_instance.doc_manager.add_content(doc_title, content, position)
+    reply = f"已成功将内容添加到文档 '{doc_title}' 的{_position_desc(position)}。"
+    if duplicates:
+        reply += "\n提示：" + _duplicate_desc(duplicates)
+    return "TEXT", reply
+
+
+@register_intent("EDIT_CONTENT")
+def handle_edit(app_instance, intent_data):
+    doc_title = _target_title(app_instance, intent_data)
+    target = intent_data.get("position")
+    new_content = intent_data.get("content")
+    if not target or target.lower() in ("start", "end") or new_content is None:
+        return "TEXT", "请说明要修改的原内容和修改后的内容，例如：'把周一开会改成周二开会'。"
+    if app_instance.doc_manager.edit_content(doc_title, target, new_content):
+        return "TEXT", f"已将文档 '{doc_title}' 中的 '{target}' 修改为 '{new_content}'。"
+    return "TEXT", f"在文档 '{doc_title}' 中没有找到 '{target}'。"
+
+
+@register_intent("MOVE_CONTENT")
+def handle_move(app_instance, intent_data):
+    doc_title = _target_title(app_instance, intent_data)
+    content = intent_data.get("content")
+    position = intent_data.get("position") or "end"
+    if not content:
+        return "TEXT", "请说明要移动的内容。"
+    if app_instance.doc_manager.move_content(doc_title, content, position):
+        return "TEXT", f"已将 '{content}' 移动到文档 '{doc_title}' 的{_position_desc(position)}。"
+    return "TEXT", f"在文档 '{doc_title}' 中没有找到 '{content}'，或目标位置不存在。"
+
+
+@register_intent("SET_ACTIVE")
+def handle_set_active(app_instance, intent_data):
+    doc_title = intent_data.get("doc_title")
+    if not doc_title:
+        return "TEXT", "未指定要切换的文档。"
+    app_instance.doc_manager.set_active_document(doc_title)
+    return "TEXT", f"已切换到文档：{doc_title}"
+
+
+@register_intent("DISPLAY_DOC")
+def handle_display(app_instance, intent_data):
+    doc_title = _target_title(app_instance, intent_data)
+    # 只读取第一页（多读一行用来判断后面是否还有内容），过长的文档提示客户端分页获取
+    lines = app_instance.doc_manager.read_lines(doc_title, 0, DISPLAY_DOC_MAX_LINES + 1)
+    if not lines:
+        return "TEXT", f"文档 '{doc_title}' 不存在或为空。"
+    truncated = len(lines) > DISPLAY_DOC_MAX_LINES
+    lines = lines[:DISPLAY_DOC_MAX_LINES]
+    content = '\n'.join(lines)
+    if truncated:
+        # 大文档（内存映射）还没扫描完时不为了显示总行数去读整个文件
+        total = app_instance.doc_manager.count_lines(doc_title, exact=False)
+        total_desc = f"共 {total} 行" if total is not None else "后面还有更多内容"
+        content += f"\n\n（仅显示前 {len(lines)} 行，{total_desc}，完整内容请通过 /api/documents/{doc_title} 分页查看）"
+    return "DOCUMENT", content
+
+
+@register_intent("SEARCH")
+def handle_search(app_instance, intent_data):
+    query = (intent_data.get("content") or "").strip()
+    if not query:
+        return "TEXT", "请告诉我要搜索的内容，例如：'搜索会议纪要'。"
+    results = app_instance.doc_manager.search(query, SEARCH_RESULT_LIMIT)
+    if not results:
+        return "TEXT", f"没有找到包含 '{query}' 的内容。"
+    lines = [f"找到以下与 '{query}' 相关的内容："]
+    for i, hit in enumerate(results):
+        lines.append(f"{i + 1}. [{hit['title']}] 第 {hit['line_number']} 行：{hit['line']}")
+    return "TEXT", "\n".join(lines)
+
+
+# ============================================
+# 对话控制
+# ============================================
+
+@register_intent("HELP")
+def handle_help(app_instance, intent_data):
+    # 检查LLM是否生成了内容
+    content = intent_data.get("content")
+    if content and isinstance(content, str) and len(content.strip()) > 0:
+        return "TEXT", content
+    return "TEXT", HELP_TEXT
+
+
+@register_intent("RESET_CONVERSATION", "CLEAR_CONVERSATION")
+def handle_reset(app_instance, intent_data):
+    app_instance.intent_recognizer.reset_conversation()
+    app_instance.pending_action = None
+    return "TEXT", "对话历史已重置，可以重新开始对话了。"
+
+
+@register_intent("EXIT")
+def handle_exit(app_instance, intent_data):
+    # 退出（在API中，我们只返回消息，不实际退出）
+    return "TEXT", "感谢您的使用，再见！"
+
+
+@register_intent("UNKNOWN")
+def handle_unknown(app_instance, intent_data):
+    return "TEXT", intent_data.get("content") or "抱歉，我没有理解您的指令。请尝试使用更清晰的表达。"
@@ -3,16 +3,39 @@
 
 import json
 import re
+import time
 from http import HTTPStatus
-from dashscope import Application
 from config import API_KEY, APP_ID
+from config import LLM_BREAKER_FAILURE_RATE, LLM_BREAKER_SLOW_CALL_SECONDS, LLM_BREAKER_OPEN_SECONDS
+from config import CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT
+from config import DOC_CONTEXT_ENABLED, DOC_CONTEXT_MAX_TITLES, DOC_CONTEXT_RELEVANT_TITLES
+from circuit_breaker import CircuitBreaker
+from local_intent_parser import parse_intent
+from keyword_matcher import control_matcher
+from llm_client import llm_client, LLMDeadlineExceeded
+from conversation_summary import ConversationCompactor
+from document_context import DocumentContextBuilder
+
+# 所有会话共享同一个熔断器：上游是同一个 DashScope 应用
+llm_circuit_breaker = CircuitBreaker(
+    failure_rate_threshold=LLM_BREAKER_FAILURE_RATE,
+    slow_call_seconds=LLM_BREAKER_SLOW_CALL_SECONDS,
+    open_seconds=LLM_BREAKER_OPEN_SECONDS
+)
 
 class LLMIntentRecognizer:
-    def __init__(self, doc_manager, client_config ):
+    def __init__(self, doc_manager, client_config, circuit_breaker=None):
         self.doc_manager = doc_manager
         self.client_config = client_config
+        self.circuit_breaker = circuit_breaker or llm_circuit_breaker
         # 维护对话历史的 messages 数组
         self.messages = []
+        # 最近一次 LLM 调用的原始输出和耗时（供请求录制使用）
+        self.last_llm_call = None
+        # 历史过长时把较早的轮次折叠为摘要，控制每次请求的长度
+        self.compactor = ConversationCompactor(CONVERSATION_MAX_MESSAGES, CONVERSATION_KEEP_RECENT)
+        # 文档列表上下文（缓存，文档增删或切换活跃文档时才重建）
+        self.context_builder = DocumentContextBuilder(DOC_CONTEXT_MAX_TITLES, DOC_CONTEXT_RELEVANT_TITLES)
         
         # ============================================================
         # 系统提示词配置说明
@@ -34,7 +57,49 @@ class LLMIntentRecognizer:
         用于解决对话历史中可能包含错误格式（如双大括号）的问题
         """
         self.messages = []
+        self.compactor.reset()
         print("[系统提示] 对话历史已重置")
+
+    def conversation_state(self):
+        """对话历史和摘要状态的副本（用于状态快照）"""
+        messages = list(self.messages)
+        return {"messages": messages, "compactor": self.compactor.state(messages)}
+
+    def restore_conversation(self, state):
+        """从 conversation_state() 的结果恢复对话历史"""
+        self.messages = [dict(message) for message in state.get("messages", ())]
+        self.compactor.restore(state.get("compactor") or {}, self.messages)
+    
+    def _degraded_intent(self, user_input):
+        """LLM 不可用时，使用本地规则解析意图"""
+        intent_data = parse_intent(user_input, self.doc_manager.get_document_titles())
+        intent_data["degraded"] = True
+        self.last_llm_call = {"degraded": True}
+        return intent_data
+
+    def _record_call(self, outcome, latency):
+        """把一次 LLM 调用的结果记入熔断器；outcome 为 None（调用没有结果）时只归还试探名额"""
+        if outcome == "success":
+            self.circuit_breaker.record_success(latency)
+        elif outcome == "timeout":
+            self.circuit_breaker.record_timeout(latency)
+        elif outcome == "failure":
+            self.circuit_breaker.record_failure(latency)
+        else:
+            self.circuit_breaker.release()
+
+    def _request_messages(self):
+        """本次请求实际发送的 messages：文档上下文 + 对话历史"""
+        if not DOC_CONTEXT_ENABLED:
+            return self.messages
+        return self.context_builder.build_messages(self.doc_manager, self.messages)
+
+    def _fallback_intent(self, user_input):
+        """LLM 调用或解析失败时的兜底：只识别退出/帮助，其余返回 UNKNOWN"""
+        control = control_matcher.classify(user_input)
+        if control in ("EXIT", "HELP"):
+            return {"intent": control}
+        return {"intent": "UNKNOWN"}
     
     def _extract_json(self, text):
         """
@@ -276,7 +341,10 @@ class LLMIntentRecognizer:
             "EXIT": "EXIT",
             "CONFIRM": "CONFIRM",  # 用户确认操作
             "CANCEL": "CANCEL",  # 用户取消操作
+            "UNDO": "UNDO",  # 撤销上一次修改
+            "REDO": "REDO",  # 重做撤销的修改
             "RESET_CONVERSATION": "RESET_CONVERSATION",  # 重置对话历史
+            "SEARCH": "SEARCH",  # 全文检索（content_to_process 为查询词）
             "UNKNOWN": "UNKNOWN"
         }
         normalized["intent"] = intent_mapping.get(intent_type, "UNKNOWN")
@@ -295,42 +363,88 @@ class LLMIntentRecognizer:
         
         return normalized
 
-    def recognize(self, user_input):
-        """使用LLM识别用户意图并提取参数"""
-        if not self.client_config:
-            print("[系统错误] LLM配置未初始化，使用默认UNKNOWN意图。")
-            return {"intent": "UNKNOWN"}
-
-        # 注意：系统提示词现在在阿里云百炼应用中配置
-        # 如果需要在系统提示词中包含动态上下文（如当前文档列表），
-        # 可以通过 messages 数组传递 system role 的消息来补充或覆盖云端配置
-        # 当前实现：不在代码中传递 system role 消息，完全依赖云端配置
-        
-        # 如果需要动态上下文，可以在这里构建并添加到 messages
-        # 例如：
-        # doc_titles = ", ".join(self.doc_manager.get_document_titles())
-        # active_doc = self.doc_manager.active_doc_title
-        # context_info = f"当前可用的文档标题: {doc_titles}\n当前活跃文档: {active_doc}"
-        # if not self.messages:
-        #     self.messages.append({
-        #         "role": "system",
-        #         "content": context_info
-        #     })
+    def recognize(self, user_input, deadline=None, on_settled=None):
+        """
+        使用LLM识别用户意图并提取参数
         
-        # 将用户输入添加到 messages
-        self.messages.append({
-            "role": "user",
-            "content": user_input
-        })
+        Args:
+            user_input: 用户输入
+            deadline: 截止时间（time.monotonic() 时间戳），超时后走降级逻辑；None 表示不限制
+            on_settled: 保证调用且只调用一次：调用了 LLM 时由 LLMClient.call 在本次的上游请求全部结束后调用
+                （可能晚于返回）；没有调用 LLM 时（未配置、熔断、准备请求出错等）在返回或抛出异常前调用
+        """
+        # 到达 llm_client.call 时把 on_settled 交给它（见 _recognize），否则在这里调用
+        pending = [on_settled]
+        try:
+            return self._recognize(user_input, deadline, pending)
+        finally:
+            if pending[0] is not None:
+                pending[0]()
+
+    def _recognize(self, user_input, deadline, pending):
+        self.last_llm_call = None
+        if not self.client_config:
+            print("[系统错误] LLM配置未初始化，使用本地规则解析意图。")
+            return self._degraded_intent(user_input)
         
+        # 注意：系统提示词现在在阿里云百炼应用中配置
+        # 动态上下文（当前文档列表、活跃文档）通过 messages 最前面的 system 消息补充，
+        # 只在发送请求时拼接，不写入对话历史（见 DocumentContextBuilder）
+
+        # 先在本地准备好本次请求的 messages，再向熔断器申请调用：
+        # 本地出错不计为上游失败，也不会占住半开状态的试探名额
+        try:
+            # 历史过长时先折叠较早的轮次（本地规则，耗时可以忽略）
+            self.messages = self.compactor.compact(self.messages)
+
+            # 将用户输入添加到 messages
+            self.messages.append({
+                "role": "user",
+                "content": user_input
+            })
+            request_messages = self._request_messages()
+        except Exception as e:
+            print(f"[系统错误] 准备 LLM 请求失败，使用本地规则解析意图: {e}")
+            if self.messages and self.messages[-1] == {"role": "user", "content": user_input}:
+                self.messages.pop()
+            return self._degraded_intent(user_input)
+
+        # 熔断期间完全跳过网络调用，直接返回本地解析结果
+        if not self.circuit_breaker.allow_request():
+            print("[熔断器] LLM 服务熔断中，使用本地规则解析意图")
+            self.messages.pop()
+            return self._degraded_intent(user_input)
+
         try:
             # 调用阿里云百炼智能体应用，使用 messages 参数
             # 注意：如果应用已在应用内配置了知识库，知识库检索会自动启用，无需额外参数
-            response = Application.call(
-                api_key=self.client_config.get("api_key") or API_KEY,
-                app_id=self.client_config.get("app_id") or APP_ID,
-                messages=self.messages
-            )
+            call_start = time.monotonic()
+            outcome = None
+            on_settled, pending[0] = pending[0], None
+            try:
+                response = llm_client.call(
+                    api_key=self.client_config.get("api_key") or API_KEY,
+                    app_id=self.client_config.get("app_id") or APP_ID,
+                    messages=request_messages,
+                    deadline=deadline,
+                    on_settled=on_settled
+                )
+                outcome = "success" if response.status_code == HTTPStatus.OK else "failure"
+            except Exception as e:
+                # 截止时间可能是客户端给的，只按服务端阈值计慢调用
+                outcome = "timeout" if isinstance(e, LLMDeadlineExceeded) else "failure"
+                self.last_llm_call = {"latency_ms": round((time.monotonic() - call_start) * 1000, 1),
+                                      "error": type(e).__name__}
+                raise
+            finally:
+                # allow_request() 放行的每次调用都要记录结果（或归还试探名额），否则熔断器会一直停在半开状态
+                self._record_call(outcome, time.monotonic() - call_start)
+
+            self.last_llm_call = {
+                "latency_ms": round((time.monotonic() - call_start) * 1000, 1),
+                "status_code": int(response.status_code),
+                "raw_output": response.output.text if response.status_code == HTTPStatus.OK else None,
+            }
             
             if response.status_code != HTTPStatus.OK:
                 print(f"[LLM错误] 调用智能体应用失败")
@@ -341,11 +455,7 @@ class LLMIntentRecognizer:
                 if self.messages and self.messages[-1].get("role") == "user":
                     self.messages.pop()
                 # 降级处理
-                if re.search(r"(退出|再见|结束)", user_input):
-                    return {"intent": "EXIT"}
-                if re.search(r"(帮助|能做什么|怎么用)", user_input):
-                    return {"intent": "HELP"}
-                return {"intent": "UNKNOWN"}
+                return self._fallback_intent(user_input)
             
             # 解析JSON输出
             output_text = response.output.text.strip()
@@ -407,11 +517,7 @@ class LLMIntentRecognizer:
                 print(output_text)
                 print(f"[LLM错误] 原始输出类型: {type(output_text)}")
                 # 降级处理
-                if re.search(r"(退出|再见|结束)", user_input):
-                    return {"intent": "EXIT"}
-                if re.search(r"(帮助|能做什么|怎么用)", user_input):
-                    return {"intent": "HELP"}
-                return {"intent": "UNKNOWN"}
+                return self._fallback_intent(user_input)
             
             # 尝试解析JSON
             try:
@@ -482,19 +588,11 @@ class LLMIntentRecognizer:
                 if self.messages and self.messages[-1].get("role") == "user":
                     self.messages.pop()
             # 降级处理
-            if re.search(r"(退出|再见|结束)", user_input):
-                return {"intent": "EXIT"}
-            if re.search(r"(帮助|能做什么|怎么用)", user_input):
-                return {"intent": "HELP"}
-            return {"intent": "UNKNOWN"}
+            return self._fallback_intent(user_input)
         except Exception as e:
             print(f"[LLM错误] 调用智能体应用失败: {e}")
             # 异常情况，移除刚才添加的用户消息，避免对话历史不完整
             if self.messages and self.messages[-1].get("role") == "user":
                 self.messages.pop()
             # 降级处理：尝试使用简单的正则匹配（作为LLM失败的备用方案）
-            if re.search(r"(退出|再见|结束)", user_input):
-                return {"intent": "EXIT"}
-            if re.search(r"(帮助|能做什么|怎么用)", user_input):
-                return {"intent": "HELP"}
-            return {"intent": "UNKNOWN"}
+            return self._fallback_intent(user_input)
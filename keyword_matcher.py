@@ -0,0 +1,139 @@
+# keyword_matcher.py
+# 控制语句关键词匹配 (Control Utterance Keyword Matcher)
+#
+# 把"确认/取消/退出/帮助"这类控制语句的关键词预编译为一个匹配器，一次扫描完成分类，
+# 供 api_server 的确认/取消快速通道、LLMIntentRecognizer 的降级逻辑和本地意图解析器共用。
+#
+# 关键词分两类：
+# - 整句匹配（whole=True）：整句规范化后与关键词完全相同才算命中，例如"确认"、"不"
+# - 子串匹配（whole=False）：句子中出现即命中，例如"退出"、"帮助"
+#
+# 可以通过环境变量 CONTROL_SYNONYMS 追加同义词，格式：
+#   CONTROL_SYNONYMS="CONFIRM=行,可以,没问题;CANCEL=算了,不用了"
+
+import re
+from config import CONTROL_SYNONYMS
+
+# 规范化时去掉的首尾标点和空白
+_STRIP_CHARS = " \t\r\n。，,.!！?？~～…"
+
+
+def normalize(text):
+    """转小写并去掉首尾空白和标点"""
+    return (text or "").lower().strip(_STRIP_CHARS)
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器
+
+    - 整句关键词放在字典里，规范化后的整句直接查表
+    - 子串关键词编译成一个交替正则（每个标签一个命名分组），由 re 的 C 实现一次扫描；
+      对这类短句，纯 Python 逐字符推进的 Aho-Corasick 自动机反而比 re 慢
+
+    标签按首次添加的顺序确定优先级：同一句话命中多个子串标签时，返回优先级最高的；
+    整句匹配的标签总是优先于子串标签。
+    """
+
+    def __init__(self):
+        self._keywords = []      # (keyword, label, whole)
+        self._priority = {}      # label -> 优先级（越小越优先）
+        self._built = False
+
+    def add(self, keyword, label, whole=False):
+        """添加一个关键词；修改后会在下一次匹配前自动重建自动机"""
+        keyword = normalize(keyword)
+        if not keyword:
+            return
+        self._priority.setdefault(label, len(self._priority))
+        self._keywords.append((keyword, label, whole))
+        self._built = False
+
+    def add_synonyms(self, label, words, whole=None):
+        """为已有标签追加同义词，whole 为 None 时沿用该标签已有关键词的匹配方式"""
+        if whole is None:
+            whole = next((w for _, l, w in self._keywords if l == label), False)
+        for word in words:
+            self.add(word, label, whole)
+
+    def _build(self):
+        """构建整句查找表和子串正则"""
+        whole_words = {}
+        by_label = {}
+        for keyword, label, whole in self._keywords:
+            if whole:
+                whole_words.setdefault(keyword, label)
+            else:
+                by_label.setdefault(label, []).append(keyword)
+
+        groups = []
+        self._group_labels = {}
+        for i, (label, words) in enumerate(sorted(by_label.items(), key=lambda item: self._priority[item[0]])):
+            # 长词在前，保证同一位置优先匹配最长的关键词
+            words = sorted(set(words), key=len, reverse=True)
+            group = f"g{i}"
+            self._group_labels[group] = label
+            groups.append(f"(?P<{group}>{'|'.join(re.escape(w) for w in words)})")
+        self._whole_words = whole_words
+        self._pattern = re.compile("|".join(groups)) if groups else None
+        self._top_label = min(by_label, key=self._priority.get) if by_label else None
+        self._built = True
+
+    def classify(self, text):
+        """
+        返回文本命中的控制标签，没有命中返回 None
+
+        整句关键词必须覆盖整句；子串关键词在多个命中时取优先级最高的标签。
+        """
+        if not self._built:
+            self._build()
+        text = normalize(text)
+        label = self._whole_words.get(text)
+        if label is not None or self._pattern is None:
+            return label
+        best = None
+        for match in self._pattern.finditer(text):
+            label = self._group_labels[match.lastgroup]
+            if label == self._top_label:
+                return label
+            if best is None or self._priority[label] < self._priority[best]:
+                best = label
+        return best
+
+
+def parse_synonyms(spec):
+    """解析 "LABEL=词1,词2;LABEL2=词3" 格式的同义词配置"""
+    synonyms = {}
+    for part in (spec or "").split(";"):
+        if "=" not in part:
+            continue
+        label, words = part.split("=", 1)
+        words = [w.strip() for w in words.split(",") if w.strip()]
+        if label.strip() and words:
+            synonyms.setdefault(label.strip().upper(), []).extend(words)
+    return synonyms
+
+
+def build_control_matcher(synonyms_spec=""):
+    """构建控制语句匹配器：内置关键词 + 配置中的同义词"""
+    matcher = KeywordMatcher()
+    for word in ('确认', 'confirm', 'yes', 'y', '是', '好的', '好'):
+        matcher.add(word, "CONFIRM", whole=True)
+    for word in ('取消', 'cancel', 'no', 'n', '否', '不'):
+        matcher.add(word, "CANCEL", whole=True)
+    for word in ('撤销', '撤回', '撤销上一步', 'undo'):
+        matcher.add(word, "UNDO", whole=True)
+    for word in ('重做', '恢复撤销', 'redo'):
+        matcher.add(word, "REDO", whole=True)
+    # 退出优先于帮助（与原先先匹配退出、再匹配帮助的顺序一致）
+    for word in ('退出', '再见', '结束'):
+        matcher.add(word, "EXIT")
+    for word in ('帮助', '能做什么', '怎么用'):
+        matcher.add(word, "HELP")
+    for label, words in parse_synonyms(synonyms_spec).items():
+        matcher.add_synonyms(label, words)
+    return matcher
+
+
+# 全局共享的控制语句匹配器
+control_matcher = build_control_matcher(CONTROL_SYNONYMS)
@@ -0,0 +1,262 @@
+# llm_client.py
+# LLM 调用层 (LLM Client Layer)
+#
+# 封装对阿里云百炼智能体应用 (Application.call) 的调用：
+# - 截止时间 (deadline)：由 HTTP 层传入，剩余时间作为本次请求的超时
+# - 对冲请求 (hedging)：主请求超过历史 p95 耗时仍未返回时，再发一个相同请求，谁先返回用谁；
+#   通过预算控制对冲比例，避免成本翻倍
+# - 被放弃的请求：截止时间到了或对冲的另一方先返回时，线程中的请求并不会中断；
+#   它们结束前仍计入 abandoned，并通过 on_settled 通知调用方（准入控制据此延迟归还槽位）
+# - 连接池 (http_pool)：所有会话共享的长连接，避免每轮对话重新进行 TLS 握手
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http_pool import PooledHTTPClient
+from config import LLM_MAX_CONCURRENCY, LLM_BACKEND, LOCAL_LLM_LATENCY_MS
+from config import LLM_HTTP_POOL_ENABLED, LLM_HTTP_POOL_SIZE, LLM_HTTP_KEEPALIVE_SECONDS
+from config import LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_BUDGET, LLM_HEDGE_MIN_SAMPLES
+
+
+# dashscope SDK 导入需要数百毫秒，推迟到第一次调用（或启动后的预热）时再导入，缩短冷启动时间
+_application = None
+_import_lock = threading.Lock()
+
+
+def get_application():
+    """返回 dashscope.Application（LLM_BACKEND=local 时返回本地替身），首次调用时导入"""
+    global _application
+    if _application is None:
+        with _import_lock:
+            if _application is None:
+                if LLM_BACKEND == "local":
+                    from local_llm import LocalApplication
+                    _application = LocalApplication(LOCAL_LLM_LATENCY_MS / 1000)
+                else:
+                    from dashscope import Application
+                    _application = Application
+    return _application
+
+
+class LLMDeadlineExceeded(Exception):
+    """在截止时间之前没有拿到 LLM 的响应"""
+
+
+class LatencyTracker:
+    """记录最近若干次调用的耗时，用于计算分位数（线程安全）"""
+
+    def __init__(self, window_size=200):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p):
+        """返回第 p 百分位耗时（秒），没有样本时返回 None"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    对冲预算（令牌桶）：每个主请求存入 ratio 个令牌，每次对冲消耗 1 个令牌。
+    这样对冲请求数长期不超过主请求数的 ratio 倍。
+    """
+
+    def __init__(self, ratio=0.1, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class LLMClient:
+    """
+    所有会话共享的 LLM 调用客户端
+
+    Args:
+        hedge_enabled: 是否启用对冲请求
+        hedge_percentile: 用第几百分位耗时作为对冲等待时间
+        hedge_budget: 对冲请求占主请求的最大比例
+        hedge_min_samples: 至少积累多少个耗时样本后才开始对冲
+        http_pool: 共享的 PooledHTTPClient；None 表示使用 SDK 自己的连接管理
+    """
+
+    def __init__(self, hedge_enabled=False, hedge_percentile=95, hedge_budget=0.1,
+                 hedge_min_samples=20, max_workers=16, http_pool=None):
+        self.hedge_enabled = hedge_enabled
+        self.http_pool = http_pool
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget(ratio=hedge_budget)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._abandoned_lock = threading.Lock()
+
+        # 统计信息
+        self.calls = 0
+        self.hedged_calls = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.abandoned = 0  # 调用方已不再等待、但仍在执行的请求数
+
+    def _hedge_delay(self):
+        """返回对冲等待时间；样本不足时返回 None（不对冲）"""
+        if not self.hedge_enabled or self.latency.count() < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _attempt(self, api_key, app_id, messages, deadline):
+        """执行一次 Application.call，返回 (response, 耗时)"""
+        kwargs = {}
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded("已超过截止时间")
+            kwargs["request_timeout"] = max(1, int(math.ceil(remaining)))
+        if self.http_pool is not None:
+            kwargs["session"] = self.http_pool.get_session()
+        start = time.monotonic()
+        response = get_application().call(api_key=api_key, app_id=app_id, messages=messages, **kwargs)
+        return response, time.monotonic() - start
+
+    def _settle_when_done(self, futures, on_settled):
+        """futures 全部结束后调用 on_settled；仍在执行的请求在结束前计入 abandoned"""
+        running = [future for future in futures if not future.done()]
+        if not running:
+            if on_settled is not None:
+                on_settled()
+            return
+        with self._abandoned_lock:
+            self.abandoned += len(running)
+        remaining = [len(running)]
+
+        def _done(_):
+            with self._abandoned_lock:
+                self.abandoned -= 1
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and on_settled is not None:
+                on_settled()
+
+        for future in running:
+            future.add_done_callback(_done)
+
+    def call(self, api_key, app_id, messages, deadline=None, on_settled=None):
+        """
+        调用智能体应用，返回 ApplicationResponse
+
+        Args:
+            deadline: time.monotonic() 时间戳，超过后抛出 LLMDeadlineExceeded；None 表示不限制
+            on_settled: 本次调用发出的所有请求（含对冲请求）都结束后调用一次（可能在其他线程中）；
+                截止时间到了被放弃的请求会继续执行，on_settled 要等它们结束，可能晚于 call 返回
+        """
+        futures = []
+        try:
+            return self._call(api_key, app_id, messages, deadline, futures)
+        finally:
+            self._settle_when_done(futures, on_settled)
+
+    def _call(self, api_key, app_id, messages, deadline, futures):
+        if deadline is not None and deadline <= time.monotonic():
+            self.deadline_exceeded += 1
+            raise LLMDeadlineExceeded("请求在调用 LLM 之前已超过截止时间")
+
+        self.calls += 1
+        self.budget.deposit()
+        # 复制一份消息列表，调用期间调用方继续修改历史也不受影响
+        messages = list(messages)
+        primary = self._executor.submit(self._attempt, api_key, app_id, messages, deadline)
+        futures.append(primary)
+        pending = {primary}
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None and (deadline is None or time.monotonic() + hedge_delay < deadline):
+            done, _ = wait(pending, timeout=hedge_delay)
+            # 每个请求最多对冲一次，且受全局预算限制
+            if not done and self.budget.try_spend():
+                self.hedged_calls += 1
+                hedge = self._executor.submit(self._attempt, api_key, app_id, messages, deadline)
+                futures.append(hedge)
+                pending.add(hedge)
+
+        last_error = None
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    response, elapsed = future.result()
+                except Exception as e:
+                    # 其中一个请求失败，继续等待另一个
+                    last_error = e
+                    continue
+                self.latency.record(elapsed)
+                if future is not primary:
+                    self.hedge_wins += 1
+                return response
+
+        if last_error is not None and not pending:
+            raise last_error
+        self.deadline_exceeded += 1
+        raise LLMDeadlineExceeded("在截止时间之前没有拿到 LLM 响应")
+
+    def prewarm(self):
+        """预先导入 dashscope SDK 并创建连接池，返回耗时（秒）；已完成时几乎不耗时"""
+        start = time.monotonic()
+        try:
+            get_application()
+            if self.http_pool is not None:
+                self.http_pool.get_session()
+        except Exception as e:
+            print(f"[系统警告] 预热 dashscope SDK 失败: {e}")
+        return time.monotonic() - start
+
+    def stats(self):
+        """返回调用统计"""
+        return {
+            "calls": self.calls,
+            "hedged_calls": self.hedged_calls,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "abandoned": self.abandoned,
+            "p50_latency": self.latency.percentile(50),
+            "p95_latency": self.latency.percentile(95),
+            "http_pool": self.http_pool.stats() if self.http_pool is not None else None,
+        }
+
+
+# 全局共享的 LLM 客户端
+llm_client = LLMClient(
+    hedge_enabled=LLM_HEDGE_ENABLED,
+    hedge_percentile=LLM_HEDGE_PERCENTILE,
+    hedge_budget=LLM_HEDGE_BUDGET,
+    hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+    max_workers=LLM_MAX_CONCURRENCY * 2,
+    http_pool=PooledHTTPClient(LLM_HTTP_POOL_SIZE, LLM_HTTP_KEEPALIVE_SECONDS) if LLM_HTTP_POOL_ENABLED else None
+)
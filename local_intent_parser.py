@@ -0,0 +1,146 @@
+# local_intent_parser.py
+# 本地意图解析器 (Local Intent Parser)
+#
+# 不依赖 LLM 的规则解析，用于 LLM 不可用（熔断、未配置）时的降级服务。
+# 只覆盖最常见的几种句式，输出格式与 LLMIntentRecognizer._normalize_intent_data 一致。
+
+import re
+from keyword_matcher import control_matcher
+
+# 确认/取消/退出/帮助由共享的 control_matcher 识别：
+# 确认/取消只在整句完全匹配时生效，避免"不要删除"之类被误判
+_RESET_PATTERN = re.compile(r"(重置对话|清空对话|清除对话)")
+
+# 删除：清空XX / 删除XX(的)所有内容
+_DELETE_PATTERNS = [
+    re.compile(r"^(?:请)?(?:删除|清空|清除)(?P<title>.*?)(?:的)?(?:所有|全部)内容$"),
+    re.compile(r"^(?:请)?清空(?P<title>.+)$"),
+]
+
+# 添加：把XX加到/添加到/记到YY(的)(开头|结尾)
+_ADD_PATTERNS = [
+    re.compile(r"^(?:请)?把(?P<content>.+?)(?:加到|添加到|加入到?|记到|写到|放到)(?P<title>.+?)(?:的)?(?P<position>开头|结尾|末尾|最前面|最后面)?$", re.S),
+    re.compile(r"^(?:请)?(?:添加|记录|记下)(?:一下)?[：:\s](?P<content>.+)$", re.S),
+]
+
+# 修改：把(YY里的)XX改成ZZ
+_EDIT_PATTERN = re.compile(r"^(?:请)?把(?:(?P<title>[^里中]+?)(?:里|中)的?)?(?P<target>.+?)(?:改成|改为|修改为|替换为|换成)(?P<content>.+)$", re.S)
+
+# 移动：把XX移到YY(的)(开头|结尾)
+_MOVE_PATTERN = re.compile(r"^(?:请)?把(?P<content>.+?)(?:移到|移动到|挪到)(?P<title>.*?)(?:的)?(?P<position>开头|结尾|末尾|最前面|最后面)?$", re.S)
+
+# 搜索：搜索/查找XX、XX在哪(里)、我把XX存在哪了
+_SEARCH_PATTERNS = [
+    re.compile(r"^(?:请)?(?:搜索|搜一下|查找|找一下|检索)(?:一下)?(?P<query>.+)$"),
+    re.compile(r"^(?:我)?把?(?P<query>.+?)(?:存|记|放|保存)?(?:在|到)?哪(?:里|儿)?了?[？?]?$"),
+]
+
+# 切换：打开XX / 切换到XX
+_SET_ACTIVE_PATTERN = re.compile(r"^(?:请)?(?:打开|切换到|切到|进入)(?P<title>.+)$")
+
+# 查看：查看/显示/看看XX
+_DISPLAY_PATTERN = re.compile(r"^(?:请)?(?:查看|显示|看看|看一下|展示)(?P<title>.*)$")
+
+_POSITION_MAPPING = {
+    "开头": "start",
+    "最前面": "start",
+    "结尾": "end",
+    "末尾": "end",
+    "最后面": "end",
+}
+
+# 降级模式下无法理解指令时的提示
+DEGRADED_HINT = (
+    "智能识别服务暂时不可用，目前仅支持简单指令，例如："
+    "'把XX加到默认文档的结尾'、'查看默认文档'、'打开学习笔记'、'清空默认文档'、'帮助'。"
+)
+
+
+def _resolve_title(raw_title, doc_titles):
+    """把句子里提到的文档名对应到已有文档；找不到时原样返回（空则返回 None）"""
+    title = (raw_title or "").strip().strip("'\"“”‘’《》「」")
+    if not title or title in ("文档", "当前文档", "这个文档"):
+        return None
+    if not doc_titles or title in doc_titles:
+        return title
+    # 优先完全包含关系，例如"项目周报文档" -> "项目周报"
+    for known in doc_titles:
+        if known in title or title in known:
+            return known
+    return title
+
+
+def parse_intent(user_input, doc_titles=None):
+    """
+    解析用户输入，返回与 LLM 输出同格式的意图字典
+
+    Args:
+        user_input: 用户输入文本
+        doc_titles: 当前已有的文档标题列表，用于匹配文档名
+
+    Returns:
+        意图字典，至少包含 "intent" 字段
+    """
+    text = (user_input or "").strip()
+    control = control_matcher.classify(text)
+
+    if control in ("CONFIRM", "CANCEL", "UNDO", "REDO"):
+        return {"intent": control}
+    if _RESET_PATTERN.search(text):
+        return {"intent": "RESET_CONVERSATION"}
+
+    for pattern in _DELETE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return {
+                "intent": "DELETE_CONTENT",
+                "doc_title": _resolve_title(match.group("title"), doc_titles),
+                "confirmation_needed": True,
+            }
+
+    match = _EDIT_PATTERN.match(text)
+    if match:
+        return {
+            "intent": "EDIT_CONTENT",
+            "doc_title": _resolve_title(match.group("title"), doc_titles),
+            "content": match.group("content").strip(),
+            "position": match.group("target").strip(),
+        }
+
+    match = _MOVE_PATTERN.match(text)
+    if match:
+        return {
+            "intent": "MOVE_CONTENT",
+            "doc_title": _resolve_title(match.group("title"), doc_titles),
+            "content": match.group("content").strip(),
+            "position": _POSITION_MAPPING.get(match.group("position") or "", "end"),
+        }
+
+    for pattern in _ADD_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            groups = match.groupdict()
+            return {
+                "intent": "ADD_CONTENT",
+                "doc_title": _resolve_title(groups.get("title"), doc_titles),
+                "content": groups["content"].strip(),
+                "position": _POSITION_MAPPING.get(groups.get("position") or "", "end"),
+            }
+
+    for pattern in _SEARCH_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return {"intent": "SEARCH", "content": match.group("query").strip()}
+
+    match = _SET_ACTIVE_PATTERN.match(text)
+    if match:
+        return {"intent": "SET_ACTIVE", "doc_title": _resolve_title(match.group("title"), doc_titles)}
+
+    match = _DISPLAY_PATTERN.match(text)
+    if match:
+        return {"intent": "DISPLAY_DOC", "doc_title": _resolve_title(match.group("title"), doc_titles)}
+
+    if control in ("EXIT", "HELP"):
+        return {"intent": control}
+
+    return {"intent": "UNKNOWN", "content": DEGRADED_HINT}
@@ -0,0 +1,70 @@
+# local_llm.py
+# 本地 LLM 替身 (Local LLM Stand-in)
+#
+# 设置 LLM_BACKEND=local 时，llm_client 不调用 DashScope，而是调用这里的 LocalApplication：
+# - 接口与 dashscope.Application.call 兼容，返回结构相同的响应对象
+# - 默认用本地规则解析器 (local_intent_parser) 生成意图 JSON，并按 LOCAL_LLM_LATENCY_MS 模拟耗时
+# - 回放录制文件时，可以预先载入录制的 LLM 原始输出和耗时，按原样返回（见 replay.py）
+#
+# 用于压测、回放和离线开发，不消耗 API 配额。
+
+import itertools
+import json
+import threading
+import time
+from http import HTTPStatus
+from types import SimpleNamespace
+
+from local_intent_parser import parse_intent
+
+
+class LocalApplication:
+    """
+    与 dashscope.Application 接口兼容的本地替身
+
+    Args:
+        latency_seconds: 没有录制数据时每次调用模拟的耗时
+    """
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.latency_scale = 1.0      # 回放加速时按倍数缩短录制的耗时
+        self._recorded = {}           # 用户输入 -> (原始输出, 耗时秒)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.recorded_hits = 0
+
+    def load_recording(self, text, raw_output, latency_seconds):
+        """载入一条录制的 LLM 输出：之后遇到相同的用户输入时原样返回"""
+        with self._lock:
+            self._recorded[text] = (raw_output, latency_seconds)
+
+    def call(self, api_key=None, app_id=None, messages=None, request_timeout=None, **kwargs):
+        user_text = ""
+        for message in reversed(messages or []):
+            if message.get("role") == "user":
+                user_text = message.get("content") or ""
+                break
+
+        with self._lock:
+            self.calls += 1
+            recorded = self._recorded.get(user_text)
+            if recorded is not None:
+                self.recorded_hits += 1
+            request_id = f"local-{next(self._ids)}"
+
+        if recorded is not None:
+            raw_output, latency = recorded
+            latency *= self.latency_scale
+        else:
+            raw_output = json.dumps(parse_intent(user_text), ensure_ascii=False)
+            latency = self.latency_seconds
+
+        if latency > 0:
+            time.sleep(min(latency, request_timeout) if request_timeout else latency)
+        if request_timeout and latency > request_timeout:
+            return SimpleNamespace(status_code=HTTPStatus.REQUEST_TIMEOUT, request_id=request_id,
+                                   code="RequestTimeOut", message="本地替身模拟超时", output=None)
+        return SimpleNamespace(status_code=HTTPStatus.OK, request_id=request_id, code="", message="",
+                               output=SimpleNamespace(text=raw_output))
@@ -0,0 +1,144 @@
+# mapped_document.py
+# 内存映射的大文档读取 (Memory-Mapped Document Reader)
+#
+# 几百 MB 的归档文档如果整篇读成 str 再切分，内存翻倍、加载要几秒。
+# MappedLines 用 mmap 映射文档文件，对外表现为只读的行序列：
+# - 行偏移索引按需建立：读取第 n 行时只扫描到第 n 行所在的位置（每次扫描约 1MB），
+#   显示第一页不需要读完整个文件；只有求总行数或访问末尾时才会扫描全文
+# - 区间读取直接从映射上解码（memoryview 切片不复制字节）
+# - 文件内容由操作系统页缓存管理，不占用 Python 堆内存
+# 文档需要修改时，由 DocumentManager 先转换为可写的 CompactLines（见 to_compact）。
+#
+# 注意：文件在映射期间若被原地截断，访问被截掉的部分会导致进程崩溃 (SIGBUS)。
+# DocumentManager 保存文档时先写临时文件再原子替换，不会截断已映射的文件；
+# 外部工具修改文档也应采用"写临时文件 + 重命名"的方式。
+
+import mmap
+import threading
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate, count
+from operator import add
+
+from compact_lines import CompactLines
+
+# 每次建立行索引时扫描的字节数
+_INDEX_CHUNK = 1 << 20
+
+# 迭代时每次解码的行数
+_ITER_BATCH = 4096
+
+# 与 str.strip() 一致地去掉首尾空白（只处理 ASCII 空白字符）
+_WHITESPACE = frozenset(b" \t\r\n\x0b\x0c")
+
+
+class MappedLines(Sequence):
+    """
+    只读、按需建立行索引的内存映射文档
+
+    与按文本模式读取保持一致：去掉首尾空白，\\r\\n 视为换行（单独的 \\r 不视为换行）；
+    无法解码的字节替换为 U+FFFD。
+
+    Args:
+        path: 文档文件路径（文件不能为空）
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        start, stop = 0, len(self._mm)
+        while start < stop and self._mm[start] in _WHITESPACE:
+            start += 1
+        while stop > start and self._mm[stop - 1] in _WHITESPACE:
+            stop -= 1
+        self._start = start
+        self._stop = stop
+        self._ends = array("Q")       # 已建立索引的各行结束偏移（指向行尾的 \n）
+        self._scanned = start         # 下一段尚未建立索引的内容的起点
+        self._complete = start >= stop
+        self._lock = threading.Lock()
+
+    def _index_until(self, lines):
+        """建立行索引，直到至少有 lines 行或扫描完全文"""
+        if len(self._ends) >= lines or self._complete:
+            return
+        with self._lock:
+            while len(self._ends) < lines and not self._complete:
+                pos = self._scanned
+                # 分块扫描，块边界落在换行符上
+                stop = self._mm.find(b"\n", pos + _INDEX_CHUNK, self._stop)
+                if stop < 0:
+                    stop = self._stop
+                lengths = map(len, self._mm[pos:stop].split(b"\n"))
+                self._ends.extend(map(add, accumulate(lengths), count(pos)))
+                if stop >= self._stop:
+                    self._complete = True
+                else:
+                    self._scanned = stop + 1
+
+    def known_length(self):
+        """已经扫描完全文时返回总行数，否则返回 None（不会触发扫描）"""
+        return len(self._ends) if self._complete else None
+
+    def __len__(self):
+        self._index_until(float("inf"))
+        return len(self._ends)
+
+    def _decode_range(self, i, j):
+        """解码第 i 到 j-1 行（调用前需已建立索引）"""
+        start = self._ends[i - 1] + 1 if i > 0 else self._start
+        text = str(self._view[start:self._ends[j - 1]], "utf-8", "replace")
+        lines = text.split("\n")
+        if "\r" in text:
+            lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+        return lines
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            step = index.step or 1
+            if step == 1 and (index.start or 0) >= 0 and index.stop is not None and index.stop >= 0:
+                # 非负区间只需把索引建到区间末尾
+                self._index_until(index.stop)
+                i, j = index.start or 0, min(index.stop, len(self._ends))
+            else:
+                i, j, step = index.indices(len(self))
+                if step != 1:
+                    return [self[k] for k in range(i, j, step)]
+            return self._decode_range(i, j) if i < j else []
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            self._index_until(index + 1)
+        if not 0 <= index < len(self._ends):
+            raise IndexError("行号超出范围")
+        return self._decode_range(index, index + 1)[0]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._index_until(i + _ITER_BATCH)
+            j = min(i + _ITER_BATCH, len(self._ends))
+            if i >= j:
+                return
+            yield from self._decode_range(i, j)
+            i = j
+
+    def __sizeof__(self):
+        # 映射的文件内容在页缓存中，不计入 Python 对象的大小
+        return object.__sizeof__(self) + self._ends.__sizeof__()
+
+    def __repr__(self):
+        return f"MappedLines({self.path!r}, bytes={self._stop - self._start})"
+
+    def to_compact(self):
+        """读出全文，转换为可修改的 CompactLines"""
+        data = self._mm[self._start:self._stop]
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n")
+        return CompactLines.from_text(data.decode("utf-8", "replace"))
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
@@ -0,0 +1,236 @@
+# memory_accounting.py
+# 内存占用统计 (Memory Accounting)
+#
+# 估算每个会话占用的内存，并按组件拆分：
+# - documents:      DocumentManager.documents（每个会话各有一份文档内容的副本）
+# - messages:       发送给 LLM 的对话历史及摘要状态
+# - doc_context:    缓存的文档上下文消息
+# - pending_action: 等待确认的操作
+# 同时给出占用最多的若干会话和进程 RSS，供 /api/admin/memory 和按内存淘汰会话使用。
+# 检索索引由同一目录的所有会话共享，单独计入 search_index_bytes，不算在任何会话名下。
+#
+# 估算基于 sys.getsizeof 的递归累加；元素很多的容器只按步长抽样测量、再按元素个数放大，
+# 因此一次统计的开销与会话数成正比，而不是与文档总行数成正比，可以在生产环境周期性运行。
+# 会话组件是延迟创建的，统计时只看已经创建的组件，不会因为统计而创建它们。
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from search_index import search_indexes
+
+# 容器元素超过该数量时改为抽样估算
+SAMPLE_LIMIT = 256
+
+_ATOMIC_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def deep_sizeof(obj, seen=None, sample_limit=SAMPLE_LIMIT):
+    """
+    估算对象及其引用的对象占用的字节数
+
+    seen 用于在多次调用之间去重（同一个对象只计一次）；
+    元素超过 sample_limit 的 list/tuple/set/dict 只测量等间隔抽取的 sample_limit 个元素，再按比例放大。
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _ATOMIC_TYPES):
+        return size
+
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        sampled, scale = _sample(items, sample_limit)
+        return size + int(scale * sum(deep_sizeof(key, seen, sample_limit) + deep_sizeof(value, seen, sample_limit)
+                                      for key, value in sampled))
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        # list/tuple 可以按下标抽样，不必先复制一份
+        items = obj if isinstance(obj, (list, tuple)) else list(obj)
+        sampled, scale = _sample(items, sample_limit)
+        return size + int(scale * sum(deep_sizeof(item, seen, sample_limit) for item in sampled))
+    if hasattr(obj, "__dict__"):
+        return size + deep_sizeof(vars(obj), seen, sample_limit)
+    return size
+
+
+def _sample(items, limit):
+    """按步长抽样，返回 (样本, 放大倍数)"""
+    if len(items) <= limit:
+        return items, 1.0
+    step = len(items) / limit
+    return [items[int(i * step)] for i in range(limit)], len(items) / limit
+
+
+def process_rss():
+    """进程当前的常驻内存（字节）；无法获取时返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # 非 Linux 平台只能拿到峰值 RSS（macOS 单位是字节，其余是 KB）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def session_footprint(instance, sample_limit=SAMPLE_LIMIT):
+    """
+    估算一个 SmartClipLLM 会话各组件占用的字节数
+
+    Returns:
+        {组件名: 字节数}，尚未创建的组件不出现在结果中
+    """
+    components = instance.__dict__
+    seen = set()
+    footprint = {}
+
+    doc_manager = components.get("doc_manager")
+    if doc_manager is not None:
+        footprint["documents"] = deep_sizeof(doc_manager.documents, seen, sample_limit)
+        # 撤销记录中的内容大小在记录时已经估算过
+        footprint["undo_log"] = doc_manager.operation_log.stats()["bytes"]
+
+    recognizer = components.get("intent_recognizer")
+    if recognizer is not None:
+        footprint["messages"] = (deep_sizeof(recognizer.messages, seen, sample_limit)
+                                 + deep_sizeof(recognizer.compactor, seen, sample_limit))
+        footprint["doc_context"] = deep_sizeof(recognizer.context_builder, seen, sample_limit)
+
+    footprint["pending_action"] = deep_sizeof(instance.pending_action, seen, sample_limit)
+    return footprint
+
+
+def _measure(instance, sample_limit):
+    """统计期间会话可能正在被修改，遇到"迭代时大小改变"就重试一次，仍失败则放弃该会话"""
+    for _ in range(2):
+        try:
+            return session_footprint(instance, sample_limit)
+        except RuntimeError:
+            continue
+    return None
+
+
+def rank_sessions(sessions, sample_limit=SAMPLE_LIMIT):
+    """
+    按估算占用从大到小排列会话，可直接用于按内存淘汰会话
+
+    Returns:
+        [(总字节数, session_id, {组件名: 字节数})]
+    """
+    footprints = []
+    for session_id, instance in list(sessions.items()):
+        footprint = _measure(instance, sample_limit)
+        if footprint is not None:
+            footprints.append((sum(footprint.values()), session_id, footprint))
+    footprints.sort(key=lambda item: item[0], reverse=True)
+    return footprints
+
+
+def search_index_size(index, sample_limit=SAMPLE_LIMIT):
+    """估算一个共享检索索引占用的字节数"""
+    seen = set()
+    return sum(deep_sizeof(part, seen, sample_limit)
+               for part in (index.postings, index.doc_terms, index.fingerprints, index.line_counts))
+
+
+def memory_report(sessions, top_n=10, shared_doc_manager=None, sample_limit=SAMPLE_LIMIT):
+    """
+    生成内存报告
+
+    Args:
+        sessions: {session_id: SmartClipLLM}
+        top_n: 列出占用最多的会话数
+        shared_doc_manager: 无会话读取文档时使用的共享 DocumentManager（单独计入 shared_bytes）
+
+    Returns:
+        dict：进程 RSS、估算总量、按组件汇总、占用最多的会话
+    """
+    started = time.perf_counter()
+    footprints = rank_sessions(sessions, sample_limit)
+    by_component = {}
+    for _, _, footprint in footprints:
+        for name, size in footprint.items():
+            by_component[name] = by_component.get(name, 0) + size
+
+    shared = 0
+    if shared_doc_manager is not None:
+        shared = deep_sizeof(shared_doc_manager.documents, None, sample_limit)
+    index_bytes = 0
+    for index in search_indexes():
+        try:
+            index_bytes += search_index_size(index, sample_limit)
+        except RuntimeError:
+            # 统计期间索引正在被修改，这次跳过
+            pass
+
+    return {
+        "rss_bytes": process_rss(),
+        "sessions": len(footprints),
+        "estimated_session_bytes": sum(item[0] for item in footprints),
+        "shared_bytes": shared,
+        "search_index_bytes": index_bytes,
+        "by_component": by_component,
+        "top_sessions": [
+            {"session_id": session_id, "total_bytes": total, "components": footprint}
+            for total, session_id, footprint in footprints[:top_n]
+        ],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+class MemorySampler:
+    """
+    后台周期采样：保存最近一次完整报告和最近若干次的汇总（时间、RSS、估算总量、会话数）
+
+    Args:
+        report_fn: 无参函数，返回 memory_report() 的结果
+        interval_seconds: 采样间隔
+        history_size: 保留的汇总条数
+    """
+
+    def __init__(self, report_fn, interval_seconds=60.0, history_size=60):
+        self.report_fn = report_fn
+        self.interval_seconds = float(interval_seconds)
+        self.history = deque(maxlen=history_size)
+        self.latest = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        report = self.report_fn()
+        self.latest = report
+        self.history.append({
+            "ts": round(time.time(), 3),
+            "rss_bytes": report["rss_bytes"],
+            "estimated_session_bytes": report["estimated_session_bytes"],
+            "sessions": report["sessions"],
+        })
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[系统警告] 内存采样失败: {e}")
+
+    def start(self):
+        if self._thread is None and self.interval_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,169 @@
+# operation_log.py
+# 撤销/重做操作日志 (Undo/Redo Operation Log)
+#
+# DocumentManager 的每次修改（添加、修改、移动、清空）都可以表示为对文档的若干次"区间替换"：
+# 把第 start 行起的 old 行替换为 new 行。日志只记录这些替换，撤销时按相反顺序把 new 换回 old，重做时再换回来。
+# - 撤销前核对文档中对应位置仍是 new 的内容，文档已被其他会话改动到无法对上时拒绝撤销，不会误删别人的内容
+# - 撤销栈是一个有界的环形缓冲：条数超过上限、或记录的内容估算超过字节预算时丢弃最旧的记录
+# - 清空文档时直接保留被替换下来的文档对象（紧凑存储或内存映射），不再复制一份内容
+# 新的修改会清空重做栈。单次修改超过字节预算而无法记录时，更早的记录也一并丢弃：
+# 撤销必须逐步回退，不能越过一次没有记录的修改去撤销它之前的修改。
+
+from collections import deque
+
+from compact_lines import CompactLines
+from mapped_document import MappedLines
+
+
+def _lines_size(lines):
+    """估算一组行占用的字节数（用于字节预算）"""
+    if isinstance(lines, CompactLines):
+        return lines.__sizeof__()
+    if isinstance(lines, MappedLines):
+        # 内容在页缓存中，只计行索引
+        return lines.__sizeof__()
+    return sum(len(line) for line in lines) + 8 * len(lines)
+
+
+class Operation:
+    """
+    一次可撤销的修改
+
+    Args:
+        title: 文档标题
+        description: 给用户看的描述，例如 "清空文档 '默认文档'"
+        splices: [(start, old_lines, new_lines)]，按执行顺序排列
+    """
+
+    __slots__ = ("title", "description", "splices", "size")
+
+    def __init__(self, title, description, splices):
+        self.title = title
+        self.description = description
+        self.splices = splices
+        self.size = sum(_lines_size(old) + _lines_size(new) for _, old, new in splices)
+
+    def inverse(self):
+        """撤销这次修改的操作：每次替换反过来，并按相反顺序执行"""
+        return Operation(self.title, self.description,
+                         [(start, new, old) for start, old, new in reversed(self.splices)])
+
+
+class OperationLog:
+    """
+    有界的撤销/重做栈
+
+    Args:
+        max_operations: 最多保留的可撤销操作数（0 表示不记录）
+        max_bytes: 记录内容的估算字节上限；单次修改超过该上限时不记录（无法撤销）
+    """
+
+    def __init__(self, max_operations=20, max_bytes=16 * 1024 * 1024):
+        self.max_operations = max(0, int(max_operations))
+        self.max_bytes = max_bytes
+        self._undo = deque()
+        self._redo = deque()
+        self._bytes = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.max_operations > 0
+
+    def can_record(self, *line_groups):
+        """替换掉（或换上）这些行的修改能否被记录，即能否撤销"""
+        return self.enabled and sum(_lines_size(lines) for lines in line_groups) <= self.max_bytes
+
+    def record(self, operation):
+        """
+        记录一次新的修改（清空重做栈）
+
+        Returns:
+            是否已记录（可以撤销）；超过字节预算时不记录，并清空撤销栈
+        """
+        if not self.enabled:
+            return False
+        self._clear_redo()
+        if operation.size > self.max_bytes:
+            # 这次修改无法撤销，之前的记录都建立在它之前的内容上，不能再越过它撤销
+            self.dropped += 1 + len(self._undo)
+            self._bytes -= sum(op.size for op in self._undo)
+            self._undo.clear()
+            return False
+        self._push(self._undo, operation)
+        return True
+
+    def _push(self, stack, operation):
+        stack.append(operation)
+        self._bytes += operation.size
+        # 超出条数或字节预算时丢弃最旧的记录（撤销栈和重做栈共用预算）
+        while len(stack) > self.max_operations or self._bytes > self.max_bytes:
+            oldest = (self._undo or self._redo).popleft()
+            self._bytes -= oldest.size
+            self.dropped += 1
+
+    def _clear_redo(self):
+        self._bytes -= sum(operation.size for operation in self._redo)
+        self._redo.clear()
+
+    def peek_undo(self):
+        return self._undo[-1] if self._undo else None
+
+    def peek_redo(self):
+        return self._redo[-1] if self._redo else None
+
+    def pop_undo(self):
+        """撤销成功后调用：把最近的操作移到重做栈"""
+        operation = self._undo.pop()
+        self._bytes -= operation.size
+        self._push(self._redo, operation)
+        return operation
+
+    def pop_redo(self):
+        """重做成功后调用：把操作移回撤销栈"""
+        operation = self._redo.pop()
+        self._bytes -= operation.size
+        self._push(self._undo, operation)
+        return operation
+
+    def discard_undo(self):
+        """最近的操作已无法撤销（文档被其他会话改动过），丢弃它"""
+        operation = self._undo.pop()
+        self._bytes -= operation.size
+
+    def discard_redo(self):
+        operation = self._redo.pop()
+        self._bytes -= operation.size
+
+    def forget_document(self, title):
+        """文档在磁盘上被删除时丢弃它的全部记录"""
+        for stack in (self._undo, self._redo):
+            kept = [operation for operation in stack if operation.title != title]
+            if len(kept) != len(stack):
+                self._bytes -= sum(operation.size for operation in stack if operation.title == title)
+                stack.clear()
+                stack.extend(kept)
+
+    def stats(self):
+        return {"undo": len(self._undo), "redo": len(self._redo), "bytes": self._bytes, "dropped": self.dropped}
+
+
+def apply_splices(doc, splices):
+    """
+    在文档上依次执行区间替换；执行前核对每处的现有内容
+
+    Returns:
+        是否全部核对通过并已执行（核对失败时文档保持不变）
+    """
+    applied = []
+    for start, old, new in splices:
+        old_len = len(old)
+        current = doc[start:start + old_len]
+        if len(current) != old_len or list(current) != list(old):
+            # 回滚已经执行的替换，文档恢复原状
+            for done_start, done_old, done_new in reversed(applied):
+                doc[done_start:done_start + len(done_new)] = list(done_old)
+            return False
+        doc[start:start + old_len] = list(new)
+        applied.append((start, old, new))
+    return True
@@ -0,0 +1,172 @@
+# prefetch.py
+# 输入过程中的预取 (Speculative Prefetch)
+#
+# 前端在用户输入过程中把尚未发送的半句话发到 /api/chat/prefetch。这里用本地规则解析器（不调用 LLM）
+# 猜出可能的意图和目标文档，提前完成这一轮对话中与 LLM 无关的准备工作：
+# - 创建会话的 DocumentManager 和意图识别器（新会话第一次要扫描文档目录、同步检索索引）
+# - 应用目录中的文件变更，重建文档上下文消息（标题列表）缓存
+# - 预热目标文档：显示类意图读取第一页（内存映射文档建立行索引），修改类意图提前把内存映射文档读入内存
+# 等正式的 /api/chat 到达时，这些工作大多已经做完，只剩 LLM 调用。
+#
+# 预取只是优化，不改变任何结果：
+# - 每个会话同一时间只有一个预取，新的按键会取消上一次；正式请求到达时也会取消进行中的预取
+# - 预取持有会话锁执行，与正式请求串行；会话正在处理正式请求时直接跳过
+# - 每步都在文档 I/O 线程池中执行，取消在步与步之间生效（线程中正在执行的一步做完才释放会话锁）
+# - 意图和目标文档与上次预取相同、文档集合也没有变化时不再重复预热；每个会话每分钟最多预取 max_per_minute 次
+# - 只为已有的会话预取；按会话记录的限流和预热状态最多保留 max_sessions 个会话（按最近使用淘汰）
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from config import DOC_CONTEXT_ENABLED, DISPLAY_DOC_MAX_LINES
+from doc_io import run_io
+from local_intent_parser import parse_intent
+
+# 需要预先读入第一页的意图
+_READ_INTENTS = ("DISPLAY_DOC",)
+# 会修改文档内容的意图：提前把内存映射的只读文档读入内存
+_WRITE_INTENTS = ("ADD_CONTENT", "EDIT_CONTENT", "MOVE_CONTENT")
+
+
+class SpeculativePrefetcher:
+    """
+    按会话管理输入过程中的预取任务
+
+    Args:
+        max_per_minute: 每个会话每分钟最多执行的预取次数（超出的请求直接跳过）
+        max_sessions: 最多为多少个会话保留限流和预热状态（超出时丢弃最久没有预取的会话）
+    """
+
+    def __init__(self, max_per_minute=30, max_sessions=1024):
+        self.max_per_minute = max(1, int(max_per_minute))
+        self.max_sessions = max(1, int(max_sessions))
+        self._tasks = {}                # 会话 ID -> 进行中的预取任务
+        self._holding = set()           # 正由预取持有会话锁的会话
+        self._recent = OrderedDict()    # 会话 ID -> 最近一分钟内预取的开始时间
+        self._warm_keys = OrderedDict() # 会话 ID -> 上次完成预热时的 (意图, 目标文档, 文档集合版本, 活跃文档)
+        self.counts = {"done": 0, "cached": 0, "cancelled": 0, "busy": 0, "throttled": 0}
+
+    def cancel(self, session_id):
+        """取消会话进行中的预取（新的按键或正式请求到达时调用）"""
+        task = self._tasks.pop(session_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def _touch(self, table, session_id, value):
+        """按最近使用顺序记录会话的状态，超出 max_sessions 时丢弃最旧的会话"""
+        table[session_id] = value
+        table.move_to_end(session_id)
+        while len(table) > self.max_sessions:
+            table.popitem(last=False)
+
+    def _allow(self, session_id):
+        """每个会话每分钟的预取次数上限"""
+        now = time.monotonic()
+        recent = self._recent.get(session_id)
+        if recent is None:
+            recent = deque()
+        self._touch(self._recent, session_id, recent)
+        while recent and now - recent[0] > 60:
+            recent.popleft()
+        if len(recent) >= self.max_per_minute:
+            return False
+        recent.append(now)
+        return True
+
+    async def prefetch(self, session_id, app_instance, lock, text):
+        """
+        为一段尚未发送的输入预取
+
+        Args:
+            lock: 会话锁（与 /api/chat 共用）
+
+        Returns:
+            {"status", "intent", "doc_title", "warmed"}；status 为 done / cached / cancelled / busy / throttled
+        """
+        previous = self._tasks.get(session_id)
+        if previous is not None:
+            # 取消上一次按键的预取
+            previous.cancel()
+        if not self._allow(session_id):
+            return self._result("throttled")
+        task = asyncio.create_task(self._run(session_id, app_instance, lock, text, previous))
+        self._tasks[session_id] = task
+        await asyncio.wait({task})
+        if self._tasks.get(session_id) is task:
+            del self._tasks[session_id]
+        if task.cancelled():
+            return self._result("cancelled")
+        return task.result()
+
+    def _result(self, status, intent=None, doc_title=None, warmed=()):
+        self.counts[status] += 1
+        return {"status": status, "intent": intent, "doc_title": doc_title, "warmed": list(warmed)}
+
+    async def _step(self, fn, *args):
+        """在文档 I/O 线程池中执行一步；被取消时等这一步做完再向上传递（期间仍持有会话锁）"""
+        future = asyncio.ensure_future(run_io(fn, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait({future})
+            raise
+
+    async def _run(self, session_id, app_instance, lock, text, previous):
+        if previous is not None:
+            # 等被取消的上一次预取结束（它可能还在做线程中的一步）
+            await asyncio.wait({previous})
+        if lock.locked() and session_id not in self._holding:
+            # 会话正在处理正式请求，这次不做
+            return self._result("busy")
+        async with lock:
+            self._holding.add(session_id)
+            try:
+                return await self._warm(session_id, app_instance, text)
+            finally:
+                self._holding.discard(session_id)
+
+    async def _warm(self, session_id, app_instance, text):
+        warmed = []
+        if "doc_manager" not in app_instance.__dict__:
+            warmed.append("documents")
+        key = await self._step(_classify, app_instance, text)
+        intent, doc_title = key[0], key[1]
+        if self._warm_keys.get(session_id) == key:
+            return self._result("cached", intent, doc_title, warmed)
+
+        if DOC_CONTEXT_ENABLED:
+            await self._step(_warm_context, app_instance)
+            warmed.append("doc_context")
+        if doc_title is not None:
+            if await self._step(_warm_document, app_instance, doc_title, intent):
+                warmed.append("document")
+        self._touch(self._warm_keys, session_id, key)
+        return self._result("done", intent, doc_title, warmed)
+
+    def stats(self):
+        return {"in_flight": len(self._tasks), "sessions": len(self._recent), **self.counts}
+
+
+def _classify(app_instance, text):
+    """本地规则解析半句输入，返回预热键 (意图, 目标文档, 文档集合版本, 活跃文档)"""
+    doc_manager = app_instance.doc_manager
+    intent_data = parse_intent(text, doc_manager.get_document_titles())
+    intent = intent_data.get("intent") or "UNKNOWN"
+    doc_title = None
+    if intent in _READ_INTENTS + _WRITE_INTENTS:
+        doc_title = intent_data.get("doc_title") or doc_manager.active_doc_title
+    return intent, doc_title, doc_manager.titles_version, doc_manager.active_doc_title
+
+
+def _warm_context(app_instance):
+    """创建意图识别器并重建文档上下文消息缓存"""
+    recognizer = app_instance.intent_recognizer
+    recognizer.context_builder.context_message(app_instance.doc_manager)
+
+
+def _warm_document(app_instance, doc_title, intent):
+    if intent in _WRITE_INTENTS:
+        return app_instance.doc_manager.warm_document(doc_title, writable=True)
+    # 与 DISPLAY_DOC 处理函数读取的范围一致
+    return app_instance.doc_manager.warm_document(doc_title, lines=DISPLAY_DOC_MAX_LINES + 1)
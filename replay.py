@@ -0,0 +1,313 @@
+# replay.py
+# 录制回放工具 (Chat Replay)
+#
+# 用法：
+#   python replay.py recordings/chat.jsonl [--speed 1|10|max] [--show-diffs N]
+#   python replay.py recordings/chat.jsonl --url http://127.0.0.1:8000 --speed 10
+#
+# 读取 chat_recorder 录制的 JSONL 文件（自动包含轮转出的 .1 ~ .N 历史文件），
+# 按录制时的请求间隔（除以倍速）重新发送 /api/chat 请求：
+# - 默认在进程内启动服务，LLM 使用本地替身 (LLM_BACKEND=local)，并预先载入录制的 LLM 原始输出和耗时；
+#   服务在临时目录中运行，不会改动当前目录下的文档
+# - --url 指定时向已运行的服务发送请求（该服务的 LLM 配置由它自己决定）
+# - 同一会话的请求按顺序发送，录制中的会话映射为回放时新建的会话
+# 结束后报告状态码分布、延迟分位数、吞吐量，以及响应与录制结果的一致率。
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+
+def _log_files(path):
+    """录制文件及其轮转历史，按时间从旧到新排列"""
+    path = Path(path)
+    rotated = []
+    for candidate in path.parent.glob(f"{path.name}.*"):
+        suffix = candidate.name[len(path.name) + 1:]
+        if suffix.isdigit():
+            rotated.append((int(suffix), candidate))
+    files = [candidate for _, candidate in sorted(rotated, reverse=True)]
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def load_entries(paths):
+    """读取录制记录并按请求开始时间排序，跳过无法解析的行"""
+    entries = []
+    skipped = 0
+    for path in paths:
+        files = _log_files(path)
+        if not files:
+            print(f"[系统警告] 找不到录制文件: {path}")
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if isinstance(entry, dict) and isinstance(entry.get("request"), dict):
+                        entries.append(entry)
+                    else:
+                        skipped += 1
+    if skipped:
+        print(f"[系统警告] 跳过 {skipped} 行无法解析的记录")
+    entries.sort(key=lambda entry: entry.get("ts") or 0)
+    return entries
+
+
+def _group_by_session(entries):
+    """按录制的会话分组；没有会话的请求各自单独成组"""
+    groups = OrderedDict()
+    for i, entry in enumerate(entries):
+        key = entry.get("session") or f"__single_{i}"
+        groups.setdefault(key, []).append(entry)
+    return list(groups.values())
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# ============================================
+# 请求发送
+# ============================================
+
+class InProcessClient:
+    """直接调用 ASGI 应用，不经过网络（也不依赖 httpx 等测试客户端）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def post_json(self, path, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode("ascii"),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"replay"), (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("ascii"))],
+            "client": ("127.0.0.1", 0),
+            "server": ("replay", 80),
+        }
+        request_sent = False
+        response_complete = asyncio.Event()
+        status = None
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_complete.set()
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+
+class RemoteClient:
+    """通过 HTTP 向已运行的服务发送请求（在线程中执行，避免阻塞事件循环）"""
+
+    def __init__(self, base_url, timeout=60.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    async def post_json(self, path, payload):
+        return await asyncio.to_thread(self._post, path, payload)
+
+
+def _prepare_local_backend(entries, speed):
+    """切换到本地 LLM 替身并载入录制的 LLM 输出；返回进程内的 ASGI 应用"""
+    import llm_client
+    from api_server import app
+
+    application = llm_client.get_application()
+    for entry in entries:
+        llm = entry.get("llm") or {}
+        if llm.get("raw_output") is not None:
+            application.load_recording(entry["request"].get("text") or "", llm["raw_output"],
+                                       (llm.get("latency_ms") or 0) / 1000)
+    application.latency_scale = 0.0 if speed is None else 1.0 / speed
+    return app, application
+
+
+# ============================================
+# 回放
+# ============================================
+
+async def _replay_session(client, group, started, base_ts, speed, results):
+    session_id = None
+    for entry in group:
+        if speed is not None:
+            delay = started + ((entry.get("ts") or base_ts) - base_ts) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        payload = {"text": entry["request"].get("text") or "", "session_id": session_id}
+        sent = time.monotonic()
+        try:
+            status, body = await client.post_json("/api/chat", payload)
+        except Exception as e:
+            status, body = None, str(e).encode("utf-8")
+        latency = time.monotonic() - sent
+
+        data = None
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            pass
+        if status == 200 and isinstance(data, dict):
+            session_id = session_id or data.get("new_session_id")
+        results.append((entry, status, latency, data if isinstance(data, dict) else None))
+
+
+async def replay(entries, client, speed):
+    """回放全部记录，返回 ([(记录, 状态码, 耗时秒, 响应字典)], 总耗时秒)"""
+    results = []
+    if not entries:
+        return results, 0.0
+    base_ts = entries[0].get("ts") or 0
+    started = time.monotonic()
+    await asyncio.gather(*(_replay_session(client, group, started, base_ts, speed, results)
+                           for group in _group_by_session(entries)))
+    return results, time.monotonic() - started
+
+
+def _compare(entry, status, data):
+    """与录制结果比较：状态码、response_type 和响应内容哈希都一致才算一致"""
+    if status != entry.get("status"):
+        return False
+    recorded = entry.get("response")
+    if status != 200 or recorded is None:
+        return True
+    if data is None:
+        return False
+    content = data.get("content") or ""
+    return (data.get("response_type") == recorded.get("response_type")
+            and hashlib.sha1(content.encode("utf-8")).hexdigest() == recorded.get("content_sha1"))
+
+
+def report(results, elapsed, show_diffs=5):
+    statuses = Counter(status for _, status, _, _ in results)
+    latencies = sorted(latency * 1000 for _, _, latency, _ in results)
+    recorded_latencies = sorted(entry.get("elapsed_ms") or 0 for entry, _, _, _ in results)
+    mismatches = [(entry, status, data) for entry, status, _, data in results if not _compare(entry, status, data)]
+
+    print(f"[回放] 请求数 {len(results)}，总耗时 {elapsed:.2f} 秒，"
+          f"吞吐量 {len(results) / elapsed if elapsed else 0:.1f} 请求/秒")
+    print("[回放] 状态码分布: " + "，".join(f"{status}: {count}" for status, count in sorted(
+        statuses.items(), key=lambda item: str(item[0]))))
+    for label, values in (("回放", latencies), ("录制", recorded_latencies)):
+        p50, p95, p99 = (_percentile(values, p) for p in (50, 95, 99))
+        print(f"[回放] {label}延迟 p50 {p50 or 0:.1f} ms   p95 {p95 or 0:.1f} ms   p99 {p99 or 0:.1f} ms")
+    if results:
+        matched = len(results) - len(mismatches)
+        print(f"[回放] 与录制结果一致 {matched}/{len(results)} ({matched / len(results):.1%})")
+
+    for entry, status, data in mismatches[:show_diffs]:
+        recorded = entry.get("response") or {}
+        print(f"\n  输入: {entry['request'].get('text')}")
+        print(f"    录制: {entry.get('status')} {recorded.get('response_type')} {(recorded.get('content') or '')[:120]!r}")
+        if data is not None:
+            print(f"    回放: {status} {data.get('response_type')} {(data.get('content') or str(data.get('detail', '')))[:120]!r}")
+        else:
+            print(f"    回放: {status}")
+    return {"requests": len(results), "statuses": dict(statuses), "mismatches": len(mismatches)}
+
+
+def _parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("倍速必须大于 0，或使用 max")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放 SmartClip 聊天录制文件")
+    parser.add_argument("logs", nargs="+", help="录制文件路径（自动包含 .1 ~ .N 轮转文件）")
+    parser.add_argument("--speed", type=_parse_speed, default=1.0,
+                        help="回放倍速：1、10 等，或 max（不等待请求间隔，LLM 替身不模拟耗时）")
+    parser.add_argument("--url", help="回放到已运行的服务（例如 http://127.0.0.1:8000），默认在进程内启动")
+    parser.add_argument("--workdir", help="进程内回放时服务的工作目录，默认使用临时目录")
+    parser.add_argument("--show-diffs", type=int, default=5, help="最多显示多少条与录制不一致的结果")
+    args = parser.parse_args()
+
+    entries = load_entries(args.logs)
+    if not entries:
+        print("[系统错误] 没有可回放的记录")
+        sys.exit(1)
+
+    if args.url:
+        client = RemoteClient(args.url)
+    else:
+        # 必须在导入 api_server 之前设置：使用本地替身、回放本身不再录制
+        os.environ["LLM_BACKEND"] = "local"
+        os.environ["CHAT_RECORD_ENABLED"] = "false"
+        workdir = args.workdir or tempfile.mkdtemp(prefix="smartclip-replay-")
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        sys.path.insert(0, str(ROOT_DIR))
+        print(f"[回放] 进程内回放，工作目录: {workdir}")
+        app, application = _prepare_local_backend(entries, args.speed)
+        client = InProcessClient(app)
+
+    speed_label = "max" if args.speed is None else f"{args.speed:g}x"
+    print(f"[回放] 共 {len(entries)} 条记录，{len(_group_by_session(entries))} 个会话，倍速 {speed_label}")
+    results, elapsed = asyncio.run(replay(entries, client, args.speed))
+    report(results, elapsed, args.show_diffs)
+    if not args.url:
+        print(f"[回放] LLM 替身调用 {application.calls} 次，命中录制输出 {application.recorded_hits} 次")
+
+
+if __name__ == "__main__":
+    main()
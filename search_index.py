@@ -0,0 +1,356 @@
+# search_index.py
+# 全文检索倒排索引 (Full-text Inverted Index)
+#
+# 中文/日文/韩文按相邻两个字切分（字符二元组），不需要分词器；
+# 英文和数字按单词切分并转小写。
+# 索引粒度为"文档 + 行号"，支持按文档整体重建，也支持在文档末尾追加行时增量更新。
+# 索引可以持久化为 JSON 文件，加载时按文件指纹（修改时间 + 大小）判断是否仍然有效。
+# 同一目录的所有 DocumentManager 共享一个实例（get_search_index），索引的是磁盘上已保存的内容，
+# 各会话只在保存修改或重新加载变化了的文件时更新它；指纹未变的文档不会被重复索引。
+
+import heapq
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 需要按字切分的文字范围（CJK 统一表意文字、扩展 A、兼容表意文字、假名、谚文）
+_CJK_RANGES = (
+    ("\u3040", "\u30ff"),
+    ("\u3400", "\u4dbf"),
+    ("\u4e00", "\u9fff"),
+    ("\uac00", "\ud7af"),
+    ("\uf900", "\ufaff"),
+)
+
+_WORD_PATTERN = re.compile(r"[0-9a-zA-Z_]+")
+
+INDEX_FORMAT_VERSION = 1
+
+INDEX_FILE = ".search_index.json"
+
+
+def _is_cjk(char):
+    for low, high in _CJK_RANGES:
+        if low <= char <= high:
+            return True
+    return False
+
+
+def tokenize(text):
+    """
+    把文本切分为索引词
+
+    - 连续的 CJK 字符切成二元组："会议纪要" -> 会议, 议纪, 纪要；只有一个字时保留单字
+    - 连续的字母数字作为一个词，转小写
+    """
+    terms = []
+    run = []
+    for char in text:
+        if _is_cjk(char):
+            run.append(char)
+            continue
+        if run:
+            terms.extend(_cjk_terms(run))
+            run = []
+    if run:
+        terms.extend(_cjk_terms(run))
+    terms.extend(word.lower() for word in _WORD_PATTERN.findall(text))
+    return terms
+
+
+def _cjk_terms(run):
+    if len(run) == 1:
+        return [run[0]]
+    return [run[i] + run[i + 1] for i in range(len(run) - 1)]
+
+
+class SearchIndex:
+    """
+    倒排索引：词 -> {文档标题: 行号集合}
+
+    Args:
+        index_file: 持久化文件路径，None 表示只在内存中维护
+        save_interval: 有修改时两次落盘之间的最短间隔（秒）
+
+    落盘在后台线程中进行，不阻塞文档写入；退出前应调用 flush()。
+    """
+
+    def __init__(self, index_file=None, save_interval=30.0):
+        self.index_file = index_file
+        self.save_interval = save_interval
+        self.postings = {}        # term -> {title: set(line_no)}
+        self.doc_terms = {}       # title -> set(term)，用于快速删除某个文档的全部索引
+        self.fingerprints = {}    # title -> [mtime_ns, size]
+        self.line_counts = {}     # title -> 已索引的行数，用于计算 IDF
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._version = 0         # 每次修改递增，用于判断保存期间是否又有修改
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._saving = False
+        self._save_lock = threading.Lock()  # 同一时间只允许一个保存操作
+
+    # ------------------------------------------------------------
+    # 索引维护
+    # ------------------------------------------------------------
+    def remove_document(self, title):
+        """从索引中移除一个文档"""
+        with self._lock:
+            self._remove_document(title)
+
+    def _remove_document(self, title):
+        for term in self.doc_terms.pop(title, ()):
+            by_doc = self.postings.get(term)
+            if by_doc is not None:
+                by_doc.pop(title, None)
+                if not by_doc:
+                    del self.postings[term]
+        self.fingerprints.pop(title, None)
+        self.line_counts.pop(title, None)
+        self._dirty = True
+        self._version += 1
+
+    # 以下两个查询不加锁（单次字典读取是原子的），保存索引期间也不会被阻塞
+    def is_current(self, title, fingerprint):
+        """文档是否已按该指纹对应的文件内容建立了索引"""
+        return fingerprint is not None and self.fingerprints.get(title) == fingerprint
+
+    def fingerprint(self, title):
+        """已索引的文档内容对应的文件指纹"""
+        return self.fingerprints.get(title)
+
+    def titles(self):
+        with self._lock:
+            return list(self.doc_terms)
+
+    def indexed_lines(self, title):
+        """文档已索引的行数（没有索引时为 None）"""
+        with self._lock:
+            return self.line_counts.get(title)
+
+    def index_document(self, title, lines, fingerprint=None):
+        """重建一个文档的索引"""
+        with self._lock:
+            self._remove_document(title)
+            self.doc_terms[title] = set()
+            self._append_lines(title, 0, lines, fingerprint)
+
+    def append_lines(self, title, start_line, lines, fingerprint=None):
+        """增量索引：文档从 start_line 开始新增了 lines（行号不受影响的追加场景）"""
+        with self._lock:
+            self._append_lines(title, start_line, lines, fingerprint)
+
+    def _append_lines(self, title, start_line, lines, fingerprint):
+        terms_of_doc = self.doc_terms.setdefault(title, set())
+        for offset, line in enumerate(lines):
+            line_no = start_line + offset
+            for term in set(tokenize(line)):
+                self.postings.setdefault(term, {}).setdefault(title, set()).add(line_no)
+                terms_of_doc.add(term)
+        self.line_counts[title] = max(self.line_counts.get(title, 0), start_line + len(lines))
+        if fingerprint is not None:
+            self.fingerprints[title] = fingerprint
+        self._dirty = True
+        self._version += 1
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+    def _document_frequency(self, term):
+        return sum(len(lines) for lines in self.postings.get(term, {}).values())
+
+    def search(self, query, limit=100):
+        """
+        查询，返回 [(title, line_no, score), ...]，按得分从高到低排序
+
+        所有查询词都命中的行优先；没有这样的行时，退化为按命中词的 IDF 之和排序。
+        查询中没有可用的索引词时返回 None，由调用方自行扫描。
+        """
+        with self._lock:
+            return self._search(query, limit)
+
+    def _search(self, query, limit):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return None
+        # 单个 CJK 字没有被单独索引（只有一个字的行除外），交给调用方扫描
+        if len(terms) == 1 and len(terms[0]) == 1 and _is_cjk(terms[0]):
+            return None
+
+        total_lines = max(1, sum(self.line_counts.values()))
+        idf = {term: math.log(1 + total_lines / (1 + self._document_frequency(term))) for term in terms}
+
+        # 先尝试"全部命中"：从最稀有的词开始求交集
+        ordered = sorted(terms, key=lambda term: len(self.postings.get(term, {})))
+        results = []
+        if all(term in self.postings for term in terms):
+            # 全部命中的行得分相同，按（标题, 行号）顺序取够 limit 条即可停止
+            score = sum(idf.values())
+            first = self.postings[ordered[0]]
+            for title in sorted(first):
+                candidates = first[title]
+                for term in ordered[1:]:
+                    other = self.postings[term].get(title)
+                    if not other:
+                        candidates = None
+                        break
+                    candidates = candidates & other
+                    if not candidates:
+                        break
+                if candidates:
+                    need = limit - len(results)
+                    results.extend((title, line_no, score) for line_no in heapq.nsmallest(need, candidates))
+                    if len(results) >= limit:
+                        break
+            if results:
+                return results
+
+        if not results:
+            # 部分命中：按 IDF 累加打分
+            scores = {}
+            for term in terms:
+                for title, line_set in self.postings.get(term, {}).items():
+                    for line_no in line_set:
+                        key = (title, line_no)
+                        scores[key] = scores.get(key, 0.0) + idf[term]
+            results = [(title, line_no, score) for (title, line_no), score in scores.items()]
+
+        # 只需要前 limit 条，用堆避免对大量命中结果整体排序
+        return heapq.nsmallest(limit, results, key=lambda item: (-item[2], item[0], item[1]))
+
+    # ------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------
+    def load(self, current_fingerprints):
+        """
+        从文件加载索引，只保留指纹与当前文件一致的文档
+
+        Args:
+            current_fingerprints: {title: [mtime_ns, size]}，当前磁盘上的文档指纹
+
+        Returns:
+            已从文件恢复的文档标题集合（其余文档需要调用方重新索引）；只有第一次调用会读取文件
+        """
+        with self._lock:
+            if self._loaded:
+                return set()
+            self._loaded = True
+            if not self.index_file or not self.index_file.exists():
+                return set()
+            return self._load(current_fingerprints)
+
+    def _load(self, current_fingerprints):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[系统警告] 加载检索索引失败: {e}")
+            return set()
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return set()
+
+        saved_fingerprints = data.get("fingerprints", {})
+        valid = {title for title, fp in saved_fingerprints.items()
+                 if current_fingerprints.get(title) == fp}
+        for term, by_doc in data.get("postings", {}).items():
+            for title, line_list in by_doc.items():
+                if title in valid:
+                    self.postings.setdefault(term, {})[title] = set(line_list)
+                    self.doc_terms.setdefault(title, set()).add(term)
+        line_counts = data.get("line_counts", {})
+        for title in valid:
+            self.doc_terms.setdefault(title, set())
+            self.fingerprints[title] = saved_fingerprints[title]
+            self.line_counts[title] = line_counts.get(title, 0)
+        self._dirty = self._dirty or valid != set(saved_fingerprints)
+        return valid
+
+    def save(self):
+        """把索引写入文件（在调用线程中同步执行）"""
+        if not self.index_file:
+            return
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        # 持锁只做快照，写文件时不阻塞索引更新
+        with self._lock:
+            version = self._version
+            data = {
+                "version": INDEX_FORMAT_VERSION,
+                "fingerprints": dict(self.fingerprints),
+                "line_counts": dict(self.line_counts),
+                "postings": {term: {title: sorted(lines) for title, lines in by_doc.items()}
+                             for term, by_doc in self.postings.items()},
+            }
+        # 临时文件名唯一：其他进程同时保存同一目录的索引时不会互相覆盖
+        fd, tmp_name = tempfile.mkstemp(prefix=self.index_file.name + ".", suffix=".tmp",
+                                        dir=str(self.index_file.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            # mkstemp 创建的文件只有属主可读写，改回普通文件的权限
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, self.index_file)
+            with self._lock:
+                # 保存期间没有新的修改才算保存完成
+                if self._version == version:
+                    self._dirty = False
+                self._last_save = time.monotonic()
+        except Exception as e:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            print(f"[系统警告] 保存检索索引失败: {e}")
+
+    def _background_save(self):
+        try:
+            self.save()
+        finally:
+            self._saving = False
+
+    def maybe_save(self, force=False):
+        """有未保存的修改且距离上次保存超过 save_interval（或 force=True）时，在后台线程落盘"""
+        if not self._dirty or self._saving:
+            return
+        if not force and time.monotonic() - self._last_save < self.save_interval:
+            return
+        self._saving = True
+        threading.Thread(target=self._background_save, name="search-index-save", daemon=True).start()
+
+    def flush(self):
+        """立即保存所有未保存的修改"""
+        if self._dirty:
+            self.save()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(directory):
+    """返回目录对应的共享检索索引（持久化在该目录下的 .search_index.json）"""
+    key = os.path.realpath(str(directory))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SearchIndex(Path(directory) / INDEX_FILE)
+        return index
+
+
+def search_indexes():
+    """已经创建的全部共享检索索引"""
+    with _indexes_lock:
+        return list(_indexes.values())
+
+
+def flush_search_indexes():
+    """保存所有检索索引（服务退出时调用）"""
+    for index in search_indexes():
+        index.flush()
@@ -2,20 +2,41 @@
 # 灵辑 (Smart Clip) - AI 内容收藏助手 LLM增强版 (基于通义千问)
 # 核心对话引擎 (Core Conversation Engine)
 
+from functools import cached_property
 from document_manager import DocumentManager
 from intent_recognizer import LLMIntentRecognizer
 from config import get_llm_client
 
 class SmartClipLLM:
+    """
+    一个会话的对话引擎
+
+    各组件在第一次使用时才创建：只发送"确认"/"取消"的会话不会扫描文档目录，
+    也不会创建意图识别器，新建会话只需要几微秒。
+    """
     def __init__(self):
-        self.doc_manager = DocumentManager()
-        self.client_config = get_llm_client()
-        self.intent_recognizer = LLMIntentRecognizer(self.doc_manager, self.client_config)
-        # 重置对话历史，确保每次启动时都是干净的状态
-        # 这可以避免之前对话历史中的错误格式（如双大括号）影响后续的回复
-        self.intent_recognizer.reset_conversation()
         self.is_running = True
         # 待确认的操作（用于二次确认机制）
         self.pending_action = None
+        # 本轮对话的 LLM 调用信息（原始输出、耗时、识别出的意图），没有调用 LLM 时为 None
+        self.last_llm_call = None
+
+    @cached_property
+    def doc_manager(self):
+        return DocumentManager()
 
+    @cached_property
+    def client_config(self):
+        # 客户端配置是只读的，所有会话共享同一份（见 config.get_llm_client）
+        return get_llm_client()
 
+    @cached_property
+    def intent_recognizer(self):
+        # 新建的识别器对话历史为空，等价于原先构造后立即 reset_conversation()，
+        # 可以避免之前对话历史中的错误格式（如双大括号）影响后续的回复
+        recognizer = LLMIntentRecognizer(self.doc_manager, self.client_config)
+        # 从状态快照恢复的会话：第一次用到识别器时再装回对话历史
+        conversation = self.__dict__.pop("restored_conversation", None)
+        if conversation is not None:
+            recognizer.restore_conversation(conversation)
+        return recognizer
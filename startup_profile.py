@@ -0,0 +1,117 @@
+# startup_profile.py
+# 冷启动耗时分析 (Startup Profiling)
+#
+# 用法：python api_server.py --profile-startup [--top N]
+#
+# 在一个全新的子进程中用 `python -X importtime` 导入 api_server，统计：
+# - 导入 api_server 的总耗时，以及按顶层包汇总的导入耗时排行
+# - 启动钩子耗时（不含后台预热）
+# - 预热 dashscope SDK 的耗时（即未预热时第一个 LLM 请求额外承担的时间）
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# 在子进程中执行：导入应用、运行启动钩子、再单独测量 SDK 预热
+_PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import api_server
+imported = time.perf_counter()
+
+async def run_startup():
+    async with api_server.app.router.lifespan_context(api_server.app):
+        return time.perf_counter()
+
+started = asyncio.run(run_startup())
+prewarm = api_server.llm_client.prewarm()
+print(json.dumps({"import": imported - start, "startup": started - imported, "prewarm": prewarm}))
+"""
+
+
+def _parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块名, 自身耗时微秒, 累计耗时微秒, 嵌套层级)]，子模块排在父模块之前"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+def _direct_imports(rows, module):
+    """返回 module 直接导入（且是首次导入）的子模块"""
+    children = []
+    for row in rows:
+        if row[3] == 0:
+            if row[0] == module:
+                return children
+            children = []
+        elif row[3] == 1:
+            children.append(row)
+    return []
+
+
+def profile_startup(top=None):
+    """运行分析并打印报告，返回进程退出码"""
+    if top is None:
+        top = 15
+        if "--top" in sys.argv:
+            top = int(sys.argv[sys.argv.index("--top") + 1])
+
+    env = dict(os.environ)
+    env["LLM_PREWARM"] = "false"  # 启动钩子不预热，预热耗时单独测量
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=str(Path(__file__).resolve().parent),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print("[系统错误] 启动分析失败：")
+        print(result.stderr[-2000:])
+        return result.returncode
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = _parse_importtime(result.stderr)
+    # 只统计导入 api_server 阶段，之后的是 SDK 预热触发的导入
+    for end, row in enumerate(rows):
+        if row[3] == 0 and row[0] == "api_server":
+            rows = rows[:end + 1]
+            break
+
+    # 按顶层包汇总自身耗时
+    by_package = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    print("=" * 60)
+    print("冷启动耗时分析")
+    print("=" * 60)
+    print(f"导入 api_server：      {timings['import'] * 1000:8.1f} ms")
+    print(f"启动钩子：            {timings['startup'] * 1000:8.1f} ms")
+    print(f"首次请求前可达时间：  {(timings['import'] + timings['startup']) * 1000:8.1f} ms")
+    print(f"dashscope SDK 预热：  {timings['prewarm'] * 1000:8.1f} ms（已推迟到启动后或首次 LLM 调用）")
+    print("-" * 60)
+    print(f"导入 api_server 时按顶层包汇总的耗时（前 {top} 名）：")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<32} {self_us / 1000:8.1f} ms")
+    print("-" * 60)
+    print(f"api_server 直接导入的模块（累计耗时，前 {top} 名）：")
+    direct = _direct_imports(rows, "api_server")
+    for name, _, cumulative_us, _ in sorted(direct, key=lambda row: -row[2])[:top]:
+        print(f"  {name:<32} {cumulative_us / 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(profile_startup())
@@ -0,0 +1,190 @@
+# state_snapshot.py
+# 服务状态快照 (State Snapshot)
+#
+# 重启会丢失所有会话的对话历史 (messages) 和待确认操作 (pending_action)，
+# 每个新会话还要重新读取、切分全部文档。StateSnapshotter 周期性地把这些状态写入一个二进制快照文件：
+# - sessions:  每个会话的待确认操作、对话历史和对话摘要状态
+# - documents: 文档的紧凑存储（UTF-8 缓冲区 + 行偏移数组）及其对应的文件指纹
+# 启动时一次顺序读入快照，恢复会话；文档作为"预热副本"交给 DocumentManager，
+# 文件指纹与磁盘一致的文档直接从副本复制，不再读取和切分文件（不一致的照常从文件加载）。
+#
+# 写快照分两步：先在内存中取出各状态的不可变副本（列表浅拷贝、缓冲区 bytes 拷贝，都是很快的内存复制），
+# 再在后台线程中序列化并"写临时文件 + 原子替换"，序列化和写盘期间不阻塞请求处理。
+# 取副本时要持有会话锁（由调用方负责，见 api_server 的 SessionManager.snapshot_state）和文档的提交锁，
+# 否则可能取到正在修改的缓冲区和偏移数组各一半，而文件指纹仍然一致，恢复时会被当作有效副本。
+# 快照格式为 魔数 + pickle；快照文件与文档目录一样只应由本服务写入。
+
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+from compact_lines import CompactLines
+from mapped_document import MappedLines
+
+SNAPSHOT_MAGIC = b"SMARTCLIP-SNAPSHOT\n"
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+# ============================================
+# 采集
+# ============================================
+
+def capture_session(instance):
+    """
+    取出一个 SmartClipLLM 会话需要保留的状态（只看已经创建的组件，不会因为快照而创建它们）
+
+    调用方需持有该会话的锁：对话历史和待确认操作只在处理该会话的请求时修改
+    """
+    state = {"pending_action": dict(instance.pending_action) if instance.pending_action else None}
+    components = instance.__dict__
+    recognizer = components.get("intent_recognizer")
+    if recognizer is not None:
+        state["conversation"] = recognizer.conversation_state()
+    elif components.get("restored_conversation") is not None:
+        # 恢复后还没有用到的对话历史原样保留
+        state["conversation"] = components["restored_conversation"]
+    return state
+
+
+def capture_documents(doc_manager, into):
+    """
+    把 DocumentManager 中与磁盘文件一致的文档副本并入 into
+
+    into 的结构为 {目录: {文件名: (文件指纹, (缓冲区, 偏移类型码, 偏移数组字节))}}；
+    已经取过的文件不再重复取，内存映射的大文档不需要预热，不包含在内。
+    会话的 DocumentManager 需由调用方持有会话锁（文档内容只在处理该会话的请求时原地修改）；
+    每个文档在它的提交锁内复制，重新加载和其他实例的保存不会在复制期间替换文档或文件。
+    """
+    files = into.setdefault(os.path.realpath(str(doc_manager.storage_dir)), {})
+    for title in list(doc_manager.documents):
+        file_path = doc_manager._get_document_file(title)
+        if file_path.name in files:
+            continue
+        with doc_manager._versions.lock(title):
+            doc = doc_manager.documents.get(title)
+            if doc is None or isinstance(doc, MappedLines):
+                continue
+            # 只取与磁盘文件一致的副本：有未保存的修改或文件已被其他实例改写时跳过
+            fingerprint = doc_manager._file_states.get(title)
+            if fingerprint is None or fingerprint != doc_manager._stat_fingerprint(file_path):
+                continue
+            doc = doc if isinstance(doc, CompactLines) else CompactLines(doc)
+            files[file_path.name] = (list(fingerprint), doc.__reduce__()[1])
+    return into
+
+
+# ============================================
+# 读写
+# ============================================
+
+def write_snapshot(path, state):
+    """序列化并原子替换快照文件，返回写入的字节数"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = pickle.dumps({"version": SNAPSHOT_FORMAT_VERSION, "created": time.time(), **state},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return len(SNAPSHOT_MAGIC) + len(data)
+
+
+def read_snapshot(path):
+    """一次读入快照文件；文件不存在、格式或版本不符时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"[系统警告] 读取状态快照失败: {e}")
+        return None
+    if not data.startswith(SNAPSHOT_MAGIC):
+        print(f"[系统警告] 状态快照格式不正确，已忽略: {path}")
+        return None
+    try:
+        state = pickle.loads(memoryview(data)[len(SNAPSHOT_MAGIC):])
+    except Exception as e:
+        print(f"[系统警告] 解析状态快照失败，已忽略: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != SNAPSHOT_FORMAT_VERSION:
+        print("[系统警告] 状态快照版本不匹配，已忽略")
+        return None
+    return state
+
+
+class StateSnapshotter:
+    """
+    周期性写状态快照
+
+    Args:
+        path: 快照文件路径
+        capture_fn: 无参函数，返回要写入快照的状态（dict，应只包含副本）
+        interval_seconds: 写快照的间隔（0 表示只在退出时写）
+    """
+
+    def __init__(self, path, capture_fn, interval_seconds=60.0):
+        self.path = Path(path)
+        self.capture_fn = capture_fn
+        self.interval_seconds = float(interval_seconds)
+        self.saves = 0
+        self.last_bytes = None
+        self.last_elapsed_ms = None
+        self.last_saved_at = None
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self):
+        """采集并写入一次快照（同一时间只有一个写入在进行）"""
+        with self._save_lock:
+            started = time.perf_counter()
+            state = self.capture_fn()
+            self.last_bytes = write_snapshot(self.path, state)
+            self.last_elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.last_saved_at = round(time.time(), 3)
+            self.saves += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"[系统警告] 写状态快照失败: {e}")
+
+    def start(self):
+        if self._thread is None and self.interval_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="state-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self, final_save=True):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=30)
+            self._thread = None
+        if final_save:
+            try:
+                self.save()
+            except Exception as e:
+                print(f"[系统警告] 写状态快照失败: {e}")
+
+    def stats(self):
+        return {
+            "path": str(self.path),
+            "saves": self.saves,
+            "last_bytes": self.last_bytes,
+            "last_elapsed_ms": self.last_elapsed_ms,
+            "last_saved_at": self.last_saved_at,
+        }
@@ -0,0 +1,29 @@
+# test_admission.py
+# 准入控制回归测试 (Admission Control Regression Tests)
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient
+
+import api_server
+from admission import AdmissionController
+
+
+def test_degraded_chats_release_admission_slots(tmp_path, monkeypatch):
+    """未配置 LLM 时走本地降级解析，不调用上游，每轮对话结束后都要归还准入槽位"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("smart_clip_llm.get_llm_client", lambda: None)
+    controller = AdmissionController(max_concurrency=2, max_queue=2, queue_timeout=0.5)
+    monkeypatch.setattr(api_server, "admission_controller", controller)
+
+    with TestClient(api_server.app) as client:
+        for _ in range(controller.max_concurrency * 3):
+            response = client.post("/api/chat", json={"text": "帮助"})
+            assert response.status_code == 200
+
+    stats = controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["admitted"] == controller.max_concurrency * 3